@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Compare how connections are distributed across workers.
+
+Forks a number of workers that each run an event loop serving
+:class:`blackhole.smtp.Smtp`, either all accepting from one shared listening
+socket or each accepting from it's own ``SO_REUSEPORT`` socket, then opens
+many short connections and reports how many each worker accepted and how much
+CPU each worker used.
+
+    python -m benchmarks.accept_distribution --workers 4 --connections 5000
+"""
+
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import signal
+import socket
+import statistics
+import sys
+
+from blackhole.config import Config
+from blackhole.control import server, servers
+from blackhole.smtp import Smtp
+from blackhole.stats import Stats
+
+
+__all__ = ("main", "run_mode")
+"""Tuple all the things."""
+
+
+def _worker(socks, write_fd):
+    """
+    Serve connections until SIGTERM then report back over a pipe.
+
+    Runs in a forked process and never returns.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    stats = Stats()
+    clients = []
+    for sock in socks:
+        factory = functools.partial(
+            Smtp,
+            clients,
+            loop=loop,
+            stats=stats,
+            tls_context=sock.get("starttls"),
+        )
+        loop.run_until_complete(
+            loop.create_server(factory, sock=sock["sock"], ssl=sock["ssl"])
+        )
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    os.write(write_fd, b"r")
+    loop.run_forever()
+    times = os.times()
+    result = {
+        "accepted": stats.counters.get("connections", 0),
+        "cpu": times.user + times.system,
+    }
+    os.write(write_fd, json.dumps(result).encode("utf-8"))
+    os.close(write_fd)
+    os._exit(os.EX_OK)
+
+
+async def _client(port, semaphore):
+    async with semaphore:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await reader.readline()
+        writer.write(b"QUIT\r\n")
+        await writer.drain()
+        await reader.readline()
+        writer.close()
+
+
+async def _clients(port, connections, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    await asyncio.gather(
+        *[_client(port, semaphore) for _ in range(connections)]
+    )
+
+
+def run_mode(mode, workers, connections, concurrency):
+    """
+    Run the benchmark for one mode.
+
+    :param str mode: ``shared`` or ``reuse_port``.
+    :param int workers: Number of worker processes.
+    :param int connections: Number of connections to open.
+    :param int concurrency: Maximum connections open at once.
+    :returns: Connections accepted and CPU seconds used by each worker.
+    :rtype: :py:obj:`dict`
+    """
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    if mode == "shared":
+        shared = server("127.0.0.1", port, socket.AF_INET)
+        worker_socks = [[shared]] * workers
+    else:
+        worker_socks = [
+            [sock]
+            for sock in servers("127.0.0.1", port, socket.AF_INET, workers)
+        ]
+    children = []
+    for socks in worker_socks:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            _worker(socks, write_fd)
+        os.close(write_fd)
+        os.read(read_fd, 1)
+        children.append((pid, read_fd))
+    for sock in {
+        id(s["sock"]): s["sock"] for s in sum(worker_socks, [])
+    }.values():
+        sock.close()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_clients(port, connections, concurrency))
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
+        for pid, _ in children:
+            os.kill(pid, signal.SIGTERM)
+
+    results = []
+    for pid, read_fd in children:
+        data = b""
+        while True:
+            chunk = os.read(read_fd, 4096)
+            if not chunk:
+                break
+            data += chunk
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        results.append(json.loads(data.decode("utf-8")))
+    accepted = [result["accepted"] for result in results]
+    return {
+        "accepted": accepted,
+        "accepted_stdev": statistics.pstdev(accepted),
+        "accepted_max_over_mean": max(accepted) / statistics.mean(accepted),
+        "cpu": [result["cpu"] for result in results],
+        "cpu_total": sum(result["cpu"] for result in results),
+    }
+
+
+def main(args=None):
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--connections", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--output", help="write the results to this file")
+    args = parser.parse_args(args)
+    config = Config(None)
+    config.mailname = "bench.blackhole.io"
+    report = {
+        "python": sys.version,
+        "platform": sys.platform,
+        "workers": args.workers,
+        "connections": args.connections,
+        "concurrency": args.concurrency,
+        "results": {},
+    }
+    for mode in ("shared", "reuse_port"):
+        report["results"][mode] = run_mode(
+            mode, args.workers, args.connections, args.concurrency
+        )
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Micro-benchmarks for the SMTP protocol hot path.
+
+Drives :class:`blackhole.smtp.Smtp` over in-memory transports, no sockets are
+used. Results are written as JSON.
+
+    python -m benchmarks.protocol --output before.json
+    python -m benchmarks.protocol --output after.json --compare before.json
+"""
+
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+
+from blackhole.config import Config
+from blackhole.smtp import Smtp
+from blackhole.utils import get_version
+
+from .transport import connect
+
+
+__all__ = ("main", "run_benchmarks")
+"""Tuple all the things."""
+
+
+VERBS = (
+    ("HELO", b"HELO bench.blackhole.io\r\n"),
+    ("EHLO", b"EHLO bench.blackhole.io\r\n"),
+    ("MAIL", b"MAIL FROM:<bench@blackhole.io>\r\n"),
+    ("MAIL SIZE=", b"MAIL FROM:<bench@blackhole.io> SIZE=1024\r\n"),
+    ("RCPT", b"RCPT TO:<bench@blackhole.io>\r\n"),
+    ("RSET", b"RSET\r\n"),
+    ("NOOP", b"NOOP\r\n"),
+    ("VRFY", b"VRFY pass=bench@blackhole.io\r\n"),
+    ("EXPN", b"EXPN all\r\n"),
+    ("ETRN", b"ETRN\r\n"),
+    ("HELP", b"HELP\r\n"),
+    ("AUTH PLAIN", b"AUTH PLAIN pass=bench\r\n"),
+)
+"""The name of each benchmarked command and the line sent."""
+
+DATA_SIZES = (("1KB", 1024), ("100KB", 100 * 1024), ("10MB", 10 * 1024**2))
+"""Message sizes used for the DATA throughput benchmark."""
+
+
+def _message(size):
+    """
+    Build a dot terminated message of roughly ``size`` bytes.
+
+    :param int size: The size in bytes.
+    :returns: The message.
+    :rtype: :py:obj:`bytes`
+    """
+    head = b"From: <bench@blackhole.io>\r\nSubject: bench\r\n\r\n"
+    line = b"x" * 76 + b"\r\n"
+    lines = max(size - len(head), 0) // len(line)
+    return head + line * lines + b".\r\n"
+
+
+def _factory(loop):
+    return lambda: Smtp([], loop=loop)
+
+
+async def _best(repeat, func, *args):
+    """
+    Run a benchmark ``repeat`` times and keep the fastest run.
+
+    :returns: The duration of the fastest run in seconds.
+    :rtype: :py:obj:`float`
+    """
+    return min([await func(*args) for _ in range(repeat)])
+
+
+async def bench_command(loop, line, iterations):
+    """Time ``iterations`` round trips of a single command."""
+    protocol, transport = await connect(loop, _factory(loop))
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await transport.send(line)
+    elapsed = time.perf_counter() - start
+    await transport.quit()
+    return elapsed
+
+
+async def bench_data(loop, message, iterations):
+    """Time ``iterations`` DATA transactions of a message."""
+    protocol, transport = await connect(loop, _factory(loop))
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await transport.send(b"DATA\r\n")
+        await transport.send(message)
+    elapsed = time.perf_counter() - start
+    await transport.quit()
+    return elapsed
+
+
+async def bench_connect(loop, iterations):
+    """Time ``iterations`` of ``Smtp.__init__``, connection and greeting."""
+    transports = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        transports.append((await connect(loop, _factory(loop)))[1])
+    elapsed = time.perf_counter() - start
+    for transport in transports:
+        await transport.quit()
+    return elapsed
+
+
+async def connection_memory(loop, connections):
+    """
+    Measure memory allocated per idle connection.
+
+    :returns: Bytes allocated per connection after the greeting and EHLO.
+    :rtype: :py:obj:`float`
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    transports = []
+    for _ in range(connections):
+        _, transport = await connect(loop, _factory(loop))
+        await transport.send(b"EHLO bench.blackhole.io\r\n")
+        transports.append(transport)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    total = sum(stat.size_diff for stat in stats)
+    for transport in transports:
+        await transport.quit()
+    return total / connections
+
+
+def _result(iterations, elapsed, size=None):
+    result = {
+        "iterations": iterations,
+        "seconds": elapsed,
+        "per_second": iterations / elapsed,
+        "mean_us": elapsed / iterations * 1000000,
+    }
+    if size is not None:
+        result["bytes_per_second"] = size * iterations / elapsed
+    return result
+
+
+async def run_benchmarks(loop, iterations, repeat):
+    """
+    Run every benchmark.
+
+    :param loop: The event loop to use.
+    :param int iterations: Iterations per command benchmark.
+    :param int repeat: Runs of each benchmark, the fastest is kept.
+    :returns: The results keyed by benchmark name.
+    :rtype: :py:obj:`dict`
+    """
+    results = {}
+    for name, line in VERBS:
+        elapsed = await _best(repeat, bench_command, loop, line, iterations)
+        results["command.{0}".format(name)] = _result(iterations, elapsed)
+    for name, size in DATA_SIZES:
+        message = _message(size)
+        count = max(min(iterations, (20 * 1024**2) // size), 2)
+        elapsed = await _best(repeat, bench_data, loop, message, count)
+        results["data.{0}".format(name)] = _result(
+            count, elapsed, len(message)
+        )
+    elapsed = await _best(repeat, bench_connect, loop, iterations)
+    results["connection.setup"] = _result(iterations, elapsed)
+    results["connection.memory"] = {
+        "connections": 1000,
+        "bytes_per_connection": await connection_memory(loop, 1000),
+    }
+    return results
+
+
+def _compare(results, previous):
+    """Log the change in speed against a previous run."""
+    logger = logging.getLogger("blackhole.benchmarks")
+    for name, result in sorted(results.items()):
+        old = previous.get(name)
+        if old is None:
+            continue
+        if "per_second" in result:
+            change = result["per_second"] / old["per_second"] - 1
+            logger.info("%-24s %+7.1f%% ops/s", name, change * 100)
+        else:
+            new_bytes = result["bytes_per_connection"]
+            old_bytes = old["bytes_per_connection"]
+            logger.info(
+                "%-24s %+7.0f bytes/connection", name, new_bytes - old_bytes
+            )
+
+
+def main(args=None):
+    """Run the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results to this file")
+    parser.add_argument("--compare", help="compare against a results file")
+    args = parser.parse_args(args)
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+    config = Config(None)
+    config.mailname = "bench.blackhole.io"
+    config.max_message_size = 20 * 1024**2
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    results = loop.run_until_complete(
+        run_benchmarks(loop, args.iterations, args.repeat)
+    )
+    loop.close()
+    report = {
+        "blackhole": get_version(),
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "loop": type(loop).__module__ + "." + type(loop).__name__,
+        "iterations": args.iterations,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as compare_file:
+            _compare(results, json.load(compare_file)["results"])
+
+
+if __name__ == "__main__":
+    main()
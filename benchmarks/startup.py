@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+"""
+Startup time of the command line entry points.
+
+Runs each entry point in a new interpreter with ``python -X importtime`` and
+reports the time spent importing modules, the modules imported and the wall
+clock time. ``--check`` fails when an entry point is over its budget or
+imports a module it should not need.
+
+    python -m benchmarks.startup --output before.json
+    python -m benchmarks.startup --check --compare before.json
+"""
+
+
+import argparse
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from blackhole.utils import get_version
+
+
+__all__ = ("ENTRY_POINTS", "import_times", "main", "run_entry_point")
+"""Tuple all the things."""
+
+
+ENTRY_POINTS = (
+    ("version", "run", ["--version"], 100, ("asyncio", "ssl")),
+    ("config_test", "run", ["-t", "-c", "{config}"], 100, ("asyncio", "ssl")),
+    ("blackhole_config", "blackhole_config", [], 100, ("asyncio", "ssl")),
+    ("blackhole", "run", ["-c", "{config}", "-q"], 250, ()),
+)
+"""
+Entry points to measure.
+
+Each is a name, the function in :mod:`blackhole.application` the console
+script calls, its arguments, the import time budget in milliseconds and
+modules it must not import. ``{config}`` is replaced with the path to a
+config file listening on a free local port.
+"""
+
+
+SCRIPT = """
+import sys
+from blackhole import application
+sys.argv[1:] = {argv!r}
+if {serve!r}:
+    from blackhole.supervisor import Supervisor
+    Supervisor.run = lambda self: None
+try:
+    application.{function}()
+except SystemExit:
+    pass
+print(",".join(sorted(sys.modules)), file=sys.stderr)
+"""
+"""
+Run an entry point, the server stops once the supervisor has bound it's
+sockets, before any worker starts.
+"""
+
+
+def _config(directory):
+    """Write a config file that listens on a free local port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    path = os.path.join(directory, "blackhole.conf")
+    with open(path, "w") as config_file:
+        config_file.write(
+            "listen=127.0.0.1:{0}\npidfile={1}\n".format(
+                port, os.path.join(directory, "blackhole.pid")
+            )
+        )
+    return path
+
+
+def import_times(lines):
+    """
+    Sum the ``-X importtime`` output of a run.
+
+    Only imports after :py:mod:`site` are counted, imports made by the
+    interpreter before running any code are the same for every entry point.
+
+    :param lines: Lines written to stderr by ``python -X importtime``.
+    :type lines: :py:obj:`list`
+    :returns: The total import time in microseconds and the modules
+              imported.
+    :rtype: :py:obj:`tuple`
+    """
+    total, modules, counting = 0, [], False
+    for line in lines:
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        __, cumulative, name = line.split(":", 1)[1].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if counting:
+            modules.append(name)
+            if depth == 0:
+                total += int(cumulative)
+        elif depth == 0 and name == "site":
+            counting = True
+    return total, modules
+
+
+def run_entry_point(function, argv, config, repeat):
+    """
+    Time an entry point in new interpreters.
+
+    :param str function: The function in :mod:`blackhole.application`.
+    :param list argv: Arguments for the entry point.
+    :param str config: Path to the config file.
+    :param int repeat: Runs of the entry point, the fastest is kept.
+    :returns: The import time and wall clock time in milliseconds, the
+              number of modules imported and every module loaded.
+    :rtype: :py:obj:`dict`
+    """
+    argv = [arg.format(config=config) for arg in argv]
+    serve = function == "run" and not {"-t", "--version"} & set(argv)
+    script = SCRIPT.format(argv=argv, function=function, serve=serve)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    best = None
+    for __ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        wall = time.perf_counter() - start
+        lines = proc.stderr.splitlines()
+        total, modules = import_times(lines)
+        result = {
+            "import_ms": total / 1000,
+            "wall_ms": wall * 1000,
+            "modules": len(modules),
+            "loaded": lines[-1].split(","),
+        }
+        if best is None or result["import_ms"] < best["import_ms"]:
+            best = result
+    return best
+
+
+def _check(results):
+    """Log entry points over budget and return whether all are within it."""
+    logger = logging.getLogger("blackhole.benchmarks")
+    ok = True
+    for name, __, __, budget, forbidden in ENTRY_POINTS:
+        result = results[name]
+        loaded = [mod for mod in forbidden if mod in result["loaded"]]
+        if result["import_ms"] > budget:
+            logger.error(
+                "%s: %.1fms of imports, budget %dms",
+                name,
+                result["import_ms"],
+                budget,
+            )
+            ok = False
+        if loaded:
+            logger.error("%s: imports %s", name, ", ".join(loaded))
+            ok = False
+    return ok
+
+
+def _compare(results, previous):
+    """Log the change in import time against a previous run."""
+    logger = logging.getLogger("blackhole.benchmarks")
+    for name, result in sorted(results.items()):
+        old = previous.get(name)
+        if old is None:
+            continue
+        logger.info(
+            "%-18s %+7.1fms imports %+5d modules",
+            name,
+            result["import_ms"] - old["import_ms"],
+            result["modules"] - old["modules"],
+        )
+
+
+def main(args=None):
+    """Run the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results to this file")
+    parser.add_argument("--compare", help="compare against a results file")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="exit with an error when an entry point is over budget",
+    )
+    args = parser.parse_args(args)
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        config = _config(directory)
+        for name, function, argv, budget, __ in ENTRY_POINTS:
+            result = run_entry_point(function, argv, config, args.repeat)
+            result["budget_ms"] = budget
+            results[name] = result
+    report = {
+        "blackhole": get_version(),
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": {
+            name: {k: v for k, v in result.items() if k != "loaded"}
+            for name, result in results.items()
+        },
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as compare_file:
+            _compare(report["results"], json.load(compare_file)["results"])
+    if args.check and not _check(results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""An in-memory transport for driving protocols without sockets."""
+
+
+import asyncio
+
+
+__all__ = ("MemoryTransport", "connect")
+"""Tuple all the things."""
+
+
+class _Socket:
+    """Enough of a socket for ``flags_from_transport``."""
+
+    def __init__(self, sockname):
+        self.sockname = sockname
+
+    def getsockname(self):
+        return self.sockname
+
+
+class MemoryTransport(asyncio.Transport):
+    """
+    A transport that keeps written data in memory.
+
+    Awaiting :meth:`MemoryTransport.reply` waits until the protocol has
+    written a final reply line, i.e. ``250 OK`` rather than ``250-SIZE``.
+    """
+
+    def __init__(self, loop, protocol, sockname=("127.0.0.1", 25)):
+        super().__init__()
+        self.loop = loop
+        self.protocol = protocol
+        self.written = 0
+        self._closing = False
+        self._socket = _Socket(sockname)
+        self._waiter = None
+
+    def get_extra_info(self, name, default=None):
+        if name == "socket":
+            return self._socket
+        if name == "peername":
+            return ("127.0.0.1", 50000)
+        if name == "sockname":
+            return self._socket.sockname
+        return default
+
+    def write(self, data):
+        self.written += len(data)
+        if self._waiter is None or self._waiter.done():
+            return
+        last = data.rstrip(b"\r\n").rsplit(b"\n", 1)[-1]
+        if last[3:4] != b"-":
+            self._waiter.set_result(last)
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        if not self._closing:
+            self._closing = True
+            self.loop.call_soon(self.protocol.connection_lost, None)
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def expect(self):
+        """Prepare to wait for the next reply."""
+        self._waiter = self.loop.create_future()
+        return self._waiter
+
+    async def send(self, data, chunk_size=65536):
+        """
+        Feed data to the protocol and wait for the reply.
+
+        :param bytes data: The data to feed.
+        :param int chunk_size: Maximum bytes fed per ``data_received`` call.
+        :returns: The final reply line.
+        :rtype: :py:obj:`bytes`
+        """
+        waiter = self.expect()
+        view = memoryview(data)
+        for start in range(0, len(data), chunk_size):
+            end = start + chunk_size
+            self.protocol.data_received(bytes(view[start:end]))
+        return await waiter
+
+    async def quit(self):
+        """Send ``QUIT`` and close the transport."""
+        await self.send(b"QUIT\r\n")
+        self.close()
+        await asyncio.sleep(0)
+
+
+async def connect(loop, factory, sockname=("127.0.0.1", 25)):
+    """
+    Create a protocol, connect it to a memory transport and read the greeting.
+
+    :param loop: The event loop to use.
+    :param callable factory: Creates the protocol.
+    :param tuple sockname: The address the protocol sees as local.
+    :returns: The protocol and it's transport.
+    :rtype: :py:obj:`tuple`
+    """
+    protocol = factory()
+    transport = MemoryTransport(loop, protocol, sockname)
+    waiter = transport.expect()
+    protocol.connection_made(transport)
+    await waiter
+    return protocol, transport
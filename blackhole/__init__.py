@@ -33,21 +33,6 @@ performed of SMTP or SMTPS are actually processed and no email or sent or
 delivered.
 """
 
-from .application import __all__ as __application_all__
-from .child import __all__ as __child_all__
-from .config import __all__ as __config_all__
-from .control import __all__ as __control_all__
-from .daemon import __all__ as __daemon_all__
-from .exceptions import __all__ as __exceptions_all__
-from .logs import __all__ as __logs_all__
-from .protocols import __all__ as __protocols_all__
-from .smtp import __all__ as __smtp_all__
-from .streams import __all__ as __streams_all__
-from .supervisor import __all__ as __supervisor_all__
-from .utils import __all__ as __utils_all__
-from .worker import __all__ as __worker_all__
-
-
 __author__ = "Kura"
 __copyright__ = "None"
 __credits__ = ("Kura",)
@@ -59,26 +44,32 @@ __status__ = "Stable"
 
 
 __all__ = (
-    __application_all__
-    + __child_all__
-    + __config_all__
-    + __control_all__
-    + __daemon_all__
-    + __exceptions_all__
-    + __logs_all__
-    + __protocols_all__
-    + __smtp_all__
-    + __streams_all__
-    + __supervisor_all__
-    + __utils_all__
-    + __worker_all__
+    "application",
+    "bench",
+    "capture",
+    "child",
+    "config",
+    "control",
+    "daemon",
+    "exceptions",
+    "headers",
+    "index",
+    "logs",
+    "monitor",
+    "protocols",
+    "query",
+    "schema",
+    "smtp",
+    "stats",
+    "streams",
+    "supervisor",
+    "tls",
+    "utils",
+    "worker",
 )
-"""Tuple all the things."""
-
-try:
-    import asyncio
-    import uvloop
+"""
+Tuple all the things.
 
-    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
-except ImportError:
-    pass
+Submodules are not imported with the package, each entry point imports only
+the modules it needs.
+"""
@@ -22,27 +22,31 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-"""Provides functionality to run the server."""
+"""
+Provides functionality to run the server.
+
+Only the configuration is imported with this module, each entry point
+imports the rest of what it needs when it is called. ``blackhole -t``,
+``blackhole --version`` and ``blackhole_config`` don't import
+:py:mod:`asyncio` or :py:mod:`ssl`.
+"""
 
 
 import logging
 import os
 import sys
 
-from .config import Config, config_test, parse_cmd_args, warn_options
-from .control import pid_permissions, setgid, setuid
-from .daemon import Daemon
+from .config import SCHEMA, Config, config_test, parse_cmd_args, warn_options
 from .exceptions import (
     BlackholeRuntimeException,
     ConfigException,
     DaemonException,
 )
 from .logs import configure_logs
-from .supervisor import Supervisor
-from .utils import blackhole_config_help
+from .utils import blackhole_config_help, formatting
 
 
-__all__ = ("blackhole_config", "run")
+__all__ = ("blackhole_bench", "blackhole_config", "blackhole_query", "run")
 """Tuple all the things."""
 
 
@@ -50,13 +54,45 @@ def blackhole_config():
     """
     Print the config help to the console with man-style formatting.
 
+    The help ends with a summary of every option, its type and default value
+    from :data:`blackhole.config.SCHEMA`.
+
     :raises SystemExit: Exit code :py:obj:`os.EX_OK`.
     """
     logging.basicConfig(format="%(message)s", level=logging.INFO)
     logging.info(blackhole_config_help)
+    logging.info("%sSUMMARY%s", formatting.bold, formatting.reset)
+    for line in SCHEMA.describe():
+        logging.info("    %s", line)
     raise SystemExit(os.EX_OK)
 
 
+def blackhole_bench():
+    """
+    Run the SMTP load generator and print a report to the console.
+
+    :raises SystemExit: Exit code :py:obj:`os.EX_OK`.
+    """
+    from .bench import parse_bench_args, run_bench
+
+    args = parse_bench_args(sys.argv[1:])
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+    run_bench(args)
+
+
+def blackhole_query():
+    """
+    Serve the local API for captured messages until interrupted.
+
+    :raises SystemExit: Exit code :py:obj:`os.EX_OK`.
+    """
+    from .query import parse_query_args, run_query
+
+    args = parse_query_args(sys.argv[1:])
+    logging.basicConfig(format="%(message)s", level=logging.INFO)
+    run_query(args)
+
+
 def run():
     """
     Create the asyncio loop and start the server.
@@ -71,6 +107,10 @@ def run():
     logger = logging.getLogger("blackhole")
     if args.test:
         config_test(args)
+    from .control import pid_permissions, setgid, setuid
+    from .daemon import Daemon
+    from .supervisor import Supervisor
+
     try:
         config = Config(args.config_file).load().test()
         config.args = args
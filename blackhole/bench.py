@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Provides an SMTP load generator for benchmarking blackhole."""
+
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import ssl
+import time
+
+from .stats import Stats
+from .utils import get_version, use_uvloop
+
+
+__all__ = ("Bench", "format_report", "parse_bench_args", "run_bench")
+"""Tuple all the things."""
+
+use_uvloop()
+
+
+logger = logging.getLogger("blackhole.bench")
+
+
+def parse_bench_args(args):
+    """
+    Parse arguments from the command line for the load generator.
+
+    :param list args: Command line arguments.
+    :returns: Parsed command line arguments.
+    :rtype: :py:class:`argparse.Namespace`
+    """
+    description = (
+        "Open concurrent SMTP sessions against a server and report "
+        "messages/s, bytes/s and latency percentiles for each phase of the "
+        "SMTP conversation."
+    )
+    parser = argparse.ArgumentParser(
+        "blackhole-bench", description=description
+    )
+    parser.add_argument(
+        "-v", "--version", action="version", version=get_version()
+    )
+    parser.add_argument(
+        "-H",
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="the server to connect to. Default: 127.0.0.1",
+    )
+    parser.add_argument(
+        "-p",
+        "--port",
+        type=int,
+        default=25,
+        help="the port to connect to. Default: 25",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=10,
+        help="number of concurrent SMTP sessions. Default: 10",
+    )
+    parser.add_argument(
+        "-n",
+        "--messages",
+        type=int,
+        default=1000,
+        help="total number of messages to send. Default: 1000",
+    )
+    parser.add_argument(
+        "-m",
+        "--messages-per-connection",
+        dest="per_connection",
+        type=int,
+        default=1,
+        help="messages sent before a session quits. Default: 1",
+    )
+    parser.add_argument(
+        "-r",
+        "--recipients",
+        type=int,
+        default=1,
+        help="RCPT TO commands sent per message. Default: 1",
+    )
+    parser.add_argument(
+        "-s",
+        "--size",
+        type=int,
+        default=1024,
+        help="approximate size of each message in bytes. Default: 1024",
+    )
+    parser.add_argument(
+        "--pipelining",
+        action="store_true",
+        help="send MAIL, RCPT and DATA without waiting for each response",
+    )
+    parser.add_argument(
+        "--tls",
+        action="store_true",
+        help="wrap connections in TLS, the certificate is not verified",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=("accept", "bounce", "random"),
+        help="send an X-Blackhole-Mode header with this value",
+    )
+    parser.add_argument(
+        "--delay",
+        type=str,
+        help="send an X-Blackhole-Delay header with this value i.e. 5 or 5,10",
+    )
+    parser.add_argument(
+        "--auth",
+        choices=("pass", "fail"),
+        help="authenticate each session using AUTH PLAIN pass= or fail=",
+    )
+    parser.add_argument(
+        "--vrfy",
+        choices=("pass", "fail"),
+        help="send VRFY pass= or fail= before each message",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60,
+        help="seconds to wait for each response. Default: 60",
+    )
+    parser.add_argument(
+        "--json",
+        dest="as_json",
+        action="store_true",
+        help="write the report as JSON",
+    )
+    return parser.parse_args(args)
+
+
+class Bench:
+    """
+    An SMTP load generator.
+
+    Opens concurrent sessions against a server, each session sends one or
+    more messages before quitting. The time taken by each phase of the SMTP
+    conversation is recorded in a :class:`blackhole.stats.Histogram`.
+    """
+
+    def __init__(self, args, loop=None):
+        """
+        Initialise the load generator.
+
+        :param argparse.Namespace args: Parsed arguments, see
+                                        :func:`parse_bench_args`.
+        :param loop: The event loop to use.
+        :type loop: :py:obj:`None` or
+                    :py:class:`syncio.unix_events._UnixSelectorEventLoop`
+        """
+        self.args = args
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.stats = Stats()
+        self.message = self.build_message()
+        self.remaining = args.messages
+        self.ssl = None
+        if args.tls:
+            self.ssl = ssl.create_default_context()
+            self.ssl.check_hostname = False
+            self.ssl.verify_mode = ssl.CERT_NONE
+
+    def build_message(self):
+        """
+        Build the message sent after DATA.
+
+        :returns: A dot terminated message, padded to the requested size.
+        :rtype: :py:obj:`bytes`
+
+        .. note::
+
+           ``X-Blackhole-Mode`` and ``X-Blackhole-Delay`` headers are added
+           when ``--mode`` and ``--delay`` are used.
+        """
+        headers = [
+            "From: <bench@blackhole.io>",
+            "To: <bench@blackhole.io>",
+            "Subject: blackhole-bench",
+        ]
+        if self.args.mode:
+            headers.append("X-Blackhole-Mode: {0}".format(self.args.mode))
+        if self.args.delay:
+            headers.append("X-Blackhole-Delay: {0}".format(self.args.delay))
+        head = ("\r\n".join(headers) + "\r\n\r\n").encode("utf-8")
+        line = b"x" * 76 + b"\r\n"
+        body_size = max(self.args.size - len(head), 0)
+        lines, remainder = divmod(body_size, len(line))
+        body = line * lines + b"x" * remainder + b"\r\n"
+        return head + body + b".\r\n"
+
+    async def reply(self, reader):
+        """
+        Read a single or multi-line reply.
+
+        :param asyncio.StreamReader reader: The connection reader.
+        :returns: The reply code.
+        :rtype: :py:obj:`int`
+        :raises ConnectionError: When the server closes the connection.
+        :raises ValueError: When a reply line does not start with a code.
+        """
+        while True:
+            line = await asyncio.wait_for(
+                reader.readline(), self.args.timeout, loop=self.loop
+            )
+            if len(line) < 4:
+                raise ConnectionError("Connection closed by server")
+            if not line[:3].isdigit():
+                raise ValueError("Malformed reply {0!r}".format(line))
+            if line[3:4] != b"-":
+                return int(line[:3])
+
+    async def command(self, reader, writer, phase, command):
+        """
+        Send a command and time how long the reply takes.
+
+        :param asyncio.StreamReader reader: The connection reader.
+        :param asyncio.StreamWriter writer: The connection writer.
+        :param str phase: The histogram to record the latency in.
+        :param bytes command: The command to send.
+        :returns: The reply code.
+        :rtype: :py:obj:`int`
+        """
+        start = time.perf_counter()
+        writer.write(command)
+        code = await self.reply(reader)
+        self.stats.record(phase, time.perf_counter() - start)
+        return code
+
+    async def transaction(self, reader, writer):
+        """
+        Send a single message.
+
+        :param asyncio.StreamReader reader: The connection reader.
+        :param asyncio.StreamWriter writer: The connection writer.
+        """
+        if self.args.vrfy:
+            vrfy = "VRFY {0}=bench@blackhole.io\r\n".format(self.args.vrfy)
+            await self.command(reader, writer, "vrfy", vrfy.encode("utf-8"))
+        mail = b"MAIL FROM:<bench@blackhole.io>\r\n"
+        rcpt = b"RCPT TO:<bench@blackhole.io>\r\n"
+        if self.args.pipelining:
+            start = time.perf_counter()
+            writer.write(mail + rcpt * self.args.recipients + b"DATA\r\n")
+            for _ in range(self.args.recipients + 2):
+                code = await self.reply(reader)
+            self.stats.record("envelope", time.perf_counter() - start)
+        else:
+            await self.command(reader, writer, "mail", mail)
+            for _ in range(self.args.recipients):
+                await self.command(reader, writer, "rcpt", rcpt)
+            code = await self.command(reader, writer, "data", b"DATA\r\n")
+        if code != 354:
+            self.stats.incr("errors")
+            return
+        code = await self.command(reader, writer, "message", self.message)
+        self.stats.incr("messages")
+        self.stats.incr("bytes", len(self.message))
+        self.stats.incr("code.{0}".format(code))
+
+    async def session(self):
+        """Open connections and send messages until none remain."""
+        while self.remaining > 0:
+            count = min(self.args.per_connection, self.remaining)
+            self.remaining -= count
+            try:
+                await self.connection(count)
+            except (OSError, ValueError, asyncio.TimeoutError) as err:
+                logger.debug("Session failed: %s", err)
+                self.stats.incr("errors")
+
+    async def connection(self, count):
+        """
+        Send messages using a single connection.
+
+        :param int count: The number of messages to send.
+        """
+        start = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.args.host, self.args.port, ssl=self.ssl, loop=self.loop
+            ),
+            self.args.timeout,
+            loop=self.loop,
+        )
+        try:
+            await self.reply(reader)
+            self.stats.record("connect", time.perf_counter() - start)
+            self.stats.incr("connections")
+            ehlo = b"EHLO bench.blackhole.io\r\n"
+            await self.command(reader, writer, "ehlo", ehlo)
+            if self.args.auth:
+                auth = "AUTH PLAIN {0}=bench\r\n".format(self.args.auth)
+                await self.command(reader, writer, "auth", auth.encode())
+            for _ in range(count):
+                await self.transaction(reader, writer)
+            await self.command(reader, writer, "quit", b"QUIT\r\n")
+        finally:
+            writer.close()
+
+    async def run(self):
+        """
+        Run all sessions until every message has been sent.
+
+        :returns: The report, see :meth:`Bench.report`.
+        :rtype: :py:obj:`dict`
+        """
+        start = time.perf_counter()
+        sessions = [self.session() for _ in range(self.args.concurrency)]
+        await asyncio.gather(*sessions, loop=self.loop)
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed):
+        """
+        Summarise the run.
+
+        :param float elapsed: Duration of the run in seconds.
+        :returns: Throughput, counters and the latency of each phase in
+                  microseconds.
+        :rtype: :py:obj:`dict`
+        """
+        summary = self.stats.summary()
+        counters = summary["counters"]
+        elapsed = max(elapsed, 1e-9)
+        return {
+            "elapsed": elapsed,
+            "messages_per_second": counters.get("messages", 0) / elapsed,
+            "bytes_per_second": counters.get("bytes", 0) / elapsed,
+            "counters": counters,
+            "phases": summary["histograms"],
+        }
+
+
+def format_report(report):
+    """
+    Format a report for the console.
+
+    :param dict report: The report, see :meth:`Bench.report`.
+    :returns: A human readable report.
+    :rtype: :py:obj:`str`
+    """
+    lines = [
+        "elapsed: {0:.2f}s".format(report["elapsed"]),
+        "messages/s: {0:.1f}".format(report["messages_per_second"]),
+        "bytes/s: {0:.1f}".format(report["bytes_per_second"]),
+    ]
+    for name, value in sorted(report["counters"].items()):
+        lines.append("{0}: {1}".format(name, value))
+    lines.append(
+        "{0:<10} {1:>8} {2:>10} {3:>10} {4:>10} {5:>10}".format(
+            "phase", "count", "p50 ms", "p99 ms", "p999 ms", "max ms"
+        )
+    )
+    for name, hist in sorted(report["phases"].items()):
+        lines.append(
+            "{0:<10} {1:>8} {2:>10.3f} {3:>10.3f} {4:>10.3f} "
+            "{5:>10.3f}".format(
+                name,
+                hist["count"],
+                hist["p50"] / 1000,
+                hist["p99"] / 1000,
+                hist["p999"] / 1000,
+                hist["max"] / 1000,
+            )
+        )
+    return "\n".join(lines)
+
+
+def run_bench(args, loop=None):
+    """
+    Run the load generator and log the report.
+
+    :param argparse.Namespace args: Parsed arguments, see
+                                    :func:`parse_bench_args`.
+    :param loop: The event loop to use.
+    :type loop: :py:obj:`None` or
+                :py:class:`syncio.unix_events._UnixSelectorEventLoop`
+    :raises SystemExit: Exit code :py:obj:`os.EX_OK`.
+    """
+    loop = loop if loop is not None else asyncio.get_event_loop()
+    bench = Bench(args, loop=loop)
+    report = loop.run_until_complete(bench.run())
+    if args.as_json:
+        logger.info(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        logger.info(format_report(report))
+    raise SystemExit(os.EX_OK)
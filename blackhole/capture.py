@@ -0,0 +1,851 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Write received messages to segment files or a Maildir on disk."""
+
+
+import abc
+import bz2
+import concurrent.futures
+import glob
+import gzip
+import json
+import logging
+import lzma
+import os
+import random
+import shutil
+import signal
+import sqlite3
+import struct
+import threading
+import time
+
+
+__all__ = (
+    "BatchWriter",
+    "CapturePolicy",
+    "MaildirWriter",
+    "SegmentWriter",
+    "compress_segment",
+    "compression_pool",
+    "encode_record",
+    "maildir_path",
+    "open_segment",
+    "read_record",
+    "read_records",
+)
+"""Tuple all the things."""
+
+
+logger = logging.getLogger("blackhole.capture")
+
+
+SEGMENT_MAGIC = b"BHSEG001"
+"""The first bytes of every segment file."""
+
+RECORD_HEADER = struct.Struct(">II")
+"""The length of a record's metadata and payload, in bytes."""
+
+CODECS = {
+    "zlib": (".gz", gzip.open),
+    "lzma": (".xz", lzma.open),
+    "bz2": (".bz2", bz2.open),
+}
+"""
+Compression codecs for segments, their file extension and how to open them.
+
+``zlib`` segments are written with a gzip header so they can be read with
+standard tools.
+"""
+
+
+def encode_record(metadata, payload):
+    """
+    Encode a message and its metadata as a segment record.
+
+    :param dict metadata: Information about the message, encoded as JSON.
+    :param bytes payload: The message.
+    :returns: A length prefixed record.
+    :rtype: :py:obj:`bytes`
+    """
+    meta = json.dumps(metadata, separators=(",", ":")).encode("utf-8")
+    return RECORD_HEADER.pack(len(meta), len(payload)) + meta + payload
+
+
+def _open_compressed(codec, path, mode, level=None):
+    """
+    Open a compressed file.
+
+    :param str codec: A codec from :data:`CODECS`.
+    :param str path: The path to the file.
+    :param str mode: The mode to open the file with.
+    :param level: The compression level when writing.
+    :type level: :py:obj:`int` or :py:obj:`None`
+    :returns: A binary file object.
+    :rtype: :py:obj:`io.BufferedIOBase`
+    """
+    __, opener = CODECS[codec]
+    if level is None:
+        return opener(path, mode)
+    if codec == "lzma":
+        return opener(path, mode, preset=level)
+    return opener(path, mode, compresslevel=level)
+
+
+def open_segment(path):
+    """
+    Open a segment file for reading, decompressing it if needed.
+
+    Compressed segments are decompressed as they are read, they are never
+    loaded in to memory whole.
+
+    :param str path: The path to a segment file.
+    :returns: A binary file object.
+    :rtype: :py:obj:`io.BufferedIOBase`
+    """
+    for codec, (ext, __) in CODECS.items():
+        if path.endswith(ext):
+            return _open_compressed(codec, path, "rb")
+    return open(path, "rb")
+
+
+def compress_segment(path, codec, level):
+    """
+    Compress a segment and remove the original.
+
+    The compressed segment is written to a ``.part`` file and only renamed
+    once complete, a segment is never half compressed. Runs in a separate
+    process, see :class:`SegmentWriter`.
+
+    :param str path: The path to a segment file.
+    :param str codec: A codec from :data:`CODECS`.
+    :param int level: The compression level.
+    :returns: The path to the compressed segment.
+    :rtype: :py:obj:`str`
+    """
+    dest = path + CODECS[codec][0]
+    with open(path, "rb") as src, _open_compressed(
+        codec, dest + ".part", "wb", level
+    ) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.rename(dest + ".part", dest)
+    os.remove(path)
+    return dest
+
+
+def _reset_compressor(fds, cpus=None):
+    """
+    Prepare a newly forked compression process.
+
+    Signals handled by the child are reset to their defaults, the listening
+    sockets and pipes it inherited are closed and it is unpinned from the
+    child's CPU.
+
+    :param tuple fds: File descriptors to close.
+    :param cpus: The CPUs to run on.
+    :type cpus: :py:obj:`list` or :py:obj:`None` to keep the inherited CPU
+                affinity.
+    :returns: The process id.
+    :rtype: :py:obj:`int`
+    """
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGUSR2):
+        signal.signal(signum, signal.SIG_DFL)
+    for fd in fds:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, set(cpus))
+    return os.getpid()
+
+
+def compression_pool(fds=(), cpus=None):
+    """
+    Start a process to compress segments in.
+
+    The process is forked straight away, so this must be called before the
+    calling process starts any threads. One pool is shared by every
+    :class:`SegmentWriter` in a process.
+
+    :param fds: File descriptors the compression process should close.
+    :type fds: :py:obj:`list` or :py:obj:`tuple`
+    :param cpus: The CPUs the compression process runs on.
+    :type cpus: :py:obj:`list` or :py:obj:`None` to keep the calling
+                process's CPU affinity.
+    :returns: A pool with a single process.
+    :rtype: :py:class:`concurrent.futures.ProcessPoolExecutor`
+
+    .. note::
+
+       With :attr:`blackhole.config.Config.cpu_affinity` enabled the child
+       is pinned to one CPU, compressing on that CPU as well would take time
+       away from the child's event loop.
+    """
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=1)
+    pool.submit(_reset_compressor, tuple(fds), cpus).result()
+    return pool
+
+
+def read_record(path, offset):
+    """
+    Read a single record from a segment file.
+
+    :param str path: The path to a segment file, as written. When it has
+                     since been compressed, the compressed segment is read.
+    :param int offset: The position of the record in the uncompressed
+                       segment.
+    :returns: The record's metadata and payload.
+    :rtype: :py:obj:`tuple`
+    :raises ValueError: When the record is truncated.
+
+    .. note::
+
+       Compressed segments are decompressed from the start up to ``offset``.
+    """
+    if not os.path.exists(path):
+        for ext, __ in CODECS.values():
+            if os.path.exists(path + ext):
+                path = path + ext
+                break
+    with open_segment(path) as segment:
+        segment.seek(offset)
+        return _read_record(segment, path)
+
+
+def maildir_path(directory, name):
+    """
+    Find a message delivered in to a Maildir.
+
+    :param str directory: The root of the Maildir.
+    :param str name: The message's unique file name, as delivered.
+    :returns: The message's path.
+    :rtype: :py:obj:`str`
+    :raises FileNotFoundError: When the message no longer exists.
+
+    .. note::
+
+       Messages are delivered in to ``new/``. Readers move messages they
+       have seen in to ``cur/``, usually adding ``:2,`` and flags to the
+       name.
+    """
+    for sub in ("new", "cur"):
+        path = os.path.join(directory, sub, name)
+        if os.path.exists(path):
+            return path
+    pattern = os.path.join(directory, "cur", glob.escape(name) + ":*")
+    for path in glob.glob(pattern):
+        return path
+    raise FileNotFoundError(name)
+
+
+def _read_record(segment, path):
+    """
+    Read the next record from a segment.
+
+    :param segment: An open segment.
+    :type segment: :py:obj:`io.BufferedIOBase`
+    :param str path: The segment's path, for error messages.
+    :returns: The record's metadata and payload, :py:obj:`None` at the end
+              of the segment.
+    :rtype: :py:obj:`tuple` or :py:obj:`None`
+    :raises ValueError: When the record is truncated.
+    """
+    header = segment.read(RECORD_HEADER.size)
+    if not header:
+        return None
+    if len(header) < RECORD_HEADER.size:
+        raise ValueError("Truncated record in {0}.".format(path))
+    meta_len, payload_len = RECORD_HEADER.unpack(header)
+    meta = segment.read(meta_len)
+    payload = segment.read(payload_len)
+    if len(meta) < meta_len or len(payload) < payload_len:
+        raise ValueError("Truncated record in {0}.".format(path))
+    return json.loads(meta.decode("utf-8")), payload
+
+
+def read_records(path):
+    """
+    Read every record from a segment file.
+
+    Records are read one at a time, compressed segments are decompressed as
+    they are read.
+
+    :param str path: The path to a segment file.
+    :returns: A generator of metadata and payload tuples.
+    :rtype: :py:obj:`generator`
+    :raises ValueError: When the file is not a segment or a record is
+                        truncated.
+    """
+    with open_segment(path) as segment:
+        if segment.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            raise ValueError("{0} is not a capture segment.".format(path))
+        while True:
+            record = _read_record(segment, path)
+            if record is None:
+                return
+            yield record
+
+
+class CapturePolicy:
+    """
+    Decide which transactions are captured and how much of each is kept.
+
+    Policies are ``none``, nothing is captured, ``headers``, only the headers
+    of a message are captured, and ``full``, the whole message is captured.
+    """
+
+    def __init__(self, policy="full", sample_rate=1.0, max_bytes=0):
+        """
+        Initialise the policy.
+
+        :param str policy: ``none``, ``headers`` or ``full``.
+        :param float sample_rate: The fraction of transactions captured,
+                                  between 0 and 1.
+        :param int max_bytes: The most bytes of each message to keep, ``0``
+                              for no limit.
+        """
+        self.policy = policy
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self):
+        """
+        Whether any transactions can be captured.
+
+        :returns: ``False`` for the ``none`` policy or a sample rate of 0.
+        :rtype: :py:obj:`bool`
+        """
+        return self.policy != "none" and self.sample_rate > 0
+
+    def sample(self):
+        """
+        Decide whether to capture a transaction.
+
+        :returns: ``True`` for a sampled transaction.
+        :rtype: :py:obj:`bool`
+        """
+        if not self.enabled:
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def apply(self, payload):
+        """
+        Cut a message down to what the policy keeps.
+
+        :param bytes payload: The message.
+        :returns: The part of the message to capture and whether it was
+                  truncated.
+        :rtype: :py:obj:`tuple`
+        """
+        kept = payload
+        if self.policy == "headers":
+            for separator in (b"\r\n\r\n", b"\n\n"):
+                end = kept.find(separator)
+                if end != -1:
+                    kept = kept[: end + len(separator)]
+                    break
+        if self.max_bytes and len(kept) > self.max_bytes:
+            kept = kept[: self.max_bytes]
+        return kept, len(kept) < len(payload)
+
+
+class BatchWriter(abc.ABC):
+    """
+    Write messages to disk in batches from a background thread.
+
+    :meth:`write` only appends to an in-memory batch so it never blocks the
+    event loop on disk. A thread hands the batch to :meth:`write_batch` once
+    it holds ``flush_size`` bytes or ``flush_interval`` seconds have passed,
+    whichever comes first.
+
+    When the disk falls behind, at most :attr:`queue_size` bytes, or twice
+    ``flush_size`` when that is larger, are queued and further messages are
+    dropped.
+
+    Subclasses implement :meth:`write_batch` and pass where each message
+    was written to :meth:`index_batch`.
+    """
+
+    queue_size = 67108864
+    """The most bytes queued before messages are dropped."""
+
+    def __init__(self, flush_size, flush_interval, index=None):
+        """
+        Initialise the writer.
+
+        :param int flush_size: Bytes to hold in memory before flushing.
+        :param float flush_interval: Maximum seconds between flushes.
+        :param index: Where written messages are indexed.
+        :type index: :py:obj:`None` or
+                     :class:`blackhole.index.CaptureIndex`
+        """
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.index = index
+        self._batch = []
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        """Start the flushing thread."""
+        self._thread = threading.Thread(
+            target=self._run, name="blackhole-capture", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, metadata, payload):
+        """
+        Queue a message to be written.
+
+        :param dict metadata: Information about the message.
+        :param bytes payload: The message.
+        :returns: ``False`` when the message was dropped because the writer
+                  is closed or the queue is full, otherwise ``True``.
+        :rtype: :py:obj:`bool`
+
+        .. note::
+
+           A message is always queued when nothing else is, however large it
+           is.
+        """
+        with self._cond:
+            if self._closed:
+                return False
+            limit = max(self.queue_size, self.flush_size * 2)
+            if self._batch and self._size + len(payload) > limit:
+                return False
+            self._batch.append((metadata, payload))
+            self._size += len(payload)
+            if self._size >= self.flush_size:
+                self._cond.notify()
+            return True
+
+    def _take(self):
+        """
+        Wait for a batch to be ready and take it.
+
+        :returns: The queued messages, empty when the writer is closed.
+        :rtype: :py:obj:`list`
+        """
+        with self._cond:
+            deadline = time.monotonic() + self.flush_interval
+            while not self._closed and self._size < self.flush_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._batch, self._size = self._batch, [], 0
+            return batch
+
+    def _run(self):
+        """Flush batches until closed, runs in a thread."""
+        while True:
+            batch = self._take()
+            if batch:
+                try:
+                    self.write_batch(batch)
+                except OSError as err:
+                    logger.error(
+                        "Unable to write %s captured messages: %s",
+                        len(batch),
+                        err,
+                    )
+                except Exception:
+                    logger.exception(
+                        "Unable to write %s captured messages", len(batch)
+                    )
+            elif self._closed:
+                break
+        self.finish()
+        if self.index is not None:
+            self.index.close()
+
+    @abc.abstractmethod
+    def write_batch(self, batch):  # pragma: no cover
+        """
+        Write a batch of messages to disk.
+
+        :param list batch: Metadata and payload tuples.
+        """
+
+    def index_batch(self, entries):
+        """
+        Add a written batch to the index, if there is one.
+
+        :param list entries: Metadata, location, offset and length tuples,
+                             see :meth:`blackhole.index.CaptureIndex.add`.
+        """
+        if self.index is None:
+            return
+        try:
+            self.index.add(entries)
+        except sqlite3.Error as err:
+            logger.error(
+                "Unable to index %s captured messages: %s", len(entries), err
+            )
+
+    def finish(self):  # noqa: B027
+        """Release any resources once every batch has been written."""
+        pass
+
+    def close(self):
+        """Flush anything queued and stop the flushing thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class SegmentWriter(BatchWriter):
+    """
+    Append messages to segment files, rotating at a fixed size.
+
+    Segment files are named ``<prefix>-<sequence>.seg`` and begin with
+    :data:`SEGMENT_MAGIC`, followed by one record per message, see
+    :func:`encode_record`. A new segment is started once writing a batch
+    would take the current one past ``segment_size``, a single message
+    larger than ``segment_size`` gets a segment of it's own.
+
+    When a codec is given, each segment is compressed once it is closed, by
+    :func:`compress_segment` in a separate process so compression never
+    competes with the child for the GIL. Writers share the process from
+    :func:`compression_pool` when given one, otherwise each starts it's own.
+    """
+
+    def __init__(
+        self,
+        directory,
+        prefix,
+        segment_size,
+        flush_size,
+        flush_interval,
+        codec=None,
+        level=6,
+        index=None,
+        pool=None,
+    ):
+        """
+        Initialise the writer.
+
+        :param str directory: The directory to write segments in.
+        :param str prefix: Prefix for segment names, unique to the process.
+        :param int segment_size: Size in bytes at which segments rotate.
+        :param int flush_size: Bytes to hold in memory before flushing.
+        :param float flush_interval: Maximum seconds between flushes.
+        :param codec: A codec from :data:`CODECS`.
+        :type codec: :py:obj:`str` or :py:obj:`None`
+        :param int level: The compression level, ``1`` to ``9``.
+        :param index: Where written messages are indexed.
+        :type index: :py:obj:`None` or
+                     :class:`blackhole.index.CaptureIndex`
+        :param pool: A pool from :func:`compression_pool` to compress
+                     segments in, it is not shut down by this writer.
+        :type pool: :py:obj:`None` or
+                    :py:class:`concurrent.futures.ProcessPoolExecutor`
+        """
+        super().__init__(flush_size, flush_interval, index=index)
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_size = segment_size
+        self.codec = codec
+        self.level = level
+        self.sequence = 0
+        self.path = None
+        self._segment = None
+        self._segment_bytes = 0
+        self._pool = pool
+        self._owns_pool = False
+        self._compressing = []
+
+    def start(self):
+        """
+        Start the compression process, if needed, and the flushing thread.
+
+        Without a shared pool the compression process is started straight
+        away, before the flushing thread exists, so it is not forked from a
+        process that is running other threads.
+        """
+        if self.codec is not None and self._pool is None:
+            self._pool = compression_pool()
+            self._owns_pool = True
+        super().start()
+
+    def _exists(self, path):
+        """
+        Whether a segment exists, compressed or not.
+
+        :param str path: The path to an uncompressed segment.
+        :rtype: :py:obj:`bool`
+        """
+        exts = [""] + [ext for ext, __ in CODECS.values()]
+        return any(os.path.exists(path + ext) for ext in exts)
+
+    def rotate(self):
+        """Close the current segment and start a new one."""
+        self.close_segment()
+        while self._segment is None:
+            self.sequence += 1
+            name = "{0}-{1:06d}.seg".format(self.prefix, self.sequence)
+            self.path = os.path.join(self.directory, name)
+            if self._exists(self.path):
+                continue
+            try:
+                self._segment = open(self.path, "xb")
+            except FileExistsError:
+                continue
+        self._segment.write(SEGMENT_MAGIC)
+        self._segment_bytes = len(SEGMENT_MAGIC)
+        logger.debug("Writing captured messages to %s", self.path)
+
+    def close_segment(self):
+        """Close the current segment and compress it, if there is one."""
+        if self._segment is None:
+            return
+        self._segment.close()
+        self._segment = None
+        if self.codec is not None and self._pool is not None:
+            future = self._pool.submit(
+                compress_segment, self.path, self.codec, self.level
+            )
+            future.add_done_callback(self._compressed)
+            self._compressing = [f for f in self._compressing if not f.done()]
+            self._compressing.append(future)
+
+    def _compressed(self, future):
+        """
+        Log a segment that could not be compressed.
+
+        :param concurrent.futures.Future future: The compression.
+        """
+        err = future.exception()
+        if err is not None:
+            logger.error("Unable to compress capture segment: %s", err)
+
+    def _append(self, chunks):
+        """
+        Append records to the current segment.
+
+        :param list chunks: Encoded records.
+        """
+        if not chunks:
+            return
+        data = b"".join(chunks)
+        self._segment.write(data)
+        self._segment.flush()
+        self._segment_bytes += len(data)
+
+    def write_batch(self, batch):
+        """
+        Append a batch of messages, rotating segments as needed.
+
+        :param list batch: Metadata and payload tuples.
+        """
+        chunks, size, entries = [], 0, []
+        for metadata, payload in batch:
+            record = encode_record(metadata, payload)
+            used = self._segment_bytes + size
+            if self._segment is None or (
+                used > len(SEGMENT_MAGIC)
+                and used + len(record) > self.segment_size
+            ):
+                self._append(chunks)
+                chunks, size = [], 0
+                self.rotate()
+            name = os.path.basename(self.path)
+            entries.append(
+                (metadata, name, self._segment_bytes + size, len(record))
+            )
+            chunks.append(record)
+            size += len(record)
+        self._append(chunks)
+        self.index_batch(entries)
+
+    def finish(self):
+        """Close the current segment and wait for compression to finish."""
+        self.close_segment()
+        concurrent.futures.wait(self._compressing)
+        self._compressing = []
+        if self._owns_pool:
+            self._pool.shutdown()
+        self._pool = None
+
+
+class MaildirWriter(BatchWriter):
+    """
+    Deliver messages in to a Maildir.
+
+    Each batch is written to ``tmp/`` by a pool of threads. Only once the
+    whole batch is written is each message's data synced with
+    :py:func:`os.fdatasync`, so the filesystem can write the batch back and
+    commit it together rather than one message at a time, before the
+    messages are renamed in to ``new/``. The directories are synced once per
+    batch rather than once per message, ``tmp/`` before the renames and
+    ``new/`` after them.
+
+    Messages are indexed by their unique file name, the location of a message
+    a reader has since moved to ``cur/`` is resolved by
+    :func:`maildir_path`.
+
+    https://cr.yp.to/proto/maildir.html
+    """
+
+    def __init__(
+        self, directory, flush_size, flush_interval, threads=4, index=None
+    ):
+        """
+        Initialise the writer, creating the Maildir if it does not exist.
+
+        :param str directory: The root of the Maildir.
+        :param int flush_size: Bytes to hold in memory before flushing.
+        :param float flush_interval: Maximum seconds between flushes.
+        :param int threads: The number of threads writing messages.
+        :param index: Where written messages are indexed.
+        :type index: :py:obj:`None` or
+                     :class:`blackhole.index.CaptureIndex`
+        """
+        super().__init__(flush_size, flush_interval, index=index)
+        self.directory = directory
+        self.threads = threads
+        self.delivered = 0
+        for sub in ("tmp", "new", "cur"):
+            os.makedirs(os.path.join(directory, sub), exist_ok=True)
+        self._pool = None
+
+    def start(self):
+        """Start the writing threads and the flushing thread."""
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.threads
+        )
+        super().start()
+
+    def filename(self, metadata):
+        """
+        A unique Maildir file name for a message.
+
+        Built from the time the message was received and it's message id,
+        the message id's domain is used as the host name.
+
+        :param dict metadata: Information about the message.
+        :returns: A file name.
+        :rtype: :py:obj:`str`
+        """
+        self.delivered += 1
+        local, __, domain = metadata["message_id"].strip("<>").partition("@")
+        unique = "{0}_{1}".format(local.replace(".", "_"), self.delivered)
+        name = "{0}.{1}.{2}".format(int(metadata["timestamp"]), unique, domain)
+        return name.replace("/", "\\057").replace(":", "\\072")
+
+    @staticmethod
+    def message(metadata, payload):
+        """
+        Add the envelope to a message as ``Return-Path`` and ``Delivered-To``.
+
+        :param dict metadata: Information about the message.
+        :param bytes payload: The message.
+        :returns: The message as it is stored.
+        :rtype: :py:obj:`bytes`
+        """
+        headers = ["Return-Path: <{0}>".format(metadata["mail_from"] or "")]
+        headers += [
+            "Delivered-To: {0}".format(rcpt) for rcpt in metadata["rcpt_to"]
+        ]
+        envelope = "\r\n".join(headers) + "\r\n"
+        return envelope.encode("utf-8") + payload
+
+    def _write_tmp(self, name, data):
+        """
+        Write a message in to ``tmp/``, runs in the thread pool.
+
+        :param str name: The message's file name.
+        :param bytes data: The message.
+        """
+        with open(os.path.join(self.directory, "tmp", name), "xb") as msg:
+            msg.write(data)
+
+    def _sync_tmp(self, name):
+        """
+        Sync a message written in to ``tmp/``, runs in the thread pool.
+
+        The data is synced before the message is renamed in to ``new/`` so
+        a crash never leaves ``new/`` holding an empty or partial message.
+
+        :param str name: The message's file name.
+        """
+        sync = getattr(os, "fdatasync", os.fsync)
+        fd = os.open(os.path.join(self.directory, "tmp", name), os.O_RDONLY)
+        try:
+            sync(fd)
+        finally:
+            os.close(fd)
+
+    def _sync(self, sub):
+        """
+        Sync a Maildir directory.
+
+        :param str sub: ``tmp`` or ``new``.
+        """
+        fd = os.open(os.path.join(self.directory, sub), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def write_batch(self, batch):
+        """
+        Deliver a batch of messages.
+
+        :param list batch: Metadata and payload tuples.
+        """
+        names = [self.filename(metadata) for metadata, __ in batch]
+        messages = [
+            self.message(metadata, payload) for metadata, payload in batch
+        ]
+        list(self._pool.map(self._write_tmp, names, messages))
+        list(self._pool.map(self._sync_tmp, names))
+        self._sync("tmp")
+        for name in names:
+            os.rename(
+                os.path.join(self.directory, "tmp", name),
+                os.path.join(self.directory, "new", name),
+            )
+        self._sync("new")
+        self.index_batch(
+            [
+                (metadata, name, None, len(msg))
+                for (metadata, __), name, msg in zip(batch, names, messages)
+            ]
+        )
+
+    def finish(self):
+        """Stop the writing threads."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -26,18 +26,36 @@
 
 
 import asyncio
+import cProfile
+import functools
 import logging
 import os
 import signal
+import struct
+import time
 
 from . import protocols
+from .capture import (
+    CapturePolicy,
+    MaildirWriter,
+    SegmentWriter,
+    compression_pool,
+)
+from .config import Config
+from .index import CaptureIndex
+from .monitor import LoopMonitor
 from .smtp import Smtp
+from .stats import Stats
 from .streams import StreamProtocol
+from .tls import load_certificates, set_ticket_keys
+from .utils import use_uvloop
 
 
 __all__ = ("Child",)
 """Tuple all the things."""
 
+use_uvloop()
+
 
 logger = logging.getLogger("blackhole.child")
 
@@ -58,18 +76,37 @@ class Child:
     clients = []
     """List of clients connected to this process."""
 
-    def __init__(self, up_read, down_write, socks, idx):
+    profiler = None
+    """The running :py:class:`cProfile.Profile` or :py:obj:`None`."""
+
+    monitor = None
+    """The :class:`blackhole.monitor.LoopMonitor` or :py:obj:`None`."""
+
+    compressor = None
+    """
+    The process pool compressing capture segments or :py:obj:`None`.
+
+    Shared by every :class:`blackhole.capture.SegmentWriter` in the child.
+    """
+
+    def __init__(self, up_read, down_write, socks, idx, cpus=None):
         """
         Initialise a child process.
 
         :param int up_read: A file descriptor for reading.
         :param int down_write: A file descriptor for writing.
         :param list socks: A list of sockets.
+        :param cpus: The CPUs the child's compression process runs on.
+        :type cpus: :py:obj:`list` or :py:obj:`None` to use the child's CPU
+                    affinity.
         """
         self.up_read = up_read
         self.down_write = down_write
         self.socks = socks
         self.idx = idx
+        self.cpus = cpus
+        self.stats = Stats()
+        self.captures = {}
 
     def start(self):
         """Start the child process."""
@@ -78,7 +115,18 @@ class Child:
         self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
         signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGUSR2, self.profile)
         self.heartbeat_task = asyncio.Task(self.heartbeat())
+        config = Config()
+        if config.loop_monitor:
+            self.monitor = LoopMonitor(
+                self.loop,
+                self.stats,
+                config.loop_monitor_threshold / 1000,
+            )
+            self.loop.call_soon(self.monitor.start)
+        if config.capture_dir:
+            self.start_capture(config)
         self.loop.run_forever()
         self.stop()
         os._exit(os.EX_OK)
@@ -86,8 +134,16 @@ class Child:
     async def _start(self):
         """Create an asyncio server for each socket."""
         for sock in self.socks:
+            factory = functools.partial(
+                Smtp,
+                self.clients,
+                stats=self.stats,
+                tls_context=sock.get("starttls"),
+                capture=sock.get("capture"),
+                capture_policy=sock.get("capture_policy"),
+            )
             server = await self.loop.create_server(
-                lambda: Smtp(self.clients), **sock
+                factory, sock=sock["sock"], ssl=sock["ssl"]
             )
             self.servers.append(server)
 
@@ -96,16 +152,23 @@ class Child:
         Stop the child process.
 
         Mark the process as being stopped, closes each client connected via
-        this child, cancels internal communication with the supervisor and
-        finally stops the process and exits.
+        this child, writes any captured messages still held in memory,
+        cancels internal communication with the supervisor and finally stops
+        the process and exits.
         """
         self._started = False
+        if self.monitor is not None:
+            self.monitor.stop()
         for _ in range(len(self.clients)):
             client = self.clients.pop()
             client.close()
         for _ in range(len(self.servers)):
             server = self.servers.pop()
             server.close()
+        for capture in self.captures.values():
+            capture.close()
+        if self.compressor is not None:
+            self.compressor.shutdown()
         self.heartbeat_task.cancel()
         self.server_task.cancel()
         for task in asyncio.Task.all_tasks(self.loop):
@@ -114,6 +177,233 @@ class Child:
         self._started = False
         os._exit(os.EX_OK)
 
+    def capture_options(self, sock, config):
+        """
+        The compression codec and level for a listener's captured messages.
+
+        Listeners can override :attr:`blackhole.config.Config.capture_codec`
+        and :attr:`blackhole.config.Config.capture_level` with flags.
+
+        :param dict sock: A socket and it's TLS contexts.
+        :param config: The configuration.
+        :type config: :class:`blackhole.config.Config`
+        :returns: The codec and level, :py:obj:`None` values when messages
+                  are not compressed.
+        :rtype: :py:obj:`tuple`
+        """
+        if config.capture_format == "maildir":
+            return None, None
+        flags = config.flags_from_sockname(sock["sock"].getsockname())
+        codec = flags.get("capture_codec", config.capture_codec)
+        if codec == "none":
+            return None, None
+        return codec, flags.get("capture_level", config.capture_level)
+
+    def capture_policy(self, sock, config):
+        """
+        Which messages are captured from a listener and how much of each.
+
+        Listeners can override :attr:`blackhole.config.Config.capture_policy`,
+        :attr:`blackhole.config.Config.capture_sample_rate` and
+        :attr:`blackhole.config.Config.capture_max_bytes` with flags.
+
+        :param dict sock: A socket and it's TLS contexts.
+        :param config: The configuration.
+        :type config: :class:`blackhole.config.Config`
+        :returns: The listener's capture policy.
+        :rtype: :class:`blackhole.capture.CapturePolicy`
+        """
+        flags = config.flags_from_sockname(sock["sock"].getsockname())
+        return CapturePolicy(
+            flags.get("capture_policy", config.capture_policy),
+            flags.get("capture_sample_rate", config.capture_sample_rate),
+            flags.get("capture_max_bytes", config.capture_max_bytes),
+        )
+
+    def start_capture(self, config):
+        """
+        Start a writer for each combination of compression options in use.
+
+        Each socket is given the writer and capture policy for it's listener,
+        listeners that capture nothing are not given a writer.
+
+        When any writer compresses segments, a single compression process is
+        forked for all of them before any writer starts it's thread. It runs
+        on :attr:`cpus` rather than the CPU the child is pinned to.
+
+        :param config: The configuration.
+        :type config: :class:`blackhole.config.Config`
+        """
+        captured = []
+        for sock in self.socks:
+            policy = self.capture_policy(sock, config)
+            if policy.enabled:
+                captured.append((sock, policy))
+        combinations = [
+            self.capture_options(sock, config) for sock, __ in captured
+        ]
+        if any(codec is not None for codec, __ in combinations):
+            fds = [sock["sock"].fileno() for sock in self.socks]
+            self.compressor = compression_pool(
+                fds + [self.up_read, self.down_write], cpus=self.cpus
+            )
+        for (sock, policy), options in zip(captured, combinations):
+            sock["capture_policy"] = policy
+            if options not in self.captures:
+                capture = self.capture_writer(config, *options)
+                capture.start()
+                self.captures[options] = capture
+            sock["capture"] = self.captures[options]
+
+    def capture_writer(self, config, codec=None, level=None):
+        """
+        Create the writer for the configured capture format.
+
+        :param config: The configuration.
+        :type config: :class:`blackhole.config.Config`
+        :param codec: The codec segments are compressed with.
+        :type codec: :py:obj:`str` or :py:obj:`None`
+        :param level: The compression level.
+        :type level: :py:obj:`int` or :py:obj:`None`
+        :returns: A writer for captured messages.
+        :rtype: :class:`blackhole.capture.BatchWriter`
+        """
+        flush_interval = config.capture_flush_interval / 1000
+        index = None
+        if config.capture_index:
+            index = CaptureIndex.for_directory(config.capture_dir)
+        if config.capture_format == "maildir":
+            return MaildirWriter(
+                config.capture_dir,
+                config.capture_flush_size,
+                flush_interval,
+                index=index,
+            )
+        prefix = "worker-{0}".format(self.idx)
+        if codec is not None:
+            prefix = "{0}-{1}-{2}".format(prefix, codec, level)
+        return SegmentWriter(
+            config.capture_dir,
+            prefix,
+            config.capture_segment_size,
+            config.capture_flush_size,
+            flush_interval,
+            codec=codec,
+            level=level,
+            index=index,
+            pool=self.compressor,
+        )
+
+    def tls_contexts(self):
+        """
+        Every TLS and STARTTLS context used by a listener.
+
+        :returns: TLS contexts.
+        :rtype: :py:obj:`list`
+        """
+        contexts = {}
+        for sock in self.socks:
+            for ctx in (sock["ssl"], sock.get("starttls")):
+                if ctx:
+                    contexts[id(ctx)] = ctx
+        return list(contexts.values())
+
+    def set_ticket_keys(self, keys):
+        """
+        Use new TLS session ticket keys for every TLS listener.
+
+        :param bytes keys: Key material sent by the supervisor.
+        """
+        for context in self.tls_contexts():
+            set_ticket_keys(context, keys)
+        logger.debug("child.%s: TLS session ticket keys rotated", self.idx)
+
+    def reload_tls(self):
+        """
+        Reload the TLS certificate and key of every TLS listener.
+
+        Only connections accepted afterwards use the new certificate.
+        """
+        config = Config()
+        for context in self.tls_contexts():
+            try:
+                load_certificates(
+                    context,
+                    config.tls_cert,
+                    config.tls_key,
+                    config.tls_dhparams,
+                )
+            except OSError as err:
+                logger.error(
+                    "child.%s: Unable to reload TLS certificate: %s",
+                    self.idx,
+                    err,
+                )
+                return
+        logger.debug("child.%s: TLS certificate reloaded", self.idx)
+
+    def profile(self, *args, **kwargs):
+        """
+        Profile the child without interrupting the event loop.
+
+        Generally should be called by a signal, nothing else. The profile is
+        started from inside the event loop and runs for
+        :attr:`blackhole.config.Config.profile_duration` seconds.
+        """
+        self.loop.call_soon_threadsafe(self.start_profile)
+
+    def start_profile(self):
+        """Start profiling, unless a profile is already running."""
+        if self.profiler is not None:
+            logger.info("child.%s.profile: Already profiling", self.idx)
+            return
+        config = Config()
+        logger.info(
+            "child.%s.profile: Profiling for %s seconds",
+            self.idx,
+            config.profile_duration,
+        )
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        self.loop.call_later(config.profile_duration, self.stop_profile)
+
+    def stop_profile(self):
+        """
+        Stop profiling and write the statistics to disk.
+
+        The statistics are written from the default executor so the event
+        loop is not blocked by disk IO.
+
+        :returns: A future that resolves once the profile is written.
+        :rtype: :py:class:`asyncio.Future`
+        """
+        profiler, self.profiler = self.profiler, None
+        profiler.disable()
+        name = "blackhole-child-{0}-{1}-{2}.prof".format(
+            self.idx, os.getpid(), int(time.time())
+        )
+        path = os.path.join(Config().profile_dir, name)
+        return self.loop.run_in_executor(
+            None, self._dump_profile, profiler, path
+        )
+
+    def _dump_profile(self, profiler, path):
+        """
+        Write profile statistics to a file.
+
+        :param profiler: The profiler to dump.
+        :type profiler: :py:class:`cProfile.Profile`
+        :param str path: The path to write to.
+        """
+        try:
+            profiler.dump_stats(path)
+        except OSError as err:
+            logger.error(
+                "child.%s.profile: Unable to write %s: %s", self.idx, path, err
+            )
+            return
+        logger.info("child.%s.profile: Written to %s", self.idx, path)
+
     async def heartbeat(self):
         """
         Handle heartbeat between a worker and child.
@@ -128,6 +418,14 @@ class Child:
 
            - b'x01' -- :const:`blackhole.protocols.PING`
            - b'x02' -- :const:`blackhole.protocols.PONG`
+           - b'x03' -- :const:`blackhole.protocols.STATS`
+           - b'x04' -- :const:`blackhole.protocols.TICKET_KEYS`
+           - b'x05' -- :const:`blackhole.protocols.TLS_RELOAD`
+
+           Each PONG is followed by a STATS message containing the statistics
+           recorded by this child. TICKET_KEYS messages carry new TLS session
+           ticket keys from the supervisor and TLS_RELOAD asks the child to
+           reload it's TLS certificate.
 
            These message values are defined in the :mod:`blackhole.protocols`
            schema. Documentation is available at --
@@ -156,6 +454,18 @@ class Child:
                     self.idx,
                 )
                 writer.write(protocols.PONG)
+                payload = self.stats.dumps()
+                writer.write(protocols.STATS)
+                writer.write(struct.pack(">I", len(payload)))
+                writer.write(payload)
+            elif msg == protocols.TICKET_KEYS:
+                header = await reader.readexactly(4)
+                (length,) = struct.unpack(">I", header)
+                self.set_ticket_keys(await reader.readexactly(length))
+                continue
+            elif msg == protocols.TLS_RELOAD:
+                self.reload_tls()
+                continue
             await asyncio.sleep(5)
         r_trans.close()
         w_trans.close()
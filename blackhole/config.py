@@ -28,22 +28,76 @@
 import argparse
 import getpass
 import grp
-import inspect
+import ipaddress
 import logging
-import multiprocessing
 import os
 import pathlib
 import pwd
 import socket
+import stat
 
 from .exceptions import ConfigException
-from .utils import Singleton, get_version, mailname
+from .schema import Option, Schema
+from .utils import (
+    Singleton,
+    available_cpus,
+    get_version,
+    mailname,
+    usable_cpus,
+)
 
 
 __all__ = ("parse_cmd_args", "warn_options", "config_test", "Config")
 """Tuple all the things."""
 
 
+SOCKET_FLAGS = {
+    "backlog": (1, 65535),
+    "defer_accept": (0, 3600),
+    "fastopen": (1, 65535),
+    "nodelay": None,
+    "rcvbuf": (1, 2147483647),
+    "sndbuf": (1, 2147483647),
+    "user_timeout": (0, 2147483647),
+}
+"""Socket flags allowed on a listener and the range of allowed values."""
+
+TCP_FLAGS = ("defer_accept", "fastopen", "nodelay", "user_timeout")
+"""Socket flags that only apply to TCP listeners."""
+
+UNIX_FLAGS = ("owner", "group", "perm")
+"""Flags that set the ownership and permissions of UNIX socket listeners."""
+
+MAX_EXPANSION = 65536
+"""The most listeners a single port range or network can expand to."""
+
+PROTOCOLS = ("smtp", "lmtp")
+"""Protocols a listener can speak."""
+
+CAPTURE_CODECS = ("none", "zlib", "lzma", "bz2")
+"""Compression codecs for capture segments."""
+
+CAPTURE_POLICIES = ("none", "headers", "full")
+"""How much of each sampled message is captured."""
+
+CAPTURE_FLAGS = (
+    "capture_codec",
+    "capture_level",
+    "capture_policy",
+    "capture_sample_rate",
+    "capture_max_bytes",
+)
+"""Capture options that can be overridden on a listener."""
+
+SOCKET_OPTIONS = {
+    "defer_accept": "TCP_DEFER_ACCEPT",
+    "fastopen": "TCP_FASTOPEN",
+    "nodelay": "TCP_NODELAY",
+    "user_timeout": "TCP_USER_TIMEOUT",
+}
+"""Socket flags that require a platform specific socket option."""
+
+
 def parse_cmd_args(args):
     """
     Parse arguments from the command line.
@@ -189,6 +243,23 @@ def _compare_uid_and_gid(config):
         )
 
 
+def _sample_rate(value):
+    """
+    Convert a sample rate to a number.
+
+    :param value: The sample rate.
+    :type value: :py:obj:`str` or :py:obj:`float`
+    :returns: The rate, :py:obj:`None` when it is not a number between 0 and
+              1.
+    :rtype: :py:obj:`float` or :py:obj:`None`
+    """
+    try:
+        rate = float(value)
+    except ValueError:
+        return None
+    return rate if 0 <= rate <= 1 else None
+
+
 class Config(metaclass=Singleton):
     """
     Configuration module.
@@ -206,6 +277,7 @@ class Config(metaclass=Singleton):
     """A file containing configuration values."""
 
     _workers = 1
+    _tls_workers = 0
     _listen = []
     _tls_listen = []
     _user = None
@@ -219,6 +291,26 @@ class Config(metaclass=Singleton):
     _mode = "accept"
     _max_message_size = 512000
     _dynamic_switch = None
+    _profile_dir = "/tmp"
+    _profile_duration = 30
+    _loop_monitor = None
+    _loop_monitor_threshold = 100
+    _cpu_affinity = None
+    _reuse_port = None
+    _tls_ticket_rotation = 3600
+    _tls_reload_interval = 60
+    _capture_dir = None
+    _capture_format = "segment"
+    _capture_segment_size = 67108864
+    _capture_flush_size = 1048576
+    _capture_flush_interval = 1000
+    _capture_codec = "none"
+    _capture_level = 6
+    _capture_index = None
+    _capture_policy = "full"
+    _capture_sample_rate = 1.0
+    _capture_max_bytes = 0
+    _flags_index = None
 
     def __init__(self, config_file=None):
         """
@@ -282,29 +374,15 @@ class Config(metaclass=Singleton):
 
         https://kura.github.io/blackhole/configuration.html#configuration-options
 
+        Options are looked up in :data:`SCHEMA`.
+
         :param str key: Configuration option.
         :raises ConfigException: When an invalid option is configured.
         """
         if key == "":
             return
-        attributes = inspect.getmembers(
-            self, lambda a: not (inspect.isroutine(a))
-        )
-        attrs = [
-            a[0][1:]
-            for a in attributes
-            if not (a[0].startswith("__") and a[0].endswith("__"))
-            and a[0].startswith("_")
-        ]
-        if key not in attrs:
-            valid_attrs = ("'{0}' and " "'{1}'").format(
-                "', '".join(attrs[:-1]), attrs[-1]
-            )
-            msg = (
-                "Invalid configuration option '{0}'.\n\nValid options "
-                "are: {1}".format(key, valid_attrs)
-            )
-            raise ConfigException(msg)
+        if key not in SCHEMA:
+            raise ConfigException(SCHEMA.invalid(key))
 
     @property
     def workers(self):
@@ -320,14 +398,46 @@ class Config(metaclass=Singleton):
 
            Default value is 1.
 
+           ``auto`` uses one worker per usable CPU, taking the process's CPU
+           affinity and any cgroup CPU quota in to account. With
+           :attr:`cpu_affinity` enabled one CPU is left for the supervisor,
+           with a minimum of one worker.
+
            A supervisor process will always exist separately from the workers.
         """
+        if str(self._workers).lower() == "auto":
+            if self.cpu_affinity:
+                return max(usable_cpus() - 1, 1)
+            return usable_cpus()
         return int(self._workers) or 1
 
     @workers.setter
     def workers(self, workers):
         self._workers = workers
 
+    @property
+    def tls_workers(self):
+        """
+        How many workers to spawn to handle TLS connections.
+
+        https://kura.github.io/blackhole/configuration.html#tls-workers
+
+        :returns: Number of TLS workers. Default: ``0``
+        :rtype: :py:obj:`int`
+
+        .. note::
+
+           ``0`` means :attr:`tls_listen` is served by the same workers as
+           :attr:`listen`. Otherwise :attr:`workers` only serve
+           :attr:`listen` and this many additional workers only serve
+           :attr:`tls_listen`.
+        """
+        return int(self._tls_workers)
+
+    @tls_workers.setter
+    def tls_workers(self, workers):
+        self._tls_workers = workers
+
     @property
     def listen(self):
         """
@@ -606,6 +716,399 @@ class Config(metaclass=Singleton):
             msg = "{0} is not valid. Options are true or false.".format(switch)
             raise ConfigException(msg)
 
+    @property
+    def profile_dir(self):
+        """
+        Directory to write profiles to.
+
+        https://kura.github.io/blackhole/configuration.html#profile-dir
+
+        :returns: Path to a directory. Default: ``/tmp``.
+        :rtype: :py:obj:`str`
+        """
+        return self._profile_dir
+
+    @profile_dir.setter
+    def profile_dir(self, profile_dir):
+        if profile_dir is not None:
+            self._profile_dir = profile_dir
+
+    @property
+    def profile_duration(self):
+        """
+        Time in seconds to profile a child for.
+
+        https://kura.github.io/blackhole/configuration.html#profile-duration
+
+        :returns: Duration in seconds. Default: ``30``.
+        :rtype: :py:obj:`int`
+
+        .. note::
+
+           Cannot be higher than 3600 seconds.
+        """
+        return int(self._profile_duration)
+
+    @profile_duration.setter
+    def profile_duration(self, duration):
+        self._profile_duration = duration
+
+    @property
+    def loop_monitor(self):
+        """
+        Enable or disable event loop monitoring.
+
+        https://kura.github.io/blackhole/configuration.html#loop-monitor
+
+        :returns: Whether the event loop is monitored. Default: ``False``.
+        :rtype: :py:obj:`bool`
+        """
+        if self._loop_monitor is None:
+            return False
+        return self._loop_monitor
+
+    @loop_monitor.setter
+    def loop_monitor(self, monitor):
+        if monitor.lower() == "false":
+            self._loop_monitor = False
+        elif monitor.lower() == "true":
+            self._loop_monitor = True
+        else:
+            msg = "{0} is not valid. Options are true or false.".format(
+                monitor
+            )
+            raise ConfigException(msg)
+
+    @property
+    def loop_monitor_threshold(self):
+        """
+        Time in milliseconds after which a callback is considered slow.
+
+        https://kura.github.io/blackhole/configuration.html#loop-monitor-threshold
+
+        :returns: Threshold in milliseconds. Default: ``100``.
+        :rtype: :py:obj:`int`
+        """
+        return int(self._loop_monitor_threshold)
+
+    @loop_monitor_threshold.setter
+    def loop_monitor_threshold(self, threshold):
+        self._loop_monitor_threshold = threshold
+
+    @property
+    def cpu_affinity(self):
+        """
+        Enable or disable pinning processes to CPUs.
+
+        https://kura.github.io/blackhole/configuration.html#cpu-affinity
+
+        :returns: Whether processes are pinned to CPUs. Default: ``False``.
+        :rtype: :py:obj:`bool`
+        """
+        if self._cpu_affinity is None:
+            return False
+        return self._cpu_affinity
+
+    @cpu_affinity.setter
+    def cpu_affinity(self, affinity):
+        if affinity.lower() == "false":
+            self._cpu_affinity = False
+        elif affinity.lower() == "true":
+            self._cpu_affinity = True
+        else:
+            msg = "{0} is not valid. Options are true or false.".format(
+                affinity
+            )
+            raise ConfigException(msg)
+
+    @property
+    def reuse_port(self):
+        """
+        Enable or disable a listening socket per worker.
+
+        https://kura.github.io/blackhole/configuration.html#reuse-port
+
+        :returns: Whether each worker has it's own listening sockets.
+                  Default: ``False``.
+        :rtype: :py:obj:`bool`
+        """
+        if self._reuse_port is None:
+            return False
+        return self._reuse_port
+
+    @reuse_port.setter
+    def reuse_port(self, reuse):
+        if reuse.lower() == "false":
+            self._reuse_port = False
+        elif reuse.lower() == "true":
+            self._reuse_port = True
+        else:
+            msg = "{0} is not valid. Options are true or false.".format(reuse)
+            raise ConfigException(msg)
+
+    @property
+    def tls_ticket_rotation(self):
+        """
+        Time in seconds between TLS session ticket key rotations.
+
+        https://kura.github.io/blackhole/configuration.html#tls-ticket-rotation
+
+        :returns: Seconds between rotations, ``0`` disables rotation.
+                  Default: ``3600``.
+        :rtype: :py:obj:`int`
+        """
+        return int(self._tls_ticket_rotation)
+
+    @tls_ticket_rotation.setter
+    def tls_ticket_rotation(self, rotation):
+        self._tls_ticket_rotation = rotation
+
+    @property
+    def tls_reload_interval(self):
+        """
+        Time in seconds between checks for changed TLS certificate files.
+
+        https://kura.github.io/blackhole/configuration.html#tls-reload-interval
+
+        :returns: Seconds between checks, ``0`` disables checking.
+                  Default: ``60``.
+        :rtype: :py:obj:`int`
+        """
+        return int(self._tls_reload_interval)
+
+    @tls_reload_interval.setter
+    def tls_reload_interval(self, interval):
+        self._tls_reload_interval = interval
+
+    @property
+    def capture_dir(self):
+        """
+        Directory to write captured messages to.
+
+        https://kura.github.io/blackhole/configuration.html#capture-dir
+
+        :returns: Path to a directory, :py:obj:`None` disables capturing.
+                  Default: :py:obj:`None`.
+        :rtype: :py:obj:`str` or :py:obj:`None`
+        """
+        return self._capture_dir
+
+    @capture_dir.setter
+    def capture_dir(self, capture_dir):
+        self._capture_dir = capture_dir or None
+
+    @property
+    def capture_format(self):
+        """
+        How captured messages are stored.
+
+        https://kura.github.io/blackhole/configuration.html#capture-format
+
+        :returns: A capture format. Default: ``segment``.
+        :rtype: :py:obj:`str`
+
+        .. note::
+
+           Options: 'segment' and 'maildir'.
+        """
+        return self._capture_format
+
+    @capture_format.setter
+    def capture_format(self, capture_format):
+        self._capture_format = capture_format.lower()
+
+    @property
+    def capture_segment_size(self):
+        """
+        Size in bytes at which capture segment files are rotated.
+
+        https://kura.github.io/blackhole/configuration.html#capture-segment-size
+
+        :returns: Size in bytes. Default: ``67108864``.
+        :rtype: :py:obj:`int`
+        """
+        return int(self._capture_segment_size)
+
+    @capture_segment_size.setter
+    def capture_segment_size(self, size):
+        self._capture_segment_size = size
+
+    @property
+    def capture_flush_size(self):
+        """
+        Bytes of captured messages to hold in memory before writing them.
+
+        https://kura.github.io/blackhole/configuration.html#capture-flush-size
+
+        :returns: Size in bytes. Default: ``1048576``.
+        :rtype: :py:obj:`int`
+        """
+        return int(self._capture_flush_size)
+
+    @capture_flush_size.setter
+    def capture_flush_size(self, size):
+        self._capture_flush_size = size
+
+    @property
+    def capture_flush_interval(self):
+        """
+        Maximum time in milliseconds captured messages are held in memory.
+
+        https://kura.github.io/blackhole/configuration.html#capture-flush-interval
+
+        :returns: Time in milliseconds. Default: ``1000``.
+        :rtype: :py:obj:`int`
+        """
+        return int(self._capture_flush_interval)
+
+    @capture_flush_interval.setter
+    def capture_flush_interval(self, interval):
+        self._capture_flush_interval = interval
+
+    @property
+    def capture_codec(self):
+        """
+        Codec used to compress capture segments.
+
+        https://kura.github.io/blackhole/configuration.html#capture-codec
+
+        :returns: A codec from :const:`CAPTURE_CODECS`. Default: ``none``.
+        :rtype: :py:obj:`str`
+        """
+        return self._capture_codec
+
+    @capture_codec.setter
+    def capture_codec(self, codec):
+        self._capture_codec = codec.lower()
+
+    @property
+    def capture_level(self):
+        """
+        Compression level used for capture segments.
+
+        https://kura.github.io/blackhole/configuration.html#capture-level
+
+        :returns: A level between 1 and 9. Default: ``6``.
+        :rtype: :py:obj:`int`
+        """
+        return int(self._capture_level)
+
+    @capture_level.setter
+    def capture_level(self, level):
+        self._capture_level = level
+
+    @property
+    def capture_index(self):
+        """
+        Enable or disable indexing captured messages.
+
+        https://kura.github.io/blackhole/configuration.html#capture-index
+
+        :returns: Whether captured messages are indexed. Default: ``False``.
+        :rtype: :py:obj:`bool`
+        """
+        if self._capture_index is None:
+            return False
+        return self._capture_index
+
+    @capture_index.setter
+    def capture_index(self, index):
+        if index.lower() == "false":
+            self._capture_index = False
+        elif index.lower() == "true":
+            self._capture_index = True
+        else:
+            msg = "{0} is not valid. Options are true or false.".format(index)
+            raise ConfigException(msg)
+
+    @property
+    def capture_policy(self):
+        """
+        How much of each sampled message is captured.
+
+        https://kura.github.io/blackhole/configuration.html#capture-policy
+
+        :returns: A policy from :const:`CAPTURE_POLICIES`. Default: ``full``.
+        :rtype: :py:obj:`str`
+        """
+        return self._capture_policy
+
+    @capture_policy.setter
+    def capture_policy(self, policy):
+        self._capture_policy = policy.lower()
+
+    @property
+    def capture_sample_rate(self):
+        """
+        The fraction of transactions that are captured.
+
+        https://kura.github.io/blackhole/configuration.html#capture-sample-rate
+
+        :returns: A rate between 0 and 1. Default: ``1.0``.
+        :rtype: :py:obj:`float`
+        """
+        return float(self._capture_sample_rate)
+
+    @capture_sample_rate.setter
+    def capture_sample_rate(self, rate):
+        self._capture_sample_rate = rate
+
+    @property
+    def capture_max_bytes(self):
+        """
+        The most bytes of each message that are captured.
+
+        https://kura.github.io/blackhole/configuration.html#capture-max-bytes
+
+        :returns: Size in bytes, ``0`` for no limit. Default: ``0``.
+        :rtype: :py:obj:`int`
+        """
+        return int(self._capture_max_bytes)
+
+    @capture_max_bytes.setter
+    def capture_max_bytes(self, size):
+        self._capture_max_bytes = size
+
+    def worker_cpus(self):
+        """
+        The CPUs the supervisor and each worker are pinned to.
+
+        :returns: The supervisor's CPU and a list of the CPU for each worker,
+                  :py:obj:`None` values when :attr:`cpu_affinity` is
+                  disabled.
+        :rtype: :py:obj:`tuple`
+
+        .. note::
+
+           The supervisor is kept on the first available CPU and workers are
+           spread over the remaining CPUs. If only one CPU is available
+           everything shares it.
+        """
+        count = self.workers + self.tls_workers
+        if not self.cpu_affinity:
+            return None, [None] * count
+        cpus = available_cpus()
+        supervisor = cpus[0]
+        cpus = cpus[1:] or cpus
+        return supervisor, [cpus[idx % len(cpus)] for idx in range(count)]
+
+    def _worker_cpu_limit(self):
+        """
+        The number of CPUs workers can be spread over.
+
+        :returns: The number of available CPUs, less the supervisor's CPU
+                  when :attr:`cpu_affinity` is enabled.
+        :rtype: :py:obj:`int`
+
+        .. note::
+
+           This is the same set of CPUs :meth:`worker_cpus` pins workers to.
+        """
+        cpus = len(available_cpus())
+        if self.cpu_affinity:
+            return max(cpus - 1, 1)
+        return cpus
+
     def _convert_port(self, port):
         """
         Convert a port from the configuration files' string to an integer.
@@ -622,6 +1125,54 @@ class Config(metaclass=Singleton):
             msg = "{0} is not a valid port number.".format(port)
             raise ConfigException(msg)
 
+    def _convert_ports(self, port):
+        """
+        Convert a port or range of ports from the configuration files' string.
+
+        :param str port: A port number or a range, i.e. ``2500-2999``.
+        :raises ConfigException: If an invalid port or range is provided.
+        :returns: The ports.
+        :rtype: :py:obj:`range`
+        """
+        if "-" not in port:
+            port = self._convert_port(port)
+            return range(port, port + 1)
+        start, end = port.split("-", 1)
+        start, end = self._convert_port(start), self._convert_port(end)
+        if start > end:
+            msg = "{0} is not a valid port range.".format(port)
+            raise ConfigException(msg)
+        return range(start, end + 1)
+
+    def _addresses(self, addr):
+        """
+        Expand a network from the configuration files' string to addresses.
+
+        :param str addr: An address or a network in CIDR notation, i.e.
+                         ``10.0.0.0/29``.
+        :raises ConfigException: If an invalid network is provided.
+        :returns: The addresses.
+        :rtype: :py:obj:`list`
+
+        .. note::
+
+           The network and broadcast addresses of IPv4 networks are skipped.
+        """
+        if "/" not in addr:
+            return [addr]
+        try:
+            network = ipaddress.ip_network(addr, strict=False)
+        except ValueError:
+            msg = "{0} is not a valid network.".format(addr)
+            raise ConfigException(msg)
+        if network.num_addresses > MAX_EXPANSION:
+            msg = "{0} has more than {1} addresses.".format(
+                addr, MAX_EXPANSION
+            )
+            raise ConfigException(msg)
+        hosts = list(network.hosts()) or list(network)
+        return [str(host) for host in hosts]
+
     def _listeners(self, listeners):
         """
         Convert listeners lines from the configuration to usable values.
@@ -631,6 +1182,15 @@ class Config(metaclass=Singleton):
                               -- e.g. '127.0.0.1:25, 10.0.0.1:25, :25, :::25'
         :returns: List of addresses and sockets to listen on.
         :rtype: :py:obj:`list` or :py:obj:`None`
+
+        .. note::
+
+           UNIX socket listeners are written as ``unix:`` followed by an
+           absolute path, their port is :py:obj:`None`.
+
+           A range of ports, i.e. ``:2500-2999``, and a network, i.e.
+           ``10.0.0.0/29:25``, are expanded to a listener for every address
+           and port, all sharing the same flags.
         """
         clisteners = []
         _listeners = listeners.split(",")
@@ -640,18 +1200,58 @@ class Config(metaclass=Singleton):
             listener = listener.strip()
             parts = listener.split(" ")
             addr_port = parts[0]
-            port = addr_port.split(":")[-1].strip()
-            addr = addr_port.replace(":{0}".format(port), "").strip()
-            family = socket.AF_INET
-            if ":" in addr:
-                family = socket.AF_INET6
+            if addr_port.startswith("unix:"):
+                clisteners.append(self._unix_listener(addr_port, parts[1:]))
+                continue
+            addr, __, port = addr_port.rpartition(":")
+            addrs = self._addresses(addr.strip())
+            ports = self._convert_ports(port.strip())
+            if len(addrs) * len(ports) > MAX_EXPANSION:
+                msg = "{0} expands to more than {1} listeners.".format(
+                    addr_port, MAX_EXPANSION
+                )
+                raise ConfigException(msg)
             flags = {}
             if len(parts) > 1:
                 flags = self.create_flags(parts[1:])
-            host = (addr, self._convert_port(port), family, flags)
-            clisteners.append(host)
+            unix_flags = [flag for flag in UNIX_FLAGS if flag in flags]
+            if unix_flags:
+                msg = "{0} can only be used on unix: listeners.".format(
+                    ", ".join(unix_flags)
+                )
+                raise ConfigException(msg)
+            for addr in addrs:
+                family = socket.AF_INET6 if ":" in addr else socket.AF_INET
+                clisteners.extend(
+                    (addr, port, family, flags) for port in ports
+                )
         return clisteners
 
+    def _unix_listener(self, addr, parts):
+        """
+        Convert a UNIX socket listener from the configuration.
+
+        :param str addr: The listener, ``unix:`` followed by a path.
+        :param list parts: The listener's flags.
+        :returns: The path, :py:obj:`None`, :py:obj:`socket.AF_UNIX` and the
+                  listener's flags.
+        :rtype: :py:obj:`tuple`
+        :raises ConfigException: When the path is not absolute or a TCP flag
+                                 is used.
+        """
+        path = addr.split(":", 1)[1].strip()
+        if not os.path.isabs(path):
+            msg = "{0} is not an absolute path.".format(path)
+            raise ConfigException(msg)
+        flags = self.create_flags(parts)
+        tcp_flags = [flag for flag in TCP_FLAGS if flag in flags]
+        if tcp_flags:
+            msg = "{0} cannot be used on unix: listeners.".format(
+                ", ".join(tcp_flags)
+            )
+            raise ConfigException(msg)
+        return (path, None, socket.AF_UNIX, flags)
+
     def flags_from_listener(self, addr, port):
         """
         Get a list of flags defined for the provided listener.
@@ -659,7 +1259,7 @@ class Config(metaclass=Singleton):
         Scope: ``listen``, ``tls_listen``.
 
         :param str addr: The listener host address.
-        :param int port: The listener port.
+        :param int port: The listener port, :py:obj:`None` for a UNIX socket.
         :returns: Flags defined for this socket. Default: ``{}``.
         :rtype: :py:obj:`dict`
 
@@ -690,11 +1290,45 @@ class Config(metaclass=Singleton):
             addr = ""
         elif addr in ("::1",):
             addr = "::"
-        listeners = self.listen + self.tls_listen
-        for laddr, lport, __, lflags in listeners:
-            if laddr == addr and lport == port:
-                return lflags
-        return {}
+        return self._listener_flags().get((addr, port), {})
+
+    def _listener_flags(self):
+        """
+        Index the flags of every listener by address and port.
+
+        The index is built once and rebuilt when :attr:`listen` or
+        :attr:`tls_listen` are changed, so looking up the flags for a
+        connection does not scan every listener.
+
+        :returns: Flags, keyed by address and port.
+        :rtype: :py:obj:`dict`
+        """
+        cached = self._flags_index
+        if (
+            cached is not None
+            and cached[0] is self._listen
+            and cached[1] is self._tls_listen
+        ):
+            return cached[2]
+        index = {}
+        for laddr, lport, __, lflags in self.listen + self.tls_listen:
+            index.setdefault((laddr, lport), lflags)
+        self._flags_index = (self._listen, self._tls_listen, index)
+        return index
+
+    def flags_from_sockname(self, sockname):
+        """
+        Get the flags defined for the listener a socket is bound to.
+
+        :param sockname: The socket's address, as returned by
+                         :py:meth:`socket.socket.getsockname`.
+        :type sockname: :py:obj:`tuple` or :py:obj:`str` for a UNIX socket
+        :returns: Flags defined for this socket. Default: ``{}``.
+        :rtype: :py:obj:`dict`
+        """
+        if isinstance(sockname, str):
+            return self.flags_from_listener(sockname, None)
+        return self.flags_from_listener(sockname[0], sockname[1])
 
     def create_flags(self, parts):
         """
@@ -714,8 +1348,145 @@ class Config(metaclass=Singleton):
                         flags.update(self._flag_mode(flag, value))
                     elif flag == "delay":
                         flags.update(self._flag_delay(flag, value))
+                elif flag in SOCKET_FLAGS:
+                    flags.update(self._flag_socket(flag, value))
+                elif flag in CAPTURE_FLAGS:
+                    flags.update(self._flag_capture(flag, value))
+                elif flag in UNIX_FLAGS:
+                    flags.update(self._flag_unix(flag, value))
+                elif flag == "proto":
+                    flags.update(self._flag_proto(flag, value))
         return flags
 
+    def _flag_proto(self, flag, value):
+        """
+        Create a flag for the protocol a listener speaks.
+
+        :param str flag: The flag name.
+        :param str value: The value of the flag.
+        :returns: Protocol flag for a listener.
+        :rtype: :py:obj:`dict`
+        :raises ConfigException: If an invalid protocol is provided.
+        """
+        if value in PROTOCOLS:
+            return {flag: value}
+        raise ConfigException(
+            "'{0}' is not a valid proto. Valid options are: {1}.".format(
+                value, ", ".join("'{0}'".format(p) for p in PROTOCOLS)
+            )
+        )
+
+    def _flag_unix(self, flag, value):
+        """
+        Create a UNIX socket ownership or permission flag.
+
+        :param str flag: The flag name.
+        :param str value: The value of the flag.
+        :returns: UNIX socket flag for a listener.
+        :rtype: :py:obj:`dict`
+        :raises ConfigException: If an invalid value is provided.
+
+        .. note::
+
+           ``owner`` and ``group`` take a user and group name, ``perm`` takes
+           octal permissions, i.e. ``660``.
+        """
+        if flag == "perm":
+            try:
+                perm = int(value, 8)
+            except ValueError:
+                perm = -1
+            if 0 <= perm <= 0o777:
+                return {flag: perm}
+            raise ConfigException(
+                "'{0}' is not a valid perm value. It must be octal "
+                "permissions, i.e. 660.".format(value)
+            )
+        try:
+            if flag == "owner":
+                pwd.getpwnam(value)
+            else:
+                grp.getgrnam(value)
+        except KeyError:
+            raise ConfigException(
+                "'{0}' is not a valid {1}.".format(
+                    value, "user" if flag == "owner" else "group"
+                )
+            )
+        return {flag: value}
+
+    def _flag_capture(self, flag, value):
+        """
+        Create a capture flag.
+
+        :param str flag: The flag name.
+        :param str value: The value of the flag.
+        :returns: Capture flag for a listener.
+        :rtype: :py:obj:`dict`
+        :raises ConfigException: If an invalid value is provided.
+        """
+        choices = {
+            "capture_codec": CAPTURE_CODECS,
+            "capture_policy": CAPTURE_POLICIES,
+        }
+        if flag in choices:
+            if value.lower() in choices[flag]:
+                return {flag: value.lower()}
+            raise ConfigException(
+                "'{0}' is not a valid {1}. Valid options are: "
+                "'{2}'.".format(value, flag, "', '".join(choices[flag]))
+            )
+        if flag == "capture_sample_rate":
+            if _sample_rate(value) is not None:
+                return {flag: float(value)}
+            raise ConfigException(
+                "'{0}' is not a valid capture_sample_rate. It must be a "
+                "number between 0 and 1.".format(value)
+            )
+        if flag == "capture_max_bytes":
+            if value.isdigit():
+                return {flag: int(value)}
+            raise ConfigException(
+                "'{0}' is not a valid capture_max_bytes. It must be a "
+                "number of bytes.".format(value)
+            )
+        if value.isdigit() and 1 <= int(value) <= 9:
+            return {flag: int(value)}
+        raise ConfigException(
+            "'{0}' is not a valid capture_level. It must be a number between "
+            "1 and 9.".format(value)
+        )
+
+    def _flag_socket(self, flag, value):
+        """
+        Create a socket option flag.
+
+        :param str flag: The flag name.
+        :param str value: The value of the flag.
+        :returns: Socket option flag for a listener.
+        :rtype: :py:obj:`dict`
+        :raises ConfigException: If an invalid value is provided.
+
+        .. note::
+
+           ``nodelay`` takes ``true`` or ``false``, every other socket flag
+           takes a number within the range in :const:`SOCKET_FLAGS`.
+        """
+        if SOCKET_FLAGS[flag] is None:
+            if value.lower() in ("true", "false"):
+                return {flag: value.lower() == "true"}
+            raise ConfigException(
+                "'{0}' is not a valid {1} value. Valid options are: 'true' "
+                "and 'false'.".format(value, flag)
+            )
+        low, high = SOCKET_FLAGS[flag]
+        if value.isdigit() and low <= int(value) <= high:
+            return {flag: int(value)}
+        raise ConfigException(
+            "'{0}' is not a valid {1} value. It must be a number between {2} "
+            "and {3}.".format(value, flag, low, high)
+        )
+
     def _flag_mode(self, flag, value):
         """
         Create a flag for the mode directive.
@@ -780,13 +1551,11 @@ class Config(metaclass=Singleton):
 
         .. note::
 
-           Uses the magic of :py:func:`inspect.getmembers` to introspect
-           methods beginning with \'test\_\' and calling them.
+           Runs the validators collected in :data:`SCHEMA`, checks that
+           involve more than one option run first.
         """
-        members = inspect.getmembers(self, predicate=inspect.ismethod)
-        for name, _ in members:
-            if name.startswith("test_"):
-                getattr(self, name)()
+        for name in SCHEMA.validators:
+            getattr(self, name)()
         return self
 
     def test_workers(self):
@@ -797,9 +1566,17 @@ class Config(metaclass=Singleton):
 
         .. note::
 
-           Cannot have more workers than number of processors or cores.
+           Cannot have more workers than available processors or cores,
+           less the supervisor's when :attr:`cpu_affinity` is enabled.
         """
-        cpus = multiprocessing.cpu_count()
+        try:
+            __ = self.workers  # NOQA
+        except ValueError:
+            msg = "{0} is not a valid number of workers or auto.".format(
+                self._workers
+            )
+            raise ConfigException(msg)
+        cpus = self._worker_cpu_limit()
         if self.workers > cpus:
             msg = (
                 "Cannot have more workers than number of processors or "
@@ -807,6 +1584,46 @@ class Config(metaclass=Singleton):
             ).format(self.workers, cpus)
             raise ConfigException(msg)
 
+    def test_tls_workers(self):
+        """
+        Validate the number of TLS workers.
+
+        :raises ConfigException: If an invalid number of TLS workers is
+                                 provided.
+
+        .. note::
+
+           TLS workers require :attr:`tls_listen` and, with :attr:`workers`,
+           cannot outnumber processors or cores.
+        """
+        try:
+            tls_workers = self.tls_workers
+        except ValueError:
+            msg = "{0} is not a valid number of TLS workers.".format(
+                self._tls_workers
+            )
+            raise ConfigException(msg)
+        if tls_workers == 0:
+            return
+        if tls_workers < 0:
+            msg = "tls_workers cannot be negative."
+            raise ConfigException(msg)
+        if not len(self.tls_listen) > 0:
+            msg = "tls_workers requires tls_listen to be configured."
+            raise ConfigException(msg)
+        cpus = self._worker_cpu_limit()
+        try:
+            workers = self.workers
+        except ValueError:
+            return
+        if workers + tls_workers > cpus:
+            msg = (
+                "Cannot have more workers than number of processors or "
+                "cores. {0} workers + {1} TLS workers > {2} "
+                "processors/cores."
+            ).format(workers, tls_workers, cpus)
+            raise ConfigException(msg)
+
     def test_ipv6_support(self):
         """
         If an IPv6 listener is configured, confirm IPv6 is supported.
@@ -851,21 +1668,15 @@ class Config(metaclass=Singleton):
            IPv4 and IPv6 addresses are different sockets so they can listen on
            the same port because they have different addresses.
         """
-        if len(self.listen) == 0 and len(self.tls_listen) == 0:
-            return
-        listen, tls_listen = [], []
-        for llisten in self.listen:
-            addr, port, family, flags = llisten
-            listen.append((addr, port, family))
-        for llisten in self.tls_listen:
-            addr, port, family, flags = llisten
-            tls_listen.append((addr, port, family))
-        if set(listen).intersection(tls_listen):
-            msg = (
-                "Cannot have multiple listeners on the same address and "
-                "port."
-            )
-            raise ConfigException(msg)
+        seen = set()
+        for addr, port, family, __ in self.listen + self.tls_listen:
+            if (addr, port, family) in seen:
+                msg = (
+                    "Cannot have multiple listeners on the same address and "
+                    "port."
+                )
+                raise ConfigException(msg)
+            seen.add((addr, port, family))
 
     def test_no_listeners(self):
         """
@@ -909,24 +1720,46 @@ class Config(metaclass=Singleton):
         :raises ConfigException: When a port is configured that we have no
                                  permissions for.
         """
-        for host, port, family, __ in self.listen:
+        self._listener_permissions(self.listen)
+
+    def _listener_permissions(self, listeners):
+        """
+        Validate that every listener can be used.
+
+        Each address, port and family is only checked once. The range of every
+        port and permission to use it are checked before any socket is bound.
+
+        :param list listeners: Listeners, see :meth:`_listeners`.
+        :raises ConfigException: When a listener is configured that we have
+                                 no permissions for or is in use.
+        """
+        seen, ports = set(), []
+        uid = os.getuid()
+        for host, port, family, __ in listeners:
+            if (host, port, family) in seen:
+                continue
+            seen.add((host, port, family))
+            if family == socket.AF_UNIX:
+                self._unix_permissions(host)
+                continue
+            self._min_max_port(port)
+            if uid != 0 and port < 1024:
+                msg = "You do not have permission to use port {0}".format(port)
+                raise ConfigException(msg)
+            ports.append((host, port, family))
+        for host, port, family in ports:
             self._port_permissions(host, port, family)
 
     def _port_permissions(self, address, port, family):
         """
-        Validate that we have permission to use the port and it's not in use.
+        Validate that a port is not in use.
 
         :param str address: The address to use.
         :param int port: The port to use.
         :param family: The type of socket to use.
         :type family: :py:obj:`socket.AF_INET` or :py:obj:`socket.AF_INET6`
-        :raises ConfigException: When a port is supplied that we have no
-                                 permissions for.
+        :raises ConfigException: When a port is in use or cannot be bound.
         """
-        self._min_max_port(port)
-        if os.getuid() != 0 and port < 1024:
-            msg = "You do not have permission to use port {0}".format(port)
-            raise ConfigException(msg)
         sock = socket.socket(family, socket.SOCK_STREAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         try:
@@ -1008,8 +1841,27 @@ class Config(metaclass=Singleton):
         """
         if len(self.tls_listen) == 0:
             return
-        for host, port, af, __ in self.tls_listen:
-            self._port_permissions(host, port, af)
+        self._listener_permissions(self.tls_listen)
+
+    def _unix_permissions(self, path):
+        """
+        Validate that a UNIX socket can be created at a path.
+
+        :param str path: The path of the socket.
+        :raises ConfigException: When the directory does not exist or cannot
+                                 be written to, or the path is a file that is
+                                 not a socket.
+        """
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            msg = "{0} is not a directory.".format(directory)
+            raise ConfigException(msg)
+        if not os.access(directory, os.W_OK | os.X_OK):
+            msg = "You do not have permission to create {0}.".format(path)
+            raise ConfigException(msg)
+        if os.path.lexists(path) and not stat.S_ISSOCK(os.lstat(path).st_mode):
+            msg = "{0} exists and is not a socket.".format(path)
+            raise ConfigException(msg)
 
     def test_tls_settings(self):
         """
@@ -1019,7 +1871,8 @@ class Config(metaclass=Singleton):
 
         .. note::
 
-           Verifies if you provide all TLS settings, not just some.
+           Verifies if you provide all TLS settings, not just some. A
+           certificate and key without a port only enable STARTTLS.
         """
         port = True
         if not len(self.tls_listen) > 0:
@@ -1028,6 +1881,8 @@ class Config(metaclass=Singleton):
         key = os.access(self.tls_key, os.R_OK) if self.tls_key else False
         if (port, cert, key) == (False, False, False):
             return
+        if (cert, key) == (True, True):
+            return
         if not all((port, cert, key)):
             msg = (
                 "To use TLS you must supply a port, certificate file "
@@ -1124,3 +1979,358 @@ class Config(metaclass=Singleton):
         if self._dynamic_switch not in (True, False):
             msg = "Allowed dynamic_switch values are true and false."
             raise ConfigException(msg)
+
+    def test_profile_dir(self):
+        """
+        Validate that the profile directory can be written to.
+
+        :raises ConfigException: When the profile directory is invalid.
+        """
+        if not os.path.isdir(self.profile_dir):
+            msg = "profile_dir {0} is not a directory.".format(
+                self.profile_dir
+            )
+            raise ConfigException(msg)
+        if not os.access(self.profile_dir, os.W_OK):
+            msg = "You do not have permission to write to the profile_dir."
+            raise ConfigException(msg)
+
+    def test_profile_duration(self):
+        """
+        Validate the profile duration.
+
+        :raises ConfigException: When the duration is not a number or is
+                                 outside of the allowed range.
+        """
+        try:
+            duration = self.profile_duration
+        except ValueError:
+            msg = "{0} is not a valid number of seconds.".format(
+                self._profile_duration
+            )
+            raise ConfigException(msg)
+        if duration < 1 or duration > 3600:
+            msg = "profile_duration must be between 1 and 3600 seconds."
+            raise ConfigException(msg)
+
+    def test_loop_monitor_threshold(self):
+        """
+        Validate the loop monitor threshold.
+
+        :raises ConfigException: When the threshold is not a number or is
+                                 outside of the allowed range.
+        """
+        try:
+            threshold = self.loop_monitor_threshold
+        except ValueError:
+            msg = "{0} is not a valid number of milliseconds.".format(
+                self._loop_monitor_threshold
+            )
+            raise ConfigException(msg)
+        if threshold < 1 or threshold > 60000:
+            msg = (
+                "loop_monitor_threshold must be between 1 and 60000 "
+                "milliseconds."
+            )
+            raise ConfigException(msg)
+
+    def test_cpu_affinity(self):
+        """
+        Validate that CPU affinity is supported on this platform.
+
+        :raises ConfigException: When CPU affinity is enabled but not
+                                 supported.
+        """
+        if self.cpu_affinity and not hasattr(os, "sched_setaffinity"):
+            msg = "cpu_affinity is not supported on this platform."
+            raise ConfigException(msg)
+
+    def test_reuse_port(self):
+        """
+        Validate that SO_REUSEPORT is supported on this platform.
+
+        :raises ConfigException: When reuse_port is enabled but not
+                                 supported.
+        """
+        if self.reuse_port and not hasattr(socket, "SO_REUSEPORT"):
+            msg = "reuse_port is not supported on this platform."
+            raise ConfigException(msg)
+
+    def test_socket_flags(self):
+        """
+        Validate that socket flags are supported on this platform.
+
+        :raises ConfigException: When a listener uses a socket flag that is
+                                 not supported.
+        """
+        for addr, port, __, flags in self.listen + self.tls_listen:
+            for flag in flags:
+                option = SOCKET_OPTIONS.get(flag)
+                if option is None or hasattr(socket, option):
+                    continue
+                msg = (
+                    "{0}:{1} uses {2}= but {3} is not supported on this "
+                    "platform."
+                ).format(addr, port, flag, option)
+                raise ConfigException(msg)
+
+    def test_tls_ticket_rotation(self):
+        """
+        Validate the TLS session ticket key rotation interval.
+
+        :raises ConfigException: When the interval is not a number or is
+                                 outside of the allowed range.
+        """
+        try:
+            rotation = self.tls_ticket_rotation
+        except ValueError:
+            msg = "{0} is not a valid number of seconds.".format(
+                self._tls_ticket_rotation
+            )
+            raise ConfigException(msg)
+        if rotation != 0 and not 60 <= rotation <= 86400:
+            msg = (
+                "tls_ticket_rotation must be 0 or between 60 and 86400 "
+                "seconds."
+            )
+            raise ConfigException(msg)
+
+    def test_tls_reload_interval(self):
+        """
+        Validate the TLS certificate file check interval.
+
+        :raises ConfigException: When the interval is not a number or is
+                                 outside of the allowed range.
+        """
+        try:
+            interval = self.tls_reload_interval
+        except ValueError:
+            msg = "{0} is not a valid number of seconds.".format(
+                self._tls_reload_interval
+            )
+            raise ConfigException(msg)
+        if not 0 <= interval <= 86400:
+            msg = "tls_reload_interval must be between 0 and 86400 seconds."
+            raise ConfigException(msg)
+
+    def test_capture_dir(self):
+        """
+        Validate that the capture directory can be written to.
+
+        :raises ConfigException: When the capture directory is invalid.
+        """
+        if self.capture_dir is None:
+            return
+        if not os.path.isdir(self.capture_dir):
+            msg = "capture_dir {0} is not a directory.".format(
+                self.capture_dir
+            )
+            raise ConfigException(msg)
+        if not os.access(self.capture_dir, os.W_OK):
+            msg = "You do not have permission to write to the capture_dir."
+            raise ConfigException(msg)
+
+    def test_capture_format(self):
+        """
+        Validate the capture format.
+
+        :raises ConfigException: When an invalid format is configured.
+        """
+        if self.capture_format not in ("segment", "maildir"):
+            msg = "capture_format must be segment or maildir."
+            raise ConfigException(msg)
+
+    def test_capture_segment_size(self):
+        """
+        Validate the capture segment size.
+
+        :raises ConfigException: When the size is not a number or is outside
+                                 of the allowed range.
+        """
+        try:
+            size = self.capture_segment_size
+        except ValueError:
+            msg = "{0} is not a valid number of bytes.".format(
+                self._capture_segment_size
+            )
+            raise ConfigException(msg)
+        if not 65536 <= size <= 4294967296:
+            msg = (
+                "capture_segment_size must be between 65536 and 4294967296 "
+                "bytes."
+            )
+            raise ConfigException(msg)
+
+    def test_capture_flush_size(self):
+        """
+        Validate the capture flush size.
+
+        :raises ConfigException: When the size is not a number or is outside
+                                 of the allowed range.
+        """
+        try:
+            size = self.capture_flush_size
+        except ValueError:
+            msg = "{0} is not a valid number of bytes.".format(
+                self._capture_flush_size
+            )
+            raise ConfigException(msg)
+        if not 1 <= size <= 268435456:
+            msg = "capture_flush_size must be between 1 and 268435456 bytes."
+            raise ConfigException(msg)
+
+    def test_capture_flush_interval(self):
+        """
+        Validate the capture flush interval.
+
+        :raises ConfigException: When the interval is not a number or is
+                                 outside of the allowed range.
+        """
+        try:
+            interval = self.capture_flush_interval
+        except ValueError:
+            msg = "{0} is not a valid number of milliseconds.".format(
+                self._capture_flush_interval
+            )
+            raise ConfigException(msg)
+        if not 1 <= interval <= 60000:
+            msg = (
+                "capture_flush_interval must be between 1 and 60000 "
+                "milliseconds."
+            )
+            raise ConfigException(msg)
+
+    def test_capture_codec(self):
+        """
+        Validate the capture codec.
+
+        :raises ConfigException: When an invalid codec is configured.
+        """
+        if self.capture_codec not in CAPTURE_CODECS:
+            msg = "capture_codec must be one of {0}.".format(
+                ", ".join(CAPTURE_CODECS)
+            )
+            raise ConfigException(msg)
+
+    def test_capture_level(self):
+        """
+        Validate the capture compression level.
+
+        :raises ConfigException: When the level is not a number or is
+                                 outside of the allowed range.
+        """
+        try:
+            level = self.capture_level
+        except ValueError:
+            msg = "{0} is not a valid compression level.".format(
+                self._capture_level
+            )
+            raise ConfigException(msg)
+        if not 1 <= level <= 9:
+            msg = "capture_level must be between 1 and 9."
+            raise ConfigException(msg)
+
+    def test_capture_policy(self):
+        """
+        Validate the capture policy.
+
+        :raises ConfigException: When an invalid policy is configured.
+        """
+        if self.capture_policy not in CAPTURE_POLICIES:
+            msg = "capture_policy must be one of {0}.".format(
+                ", ".join(CAPTURE_POLICIES)
+            )
+            raise ConfigException(msg)
+
+    def test_capture_sample_rate(self):
+        """
+        Validate the capture sample rate.
+
+        :raises ConfigException: When the rate is not a number between 0 and
+                                 1.
+        """
+        if _sample_rate(self._capture_sample_rate) is None:
+            msg = "capture_sample_rate must be a number between 0 and 1."
+            raise ConfigException(msg)
+
+    def test_capture_max_bytes(self):
+        """
+        Validate the maximum bytes captured from each message.
+
+        :raises ConfigException: When the size is not a positive number.
+        """
+        try:
+            size = self.capture_max_bytes
+        except ValueError:
+            msg = "{0} is not a valid number of bytes.".format(
+                self._capture_max_bytes
+            )
+            raise ConfigException(msg)
+        if size < 0:
+            msg = "capture_max_bytes must be 0 or more."
+            raise ConfigException(msg)
+
+
+SCHEMA = Schema(
+    (
+        Option(
+            "listen",
+            "listeners",
+            ("test_port", "test_ipv6_support"),
+            default="127.0.0.1:25, 127.0.0.1:587, :::25, :::587",
+        ),
+        Option(
+            "tls_listen",
+            "listeners",
+            ("test_tls_port", "test_tls_ipv6_support"),
+        ),
+        Option("user", "user", ("test_user",), default="current user"),
+        Option("group", "group", ("test_group",), default="current group"),
+        Option("pidfile", "path", ("test_pidfile",)),
+        Option("timeout", "int", ("test_timeout",)),
+        Option("tls_key", "path", ("test_tls_settings",)),
+        Option("tls_cert", "path", ("test_tls_settings",)),
+        Option("tls_dhparams", "path", ("test_tls_dhparams",)),
+        Option("delay", "delay", ("test_delay",)),
+        Option("mode", "choice", ("test_mode",)),
+        Option("max_message_size", "int", ("test_max_message_size",)),
+        Option(
+            "dynamic_switch", "bool", ("test_dynamic_switch",), default=True
+        ),
+        Option("workers", "int|auto", ("test_workers",)),
+        Option("tls_workers", "int", ("test_tls_workers",)),
+        Option("profile_dir", "path", ("test_profile_dir",)),
+        Option("profile_duration", "int", ("test_profile_duration",)),
+        Option("loop_monitor", "bool", default=False),
+        Option(
+            "loop_monitor_threshold", "int", ("test_loop_monitor_threshold",)
+        ),
+        Option("cpu_affinity", "bool", ("test_cpu_affinity",), default=False),
+        Option("reuse_port", "bool", ("test_reuse_port",), default=False),
+        Option("tls_ticket_rotation", "int", ("test_tls_ticket_rotation",)),
+        Option("tls_reload_interval", "int", ("test_tls_reload_interval",)),
+        Option("capture_dir", "path", ("test_capture_dir",)),
+        Option("capture_format", "choice", ("test_capture_format",)),
+        Option("capture_segment_size", "int", ("test_capture_segment_size",)),
+        Option("capture_flush_size", "int", ("test_capture_flush_size",)),
+        Option(
+            "capture_flush_interval", "int", ("test_capture_flush_interval",)
+        ),
+        Option("capture_codec", "choice", ("test_capture_codec",)),
+        Option("capture_level", "int", ("test_capture_level",)),
+        Option("capture_index", "bool", default=False),
+        Option("capture_policy", "choice", ("test_capture_policy",)),
+        Option("capture_sample_rate", "float", ("test_capture_sample_rate",)),
+        Option("capture_max_bytes", "int", ("test_capture_max_bytes",)),
+    ),
+    checks=("test_no_listeners", "test_same_listeners", "test_socket_flags"),
+).compile(Config)
+"""
+Every configuration option, a description of it's value, default and
+validators.
+
+Used to find invalid options in a configuration file, to list the validators
+:meth:`Config.test` runs and to summarise the options in
+:func:`blackhole.application.blackhole_config`. Values are parsed by
+:class:`Config`'s properties, not the schema.
+"""
@@ -34,12 +34,20 @@ import logging
 import os
 import pwd
 import socket
+import stat
 
 from .config import Config
 from .exceptions import BlackholeRuntimeException
 
 
-__all__ = ("pid_permissions", "server", "setgid", "setuid")
+__all__ = (
+    "contexts",
+    "pid_permissions",
+    "server",
+    "servers",
+    "setgid",
+    "setuid",
+)
 """Tuple all the things."""
 
 
@@ -104,18 +112,115 @@ def _context(use_tls=False):
     return ctx
 
 
-def _socket(addr, port, family):
+def _socket_options(sock, flags):
+    """
+    Apply socket flags from a listener to a socket before it listens.
+
+    :param sock: The socket.
+    :type sock: :py:func:`socket.socket`
+    :param dict flags: Flags from the listener.
+
+    .. note::
+
+       Accepted connections inherit these options from the listening socket.
+       ``nodelay`` is applied to each connection instead, asyncio enables
+       ``TCP_NODELAY`` on every connection it accepts --
+       :meth:`blackhole.protocols.StreamReaderProtocol.flags_from_transport`
+    """
+    if "rcvbuf" in flags:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, flags["rcvbuf"])
+    if "sndbuf" in flags:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, flags["sndbuf"])
+    if "defer_accept" in flags:
+        sock.setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT, flags["defer_accept"]
+        )
+    if "fastopen" in flags:
+        sock.setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_FASTOPEN, flags["fastopen"]
+        )
+    if "user_timeout" in flags:
+        sock.setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, flags["user_timeout"]
+        )
+
+
+def _unix_socket(path, flags):
+    """
+    Create a UNIX socket and bind it.
+
+    A socket left at ``path`` by a previous run is removed first. The socket
+    is given the ownership and permissions from the listener's ``owner``,
+    ``group`` and ``perm`` flags.
+
+    :param str path: The path to bind to.
+    :param dict flags: Flags from the listener.
+    :returns: Bound socket, not yet listening.
+    :rtype: :py:func:`socket.socket`
+    :raises BlackholeRuntimeException: When a socket cannot be bound or its
+                                       ownership and permissions cannot be
+                                       set.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        if os.path.lexists(path) and stat.S_ISSOCK(os.lstat(path).st_mode):
+            os.unlink(path)
+        _socket_options(sock, flags)
+        sock.bind(path)
+    except OSError:
+        msg = "Cannot bind to unix:{0}.".format(path)
+        logger.critical(msg)
+        sock.close()
+        raise BlackholeRuntimeException(msg)
+    try:
+        if "perm" in flags:
+            os.chmod(path, flags["perm"])
+        if "owner" in flags or "group" in flags:
+            uid, gid = -1, -1
+            if "owner" in flags:
+                uid = pwd.getpwnam(flags["owner"]).pw_uid
+            if "group" in flags:
+                gid = grp.getgrnam(flags["group"]).gr_gid
+            os.chown(path, uid, gid)
+    except (KeyError, OSError) as err:
+        msg = "Cannot set ownership and permissions of unix:{0}: {1}.".format(
+            path, err
+        )
+        logger.critical(msg)
+        sock.close()
+        os.unlink(path)
+        raise BlackholeRuntimeException(msg)
+    return sock
+
+
+def _socket(addr, port, family, flags=None):
     """
     Create a socket, bind and listen.
 
-    :param str addr: The address to use.
-    :param int port: The port to use.
+    :param str addr: The address to use, or the path of a UNIX socket.
+    :param int port: The port to use, :py:obj:`None` for a UNIX socket.
     :param family: The type of socket to use.
-    :type family: :py:obj:`socket.AF_INET` or :py:obj:`socket.AF_INET6`.
+    :type family: :py:obj:`socket.AF_INET`, :py:obj:`socket.AF_INET6` or
+                  :py:obj:`socket.AF_UNIX`.
+    :param flags: Flags from the listener, see
+                  :meth:`blackhole.config.Config.create_flags`.
+    :type flags: :py:obj:`dict` or :py:obj:`None`
     :returns: Bound socket.
     :rtype: :py:func:`socket.socket`
     :raises BlackholeRuntimeException: When a socket cannot be bound.
+
+    .. note::
+
+       Listens with a backlog of 1024 unless the listener has a ``backlog``
+       flag.
     """
+    flags = flags or {}
+    if family == socket.AF_UNIX:
+        sock = _unix_socket(addr, flags)
+        os.set_inheritable(sock.fileno(), True)
+        sock.listen(flags.get("backlog", 1024))
+        sock.setblocking(False)
+        return sock
     sock = socket.socket(family, socket.SOCK_STREAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
@@ -124,6 +229,15 @@ def _socket(addr, port, family):
         pass
     if family == socket.AF_INET6:
         sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+    try:
+        _socket_options(sock, flags)
+    except OSError as err:
+        msg = "Cannot set socket options for {0}:{1}: {2}.".format(
+            addr, port, err
+        )
+        logger.critical(msg)
+        sock.close()
+        raise BlackholeRuntimeException(msg)
     try:
         sock.bind((addr, port))
     except OSError:
@@ -132,12 +246,35 @@ def _socket(addr, port, family):
         sock.close()
         raise BlackholeRuntimeException(msg)
     os.set_inheritable(sock.fileno(), True)
-    sock.listen(1024)
+    sock.listen(flags.get("backlog", 1024))
     sock.setblocking(False)
     return sock
 
 
-def server(addr, port, family, use_tls=False):
+def contexts(use_tls=False, starttls=False):
+    """
+    A TLS context and a STARTTLS context for listeners to share.
+
+    :param bool use_tls: Whether to create a TLS context or not.
+                         Default: ``False``.
+    :param bool starttls: Whether to create a TLS context for STARTTLS or
+                          not. Default: ``False``.
+    :returns: The TLS and STARTTLS contexts, :py:obj:`None` when not
+              created.
+    :rtype: :py:obj:`tuple`
+    """
+    return _context(use_tls=use_tls), _context(use_tls=starttls)
+
+
+def server(
+    addr,
+    port,
+    family,
+    use_tls=False,
+    flags=None,
+    starttls=False,
+    shared=None,
+):
     """
     Socket and possibly a TLS context.
 
@@ -150,12 +287,72 @@ def server(addr, port, family, use_tls=False):
     :type family: :py:obj:`socket.AF_INET` or :py:obj:`socket.AF_INET6`.
     :param bool use_tls: Whether to create a TLS context or not.
                          Default: ``False``.
-    :returns: Bound socket, a TLS context if configured.
+    :param flags: Flags from the listener.
+    :type flags: :py:obj:`dict` or :py:obj:`None`
+    :param bool starttls: Whether to create a TLS context for STARTTLS or
+                          not. Default: ``False``.
+    :param shared: Contexts from :func:`contexts` to use instead of creating
+                   new ones.
+    :type shared: :py:obj:`tuple` or :py:obj:`None`
+    :returns: Bound socket, a TLS context and a STARTTLS context if
+              configured.
     :rtype: :py:obj:`dict`
     """
-    sock = _socket(addr, port, family)
-    ctx = _context(use_tls=use_tls)
-    return {"sock": sock, "ssl": ctx}
+    sock = _socket(addr, port, family, flags)
+    if shared is None:
+        shared = contexts(use_tls=use_tls, starttls=starttls)
+    ctx, starttls_ctx = shared
+    return {"sock": sock, "ssl": ctx, "starttls": starttls_ctx}
+
+
+def servers(
+    addr,
+    port,
+    family,
+    count,
+    use_tls=False,
+    flags=None,
+    starttls=False,
+    shared=None,
+):
+    """
+    Sockets bound to the same address and port, sharing a TLS context.
+
+    Each socket has :py:obj:`socket.SO_REUSEPORT` set, so the kernel
+    distributes incoming connections across them.
+
+    :param str addr: The address to use.
+    :param int port: The port to use.
+    :param family: The type of socket to use.
+    :type family: :py:obj:`socket.AF_INET` or :py:obj:`socket.AF_INET6`.
+    :param int count: The number of sockets to create.
+    :param bool use_tls: Whether to create a TLS context or not.
+                         Default: ``False``.
+    :param flags: Flags from the listener.
+    :type flags: :py:obj:`dict` or :py:obj:`None`
+    :param bool starttls: Whether to create a TLS context for STARTTLS or
+                          not. Default: ``False``.
+    :param shared: Contexts from :func:`contexts` to use instead of creating
+                   new ones.
+    :type shared: :py:obj:`tuple` or :py:obj:`None`
+    :returns: A list of bound sockets and TLS contexts, as returned by
+              :func:`server`.
+    :rtype: :py:obj:`list`
+    :raises BlackholeRuntimeException: When a socket cannot be bound.
+    """
+    if shared is None:
+        shared = contexts(use_tls=use_tls, starttls=starttls)
+    ctx, starttls_ctx = shared
+    socks = []
+    try:
+        for _ in range(count):
+            sock = _socket(addr, port, family, flags)
+            socks.append({"sock": sock, "ssl": ctx, "starttls": starttls_ctx})
+    except BlackholeRuntimeException:
+        for sock in socks:
+            sock["sock"].close()
+        raise
+    return socks
 
 
 def pid_permissions():
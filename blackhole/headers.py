@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Parse the headers of a message as it is received."""
+
+
+import logging
+
+
+__all__ = ("HeaderParser",)
+"""Tuple all the things."""
+
+
+logger = logging.getLogger("blackhole.headers")
+
+
+MAX_LINE_LENGTH = 998
+"""The longest header line allowed by RFC 5322, without it's line ending."""
+
+
+class HeaderParser:
+    """
+    An incremental parser for the header section of a message.
+
+    Lines are fed in as they are received. Folded headers are unfolded and
+    headers whose names are not wanted are skipped without decoding their
+    values.
+    The header section ends at the first empty line, the end of the message
+    or the first line that is not a header, as described in
+    `RFC 5322 <https://tools.ietf.org/html/rfc5322#section-2.2>`_.
+    """
+
+    def __init__(self, names):
+        """
+        Initialise the parser.
+
+        :param names: The lower case names of the headers to keep.
+        :type names: :py:obj:`tuple` or :py:obj:`frozenset`
+        """
+        self.names = frozenset(names)
+        self.headers = []
+        self.done = False
+        self._pending = None
+        self._partial = b""
+
+    def feed(self, line):
+        """
+        Parse a line of the message.
+
+        :param bytes line: A line of the message, including it's line ending.
+        :returns: ``True`` when the line ended the header section.
+        :rtype: :py:obj:`bool`
+        """
+        if line[:1] in (b" ", b"\t"):
+            if self._pending is not None:
+                self._pending.append(line.strip())
+            return False
+        self._flush()
+        name, colon, __ = line.partition(b":")
+        name = name.rstrip().lower()
+        if not colon or not name or b" " in name or b"\t" in name:
+            self.done = True
+            return True
+        if name.decode("ascii", "replace") in self.names:
+            self._pending = [line.rstrip(b"\r\n")]
+        return False
+
+    def feed_bytes(self, data):
+        """
+        Parse part of a message that may start or end part way through a line.
+
+        The end of a line that is split between calls is held until the next
+        call. A line longer than :const:`MAX_LINE_LENGTH` ends the header
+        section.
+
+        :param bytes data: Part of the message.
+        :returns: ``True`` when the data ended the header section.
+        :rtype: :py:obj:`bool`
+        """
+        if self.done:
+            return False
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            if self.feed(line + b"\n"):
+                self._partial = b""
+                return True
+        if len(self._partial) > MAX_LINE_LENGTH:
+            self._partial = b""
+            self._flush()
+            self.done = True
+            return True
+        return False
+
+    def finish(self):
+        """
+        End the message.
+
+        :returns: ``True`` when the header section had not already ended.
+        :rtype: :py:obj:`bool`
+        """
+        if self.done:
+            return False
+        if self._partial:
+            self.feed(self._partial)
+            self._partial = b""
+        self._flush()
+        self.done = True
+        return True
+
+    def _flush(self):
+        """Keep the header being unfolded, if it was wanted."""
+        if self._pending is None:
+            return
+        header = b" ".join(self._pending).decode("utf-8", "replace")
+        self.headers.append(header)
+        self._pending = None
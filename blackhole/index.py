@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Index captured messages by Message-ID, sender and recipient."""
+
+
+import logging
+import os
+import sqlite3
+
+
+__all__ = ("CaptureIndex",)
+"""Tuple all the things."""
+
+
+logger = logging.getLogger("blackhole.index")
+
+
+INDEX_NAME = "index.sqlite"
+"""The name of the index file in the capture directory."""
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS messages ("
+    "id INTEGER PRIMARY KEY, message_id TEXT, mail_from TEXT, "
+    "timestamp REAL, code INTEGER, location TEXT, offset INTEGER, "
+    "length INTEGER)",
+    "CREATE TABLE IF NOT EXISTS recipients ("
+    "message INTEGER NOT NULL, rcpt TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS messages_message_id "
+    "ON messages (message_id)",
+    "CREATE INDEX IF NOT EXISTS messages_mail_from "
+    "ON messages (mail_from, timestamp)",
+    "CREATE INDEX IF NOT EXISTS messages_timestamp ON messages (timestamp)",
+    "CREATE INDEX IF NOT EXISTS recipients_rcpt "
+    "ON recipients (rcpt, message)",
+    "CREATE INDEX IF NOT EXISTS recipients_message " "ON recipients (message)",
+)
+"""Tables and indexes, every lookup is answered from a B-tree index."""
+
+COLUMNS = (
+    "id",
+    "message_id",
+    "mail_from",
+    "timestamp",
+    "code",
+    "location",
+    "offset",
+    "length",
+)
+"""The columns returned for each message."""
+
+
+class CaptureIndex:
+    """
+    An SQLite index of captured messages.
+
+    Every child adds the messages in each batch it writes in a single
+    transaction. The database uses write-ahead logging so lookups are
+    never blocked by a child adding a batch.
+
+    Each message records where it was written, ``location`` is a segment
+    name and ``offset`` the position of the record in the uncompressed
+    segment, or for a Maildir, the message's unique file name with
+    ``offset`` set to :py:obj:`None`, see
+    :func:`blackhole.capture.maildir_path`.
+
+    A connection is opened on first use, by the thread using it.
+    """
+
+    timeout = 30
+    """Seconds to wait for another writer to finish a batch."""
+
+    def __init__(self, path):
+        """
+        Initialise the index.
+
+        :param str path: The path to the index file.
+        """
+        self.path = path
+        self._conn = None
+
+    @classmethod
+    def for_directory(cls, directory):
+        """
+        The index for a capture directory.
+
+        :param str directory: The capture directory.
+        :returns: The index.
+        :rtype: :class:`CaptureIndex`
+        """
+        return cls(os.path.join(directory, INDEX_NAME))
+
+    @property
+    def conn(self):
+        """
+        The connection to the index, created if it does not exist.
+
+        :rtype: :py:class:`sqlite3.Connection`
+        """
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    def add(self, entries):
+        """
+        Add a batch of messages in a single transaction.
+
+        :param list entries: Metadata, location, offset and length tuples.
+        """
+        if not entries:
+            return
+        with self.conn as conn:
+            for metadata, location, offset, length in entries:
+                cursor = conn.execute(
+                    "INSERT INTO messages (message_id, mail_from, timestamp, "
+                    "code, location, offset, length) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        metadata["message_id"],
+                        metadata["mail_from"],
+                        metadata["timestamp"],
+                        metadata["code"],
+                        location,
+                        offset,
+                        length,
+                    ),
+                )
+                conn.executemany(
+                    "INSERT INTO recipients (message, rcpt) VALUES (?, ?)",
+                    [(cursor.lastrowid, rcpt) for rcpt in metadata["rcpt_to"]],
+                )
+
+    def lookup(
+        self,
+        message_id=None,
+        mail_from=None,
+        rcpt_to=None,
+        since=None,
+        until=None,
+        after=None,
+        limit=100,
+    ):
+        """
+        Find captured messages.
+
+        Every criteria given must match and every matching message is
+        returned, up to ``limit``, in the order they were indexed.
+
+        :param message_id: The message id sent in the ``queued as`` response,
+                           including angle brackets. Each message received
+                           in a session has it's own, see
+                           :meth:`blackhole.smtp.Smtp.finish_transaction`.
+        :type message_id: :py:obj:`str` or :py:obj:`None`
+        :param mail_from: The envelope sender.
+        :type mail_from: :py:obj:`str` or :py:obj:`None`
+        :param rcpt_to: An envelope recipient.
+        :type rcpt_to: :py:obj:`str` or :py:obj:`None`
+        :param since: Only messages received at or after this UNIX time.
+        :type since: :py:obj:`float` or :py:obj:`None`
+        :param until: Only messages received before this UNIX time.
+        :type until: :py:obj:`float` or :py:obj:`None`
+        :param after: Only messages indexed after the message with this id,
+                      for paging through results.
+        :type after: :py:obj:`int` or :py:obj:`None`
+        :param int limit: The maximum number of messages to return.
+        :returns: A dictionary for each message, including it's recipients.
+        :rtype: :py:obj:`list`
+        """
+        clauses, params = [], []
+        for column, value in (
+            ("message_id = ?", message_id),
+            ("mail_from = ?", mail_from),
+            ("timestamp >= ?", since),
+            ("timestamp < ?", until),
+            ("id > ?", after),
+        ):
+            if value is not None:
+                clauses.append(column)
+                params.append(value)
+        if rcpt_to is not None:
+            clauses.append(
+                "id IN (SELECT message FROM recipients WHERE rcpt = ?)"
+            )
+            params.append(rcpt_to)
+        return self._select(clauses, params, limit)
+
+    def get(self, ident):
+        """
+        Get a captured message by it's id in the index.
+
+        :param int ident: The message's ``id``.
+        :returns: The message, including it's recipients, or :py:obj:`None`.
+        :rtype: :py:obj:`dict` or :py:obj:`None`
+        """
+        messages = self._select(["id = ?"], [ident], 1)
+        return messages[0] if messages else None
+
+    def _select(self, clauses, params, limit):
+        """
+        Select messages and their recipients.
+
+        :param list clauses: SQL conditions that must all match.
+        :param list params: Values for the conditions.
+        :param int limit: The maximum number of messages to return.
+        :returns: A dictionary for each message.
+        :rtype: :py:obj:`list`
+        """
+        sql = "SELECT {0} FROM messages".format(", ".join(COLUMNS))
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id LIMIT ?"
+        messages = [
+            dict(zip(COLUMNS, row))
+            for row in self.conn.execute(sql, params + [limit])
+        ]
+        for message in messages:
+            message["rcpt_to"] = [
+                row[0]
+                for row in self.conn.execute(
+                    "SELECT rcpt FROM recipients WHERE message = ? "
+                    "ORDER BY rowid",
+                    (message["id"],),
+                )
+            ]
+        return messages
+
+    def close(self):
+        """Close the connection to the index."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
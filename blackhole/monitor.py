@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Event loop lag and slow callback monitoring."""
+
+
+import logging
+import os
+import sys
+import threading
+import time
+
+from .smtp import Smtp
+
+
+__all__ = ("LoopMonitor",)
+"""Tuple all the things."""
+
+
+logger = logging.getLogger("blackhole.monitor")
+
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoopMonitor:
+    """
+    Monitor an event loop for lag and slow callbacks.
+
+    A timer scheduled with :py:meth:`asyncio.AbstractEventLoop.call_later`
+    measures how late the loop runs it, that lateness is recorded in the
+    ``loop.lag`` histogram. A watchdog thread notices when the timer has not
+    run for longer than the threshold and captures the stack of the event loop
+    thread, so the callback blocking the loop and the connection it was
+    serving can be logged once the loop recovers.
+
+    The watchdog only reads the loop thread's stack, statistics and logs are
+    always written from the event loop itself.
+    """
+
+    interval = 0.1
+    """How often, in seconds, lag is sampled."""
+
+    log_interval = 10
+    """Minimum number of seconds between slow callback log messages."""
+
+    def __init__(self, loop, stats, threshold):
+        """
+        Initialise the monitor.
+
+        :param loop: The event loop to monitor.
+        :type loop: :py:class:`asyncio.unix_events._UnixSelectorEventLoop`
+        :param stats: Where lag and slow callbacks are recorded.
+        :type stats: :class:`blackhole.stats.Stats`
+        :param float threshold: Lag, in seconds, above which a callback is
+                                considered slow.
+        """
+        self.loop = loop
+        self.stats = stats
+        self.threshold = threshold
+        self._running = False
+        self._handle = None
+        self._expected = None
+        self._beat = time.monotonic()
+        self._report = None
+        self._last_log = None
+        self._suppressed = 0
+        self._thread_id = None
+        self._watchdog = None
+
+    def start(self):
+        """
+        Start sampling and the watchdog thread.
+
+        Must be called from the event loop thread.
+        """
+        if self._running:
+            return
+        self._running = True
+        self._thread_id = threading.get_ident()
+        self.loop.slow_callback_duration = self.threshold
+        self._schedule()
+        self._watchdog = threading.Thread(
+            target=self._watch, name="blackhole-loop-monitor", daemon=True
+        )
+        self._watchdog.start()
+
+    def stop(self):
+        """Stop sampling, the watchdog thread exits on it's next check."""
+        self._running = False
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _schedule(self):
+        self._beat = time.monotonic()
+        self._expected = self.loop.time() + self.interval
+        self._handle = self.loop.call_later(self.interval, self._sample)
+
+    def _sample(self):
+        """Record how late this sample ran and report any slow callback."""
+        lag = max(self.loop.time() - self._expected, 0)
+        self.stats.record("loop.lag", lag)
+        report, self._report = self._report, None
+        if lag >= self.threshold:
+            self.stats.incr("loop.slow_callbacks")
+            self._log(lag, report)
+        if self._running:
+            self._schedule()
+
+    def _log(self, lag, report):
+        """
+        Log a slow callback, at most once every :attr:`log_interval`.
+
+        :param float lag: How late the loop was, in seconds.
+        :param report: What the loop was doing when the stall was noticed.
+        :type report: :py:obj:`dict` or :py:obj:`None`
+        """
+        now = time.monotonic()
+        if (
+            self._last_log is not None
+            and now - self._last_log < self.log_interval
+        ):
+            self._suppressed += 1
+            return
+        self._last_log = now
+        suppressed, self._suppressed = self._suppressed, 0
+        if report is None:
+            report = {"handler": "unknown", "where": "unknown", "state": ""}
+        logger.warning(
+            "Event loop blocked for %.3f seconds by %s at %s %s "
+            "(%s similar messages suppressed)",
+            lag,
+            report["handler"],
+            report["where"],
+            report["state"],
+            suppressed,
+        )
+
+    def _watch(self):
+        """Watch for the sampler falling behind, runs in a thread."""
+        period = max(self.threshold / 4, 0.001)
+        captured_for = None
+        while self._running:
+            time.sleep(period)
+            beat = self._beat
+            overdue = time.monotonic() - beat - self.interval
+            if overdue < self.threshold or captured_for == beat:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            self._report = self.describe(frame)
+            captured_for = beat
+
+    @staticmethod
+    def describe(frame):
+        """
+        Describe what a stack is doing.
+
+        :param frame: The innermost frame of the stack.
+        :type frame: :py:obj:`frame`
+        :returns: The innermost SMTP handler (or blackhole function), where
+                  the stack currently is and the state of the connection
+                  being handled.
+        :rtype: :py:obj:`dict`
+        """
+        where = "{0}:{1} in {2}".format(
+            frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name
+        )
+        handler, state = None, ""
+        while frame is not None:
+            code = frame.f_code
+            obj = frame.f_locals.get("self")
+            if handler is None and code.co_filename.startswith(_PACKAGE_DIR):
+                handler = code.co_name
+                if obj is not None:
+                    handler = "{0}.{1}".format(type(obj).__name__, handler)
+            if isinstance(obj, Smtp):
+                state = LoopMonitor.connection_state(obj)
+                break
+            frame = frame.f_back
+        return {
+            "handler": handler or "unknown",
+            "where": where,
+            "state": state,
+        }
+
+    @staticmethod
+    def connection_state(smtp):
+        """
+        Describe the state of an SMTP connection.
+
+        :param smtp: The connection.
+        :type smtp: :class:`blackhole.smtp.Smtp`
+        :returns: The peer and the last command received.
+        :rtype: :py:obj:`str`
+        """
+        transport = getattr(smtp, "transport", None)
+        peer = None
+        if transport is not None:
+            peer = transport.get_extra_info("peername")
+        line = getattr(smtp, "_line", "")
+        if len(line) > 40:
+            line = line[:40] + "..."
+        return "peer={0} line={1!r}".format(peer, line)
@@ -27,11 +27,19 @@
 
 import asyncio
 import logging
+import socket
 
 from .config import Config
 
 
-__all__ = ("StreamReaderProtocol", "PING", "PONG")
+__all__ = (
+    "StreamReaderProtocol",
+    "PING",
+    "PONG",
+    "STATS",
+    "TICKET_KEYS",
+    "TLS_RELOAD",
+)
 """Tuple all the things."""
 
 
@@ -44,6 +52,29 @@ PING = b"x01"
 PONG = b"x02"
 """Protocol message used by the worker and child processes to communicate."""
 
+STATS = b"x03"
+"""
+Protocol message used by a child to send statistics to it's worker.
+
+The message is followed by the length of the payload as a 4 byte, big endian
+unsigned integer and then the payload itself.
+"""
+
+TICKET_KEYS = b"x04"
+"""
+Protocol message used by a worker to send TLS session ticket keys to it's
+child.
+
+The message is followed by the length of the keys as a 4 byte, big endian
+unsigned integer and then the keys themselves.
+"""
+
+TLS_RELOAD = b"x05"
+"""
+Protocol message used by a worker to tell it's child to reload the TLS
+certificate and key.
+"""
+
 
 class StreamReaderProtocol(asyncio.StreamReaderProtocol):
     """The class responsible for handling connections commands."""
@@ -81,8 +112,13 @@ class StreamReaderProtocol(asyncio.StreamReaderProtocol):
         # Ideally this would use transport.get_extra_info('sockname') but that
         # crashes the child process for some weird reason. Getting the socket
         # and interacting directly does not cause a crash, hence...
-        sock_name = sock.getsockname()
-        flags = self.config.flags_from_listener(sock_name[0], sock_name[1])
+        flags = self.config.flags_from_sockname(sock.getsockname())
+        self._proto = flags.get("proto", "smtp")
+        if "nodelay" in flags:
+            sock.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, int(flags["nodelay"])
+            )
+        flags = {k: v for k, v in flags.items() if k in ("mode", "delay")}
         if len(flags.keys()) > 0:
             self._flags = flags
             self._disable_dynamic_switching = True
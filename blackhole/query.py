@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Serve captured messages over a local HTTP API."""
+
+
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import json
+import logging
+import lzma
+import os
+import signal
+import struct
+import urllib.parse
+import zlib
+
+from .capture import CODECS, RECORD_HEADER, maildir_path, open_segment
+from .config import Config
+from .index import CaptureIndex
+from .utils import get_version, use_uvloop
+
+
+__all__ = ("QueryServer", "parse_query_args", "run_query")
+"""Tuple all the things."""
+
+use_uvloop()
+
+
+logger = logging.getLogger("blackhole.query")
+
+
+STATUSES = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+"""The HTTP status codes used and their reasons."""
+
+BODY_ERRORS = (OSError, EOFError, struct.error, lzma.LZMAError, zlib.error)
+"""Errors raised reading a truncated or corrupt message body."""
+
+MAX_LIMIT = 1000
+"""The most messages returned by a single request."""
+
+CHUNK_SIZE = 65536
+"""Bytes read at a time when a message body cannot be sent with sendfile."""
+
+
+def parse_query_args(args):
+    """
+    Parse arguments from the command line for the query API.
+
+    :param list args: Command line arguments.
+    :returns: Parsed command line arguments.
+    :rtype: :py:class:`argparse.Namespace`
+    """
+    description = (
+        "Serve a local HTTP API to list, filter and download messages "
+        "captured by blackhole. Requires capture_index."
+    )
+    parser = argparse.ArgumentParser(
+        "blackhole-query", description=description
+    )
+    parser.add_argument(
+        "-v", "--version", action="version", version=get_version()
+    )
+    parser.add_argument(
+        "-c",
+        "--conf",
+        type=str,
+        dest="config_file",
+        metavar="FILE",
+        help="read capture_dir from a blackhole configuration file",
+    )
+    parser.add_argument(
+        "-d",
+        "--dir",
+        type=str,
+        dest="capture_dir",
+        metavar="DIR",
+        help="the capture directory, overrides capture_dir",
+    )
+    parser.add_argument(
+        "-H",
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="the address to listen on. Default: 127.0.0.1",
+    )
+    parser.add_argument(
+        "-p",
+        "--port",
+        type=int,
+        default=8025,
+        help="the port to listen on. Default: 8025",
+    )
+    parser.add_argument(
+        "-u",
+        "--unix",
+        type=str,
+        metavar="PATH",
+        help="listen on a UNIX socket instead of a TCP port",
+    )
+    return parser.parse_args(args)
+
+
+class QueryServer:
+    """
+    A small HTTP/1.1 API for captured messages.
+
+    Runs in it's own process, separate from the SMTP workers, and reads the
+    index kept by :class:`blackhole.index.CaptureIndex`.
+
+    ``GET /messages`` lists messages, filtered by the ``message_id``,
+    ``mail_from``, ``rcpt_to``, ``since`` and ``until`` query parameters.
+    At most ``limit`` messages are returned, followed by a ``next`` cursor
+    to pass as ``cursor`` to get the next page, :py:obj:`None` on the last
+    page.
+
+    ``GET /messages/<id>`` returns a single message and
+    ``GET /messages/<id>/body`` the message itself. Bodies in uncompressed
+    segments and Maildirs are sent with :py:meth:`asyncio.loop.sendfile`,
+    bodies in compressed segments are decompressed as they are sent, as are
+    uncompressed bodies when the event loop does not support sendfile.
+
+    Index lookups wait on SQLite, for up to
+    :attr:`blackhole.index.CaptureIndex.timeout` seconds while a child adds
+    a batch, so they run in a thread rather than on the event loop. A single
+    thread is used, the index's connection belongs to the thread that
+    opened it.
+    """
+
+    def __init__(self, directory, loop=None):
+        """
+        Initialise the API.
+
+        :param str directory: The capture directory.
+        :param loop: The event loop to use.
+        :type loop: :py:obj:`None` or
+                    :py:class:`asyncio.unix_events._UnixSelectorEventLoop`
+        """
+        self.directory = directory
+        self.loop = loop if loop is not None else asyncio.get_event_loop()
+        self.index = CaptureIndex.for_directory(directory)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    async def query(self, func, *args, **kwargs):
+        """
+        Call an index method, or read a message, in the index's thread.
+
+        :param func: A method of :attr:`index` or a blocking file operation.
+        :returns: What the method returns.
+        """
+        return await self.loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def close(self):
+        """Close the index and stop it's thread."""
+        self._executor.submit(self.index.close).result()
+        self._executor.shutdown()
+
+    async def handle(self, reader, writer):
+        """
+        Handle requests from a client until it disconnects.
+
+        :param asyncio.StreamReader reader: The client's stream reader.
+        :param asyncio.StreamWriter writer: The client's stream writer.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, __, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip().lower()
+                if len(parts) != 3:
+                    await self.respond(writer, 400, {"error": "Bad request"})
+                    break
+                method, target, version = parts
+                await self.dispatch(writer, method, target)
+                if (
+                    version == "HTTP/1.0"
+                    or headers.get("connection") == "close"
+                ):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, writer, method, target):
+        """
+        Send the response for a request.
+
+        :param asyncio.StreamWriter writer: The client's stream writer.
+        :param str method: The request method.
+        :param str target: The request path and query string.
+        """
+        url = urllib.parse.urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        if not parts or parts[0] != "messages" or len(parts) > 3:
+            await self.respond(writer, 404, {"error": "Not found"})
+            return
+        if method != "GET":
+            await self.respond(writer, 405, {"error": "Method not allowed"})
+            return
+        if not os.path.exists(self.index.path):
+            await self.respond(
+                writer, 503, {"error": "Captured messages are not indexed"}
+            )
+            return
+        if len(parts) == 1:
+            query = urllib.parse.parse_qs(url.query)
+            await self.list_messages(writer, query)
+            return
+        message = None
+        if parts[1].isdigit():
+            message = await self.query(self.index.get, int(parts[1]))
+        if message is None or (len(parts) == 3 and parts[2] != "body"):
+            await self.respond(writer, 404, {"error": "Not found"})
+        elif len(parts) == 3:
+            await self.send_body(writer, message)
+        else:
+            await self.respond(writer, 200, message)
+
+    async def list_messages(self, writer, query):
+        """
+        Send a page of messages matching a query.
+
+        :param asyncio.StreamWriter writer: The client's stream writer.
+        :param dict query: The parsed query string.
+        """
+        params = {k: v[-1] for k, v in query.items()}
+        try:
+            limit = min(int(params.get("limit", 100)), MAX_LIMIT)
+            after = params.get("cursor")
+            after = int(after) if after else None
+            since, until = params.get("since"), params.get("until")
+            since = float(since) if since else None
+            until = float(until) if until else None
+        except ValueError:
+            await self.respond(writer, 400, {"error": "Invalid parameter"})
+            return
+        if limit < 1:
+            await self.respond(writer, 400, {"error": "Invalid parameter"})
+            return
+        messages = await self.query(
+            self.index.lookup,
+            message_id=params.get("message_id"),
+            mail_from=params.get("mail_from"),
+            rcpt_to=params.get("rcpt_to"),
+            since=since,
+            until=until,
+            after=after,
+            limit=limit,
+        )
+        cursor = None
+        if len(messages) == limit:
+            cursor = str(messages[-1]["id"])
+        await self.respond(writer, 200, {"messages": messages, "next": cursor})
+
+    async def respond(self, writer, status, body):
+        """
+        Send a JSON response.
+
+        :param asyncio.StreamWriter writer: The client's stream writer.
+        :param int status: The HTTP status code.
+        :param dict body: The response, encoded as JSON.
+        """
+        data = json.dumps(body).encode("utf-8")
+        self.send_headers(writer, status, "application/json", len(data))
+        writer.write(data)
+        await writer.drain()
+
+    def send_headers(self, writer, status, content_type, length):
+        """
+        Write the status line and headers of a response.
+
+        :param asyncio.StreamWriter writer: The client's stream writer.
+        :param int status: The HTTP status code.
+        :param str content_type: The type of the response body.
+        :param int length: The length of the response body.
+        """
+        head = (
+            "HTTP/1.1 {0} {1}\r\nContent-Type: {2}\r\n"
+            "Content-Length: {3}\r\n\r\n"
+        ).format(status, STATUSES[status], content_type, length)
+        writer.write(head.encode("latin-1"))
+
+    def locate_body(self, message):
+        """
+        Open the file a message is stored in at the start of it's body.
+
+        :param dict message: A message from the index.
+        :returns: The open file, whether it is compressed and the length of
+                  the body.
+        :rtype: :py:obj:`tuple`
+        """
+        if message["offset"] is None:
+            path = maildir_path(self.directory, message["location"])
+            return open(path, "rb"), False, message["length"]
+        path = os.path.join(self.directory, message["location"])
+        try:
+            body = open(path, "rb")
+            compressed = False
+        except FileNotFoundError:
+            for ext, __ in CODECS.values():
+                if os.path.exists(path + ext):
+                    path = path + ext
+                    break
+            body = open_segment(path)
+            compressed = True
+        body.seek(message["offset"])
+        meta_len, payload_len = RECORD_HEADER.unpack(
+            body.read(RECORD_HEADER.size)
+        )
+        body.seek(meta_len, os.SEEK_CUR)
+        return body, compressed, payload_len
+
+    async def send_body(self, writer, message):
+        """
+        Stream a message's body to the client.
+
+        Uncompressed bodies are sent with sendfile, falling back to reading
+        the body in chunks when the event loop cannot use it. Loops raise a
+        :py:exc:`RuntimeError` then, uvloop raises it's subclass
+        :py:exc:`NotImplementedError`.
+
+        Opening, seeking, which decompresses compressed segments, and reading
+        the body all run in the index's thread, see :meth:`query`.
+
+        :param asyncio.StreamWriter writer: The client's stream writer.
+        :param dict message: A message from the index.
+
+        .. note::
+
+           A missing body is sent a 404 response and an unreadable one a 500
+           response. When the body cannot be read in full once it's headers
+           have been sent, the connection is closed.
+        """
+        try:
+            body, compressed, length = await self.query(
+                self.locate_body, message
+            )
+        except FileNotFoundError:
+            await self.respond(writer, 404, {"error": "Not found"})
+            return
+        except BODY_ERRORS as err:
+            logger.error("Unable to read message %s: %s", message["id"], err)
+            await self.respond(
+                writer, 500, {"error": "Unable to read message"}
+            )
+            return
+        with body:
+            self.send_headers(writer, 200, "message/rfc822", length)
+            await writer.drain()
+            if not compressed and hasattr(self.loop, "sendfile"):
+                offset = body.tell()
+                try:
+                    await self.loop.sendfile(
+                        writer.transport, body, offset, length
+                    )
+                    return
+                except RuntimeError:
+                    body.seek(offset)
+            while length > 0:
+                try:
+                    chunk = await self.query(
+                        body.read, min(length, CHUNK_SIZE)
+                    )
+                except BODY_ERRORS as err:
+                    logger.error(
+                        "Unable to read message %s: %s", message["id"], err
+                    )
+                    writer.close()
+                    return
+                if not chunk:
+                    logger.error("Message %s is truncated", message["id"])
+                    writer.close()
+                    return
+                length -= len(chunk)
+                writer.write(chunk)
+                await writer.drain()
+
+
+def run_query(args, loop=None):
+    """
+    Serve the query API until interrupted.
+
+    :param argparse.Namespace args: Parsed arguments, see
+                                    :func:`parse_query_args`.
+    :param loop: The event loop to use.
+    :type loop: :py:obj:`None` or
+                :py:class:`asyncio.unix_events._UnixSelectorEventLoop`
+    :raises SystemExit: Exit code :py:obj:`os.EX_USAGE` when no capture
+                        directory is configured or :py:obj:`os.EX_OK` when
+                        the API stops.
+    """
+    directory = args.capture_dir
+    if directory is None and args.config_file is not None:
+        directory = Config(args.config_file).load().capture_dir
+    if directory is None:
+        logger.fatal("No capture directory, use --dir or --conf.")
+        raise SystemExit(os.EX_USAGE)
+    loop = loop if loop is not None else asyncio.get_event_loop()
+    api = QueryServer(directory, loop=loop)
+    if args.unix:
+        start = asyncio.start_unix_server(api.handle, path=args.unix)
+        where = args.unix
+    else:
+        start = asyncio.start_server(api.handle, args.host, args.port)
+        where = "{0}:{1}".format(args.host, args.port)
+    server = loop.run_until_complete(start)
+    loop.add_signal_handler(signal.SIGINT, loop.stop)
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    logger.info("Serving %s on %s", directory, where)
+    loop.run_forever()
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    api.close()
+    raise SystemExit(os.EX_OK)
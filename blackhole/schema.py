@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""The names, descriptions and validators of every configuration option."""
+
+
+import difflib
+
+
+__all__ = ("Option", "Schema")
+"""Tuple all the things."""
+
+
+class Option:
+    """A configuration option, it's default and validators."""
+
+    __slots__ = ("name", "kind", "default", "validators")
+
+    def __init__(self, name, kind, validators=(), default=None):
+        """
+        Initialise the option.
+
+        :param str name: The option's name in the configuration file.
+        :param str kind: A description of the value the option takes, i.e.
+                         ``int`` or ``int|auto``, shown by
+                         ``blackhole_config``. It is not used to parse values.
+        :param tuple validators: Names of the
+                                 :class:`blackhole.config.Config` methods
+                                 that validate the option.
+        :param default: The default value, taken from the configuration class
+                        when it is :py:obj:`None`.
+        """
+        self.name = name
+        self.kind = kind
+        self.validators = validators
+        self.default = default
+
+    def __repr__(self):
+        """
+        A representation of the option.
+
+        :returns: The option's name and type.
+        :rtype: :py:obj:`str`
+        """
+        return "<Option {0} ({1})>".format(self.name, self.kind)
+
+
+class Schema:
+    """
+    Every option allowed in a configuration file.
+
+    The schema is compiled once against the configuration class, looking up
+    option names is a dictionary lookup and the names of the validators to
+    run are collected in to a single tuple.
+
+    The schema is used to find invalid options, to list the validators
+    :meth:`blackhole.config.Config.test` runs and to summarise every option
+    in ``blackhole_config``. It does not parse or convert values, each
+    option's :class:`blackhole.config.Config` property does and
+    :attr:`Option.kind` only describes the value.
+
+    Validators are kept as method names and looked up on the configuration
+    when they run, so subclasses and patched methods are used.
+    :meth:`compile` checks that each one exists.
+    """
+
+    def __init__(self, options, checks=()):
+        """
+        Initialise the schema.
+
+        :param tuple options: :class:`Option` instances, in the order they
+                              are validated in.
+        :param tuple checks: Names of the methods that validate more than one
+                             option, run before any option's validators.
+        """
+        self.options = {option.name: option for option in options}
+        self.names = tuple(self.options)
+        self.checks = checks
+        self.validators = ()
+        self._valid = "'{0}' and '{1}'".format(
+            "', '".join(self.names[:-1]), self.names[-1]
+        )
+
+    def __contains__(self, name):
+        """
+        Whether an option is in the schema.
+
+        :param str name: The option name.
+        :returns: ``True`` when the option exists.
+        :rtype: :py:obj:`bool`
+        """
+        return name in self.options
+
+    def compile(self, cls):
+        """
+        Compile the schema against a configuration class.
+
+        Options without a default take it from the class's private attribute
+        of the same name, i.e. ``_workers``. The validators of every option
+        are collected, without duplicates, after the schema's checks.
+
+        :param type cls: The configuration class.
+        :returns: The schema.
+        :rtype: :class:`Schema`
+        :raises AttributeError: When an option or validator does not exist on
+                                the class.
+        """
+        validators = list(self.checks)
+        for option in self.options.values():
+            if not isinstance(getattr(cls, option.name), property):
+                msg = "{0} is not a property of {1}.".format(
+                    option.name, cls.__name__
+                )
+                raise AttributeError(msg)
+            if option.default is None:
+                option.default = getattr(cls, "_{0}".format(option.name))
+            for validator in option.validators:
+                if validator not in validators:
+                    validators.append(validator)
+        for validator in validators:
+            getattr(cls, validator)
+        self.validators = tuple(validators)
+        return self
+
+    def invalid(self, name):
+        """
+        Describe an option that is not in the schema.
+
+        :param str name: The option name.
+        :returns: An error message listing the valid options and, when there
+                  is one, the option that was most likely meant.
+        :rtype: :py:obj:`str`
+        """
+        msg = "Invalid configuration option '{0}'.".format(name)
+        matches = difflib.get_close_matches(name, self.names, n=1)
+        if matches:
+            msg += " Did you mean '{0}'?".format(matches[0])
+        return "{0}\n\nValid options are: {1}".format(msg, self._valid)
+
+    def describe(self):
+        """
+        Summarise every option, its type and default value.
+
+        :returns: One line per option.
+        :rtype: :py:obj:`list`
+        """
+        width = max(len(name) for name in self.names)
+        return [
+            "{0}  {1:<10}  {2}".format(
+                option.name.ljust(width), option.kind, option.default
+            )
+            for option in self.options.values()
+        ]
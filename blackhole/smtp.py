@@ -30,8 +30,13 @@ import base64
 import inspect
 import logging
 import random
+import re
+import time
 
+from .capture import CapturePolicy
+from .headers import HeaderParser
 from .protocols import StreamReaderProtocol
+from .stats import Stats
 from .utils import message_id
 
 
@@ -42,6 +47,17 @@ __all__ = ("Smtp",)
 logger = logging.getLogger("blackhole.smtp")
 
 
+SWITCH_HEADERS = ("x-blackhole-delay", "x-blackhole-mode")
+"""Headers that change how a message is handled, see :meth:`process_header`."""
+
+CHUNK_READ_SIZE = 65536
+"""The most bytes of a ``BDAT`` chunk read at a time."""
+
+CHUNK_SIZE = re.compile(r"[0-9]+")
+"""A ``BDAT`` chunk size, ASCII digits only as :py:meth:`str.isdigit` also
+accepts other scripts' digits and superscripts."""
+
+
 class Smtp(StreamReaderProtocol):
     """The class responsible for handling SMTP/SMTPS commands."""
 
@@ -71,6 +87,9 @@ class Smtp(StreamReaderProtocol):
     _flags = {}
     """Flags defined in each listen directive."""
 
+    _proto = "smtp"
+    """The protocol spoken on the listener, ``smtp`` or ``lmtp``."""
+
     _disable_dynamic_switching = False
     """
     This option disabled dynamic switching functionality.
@@ -85,7 +104,15 @@ class Smtp(StreamReaderProtocol):
     _failed_commands = 0
     """An internal counter of failed commands for a client."""
 
-    def __init__(self, clients, loop=None):
+    def __init__(
+        self,
+        clients,
+        loop=None,
+        stats=None,
+        tls_context=None,
+        capture=None,
+        capture_policy=None,
+    ):
         """
         Initialise the SMTP protocol.
 
@@ -93,6 +120,18 @@ class Smtp(StreamReaderProtocol):
         :param loop: The event loop to use.
         :type loop: :py:obj:`None` or
                     :py:class:`syncio.unix_events._UnixSelectorEventLoop`
+        :param stats: Statistics shared by all connections in this process.
+        :type stats: :py:obj:`None` or :class:`blackhole.stats.Stats`
+        :param tls_context: The TLS context used to upgrade a connection with
+                            STARTTLS.
+        :type tls_context: :py:obj:`None` or :py:class:`ssl.SSLContext`
+        :param capture: Where received messages are written to disk.
+        :type capture: :py:obj:`None` or
+                       :class:`blackhole.capture.BatchWriter`
+        :param capture_policy: Which messages are captured and how much of
+                               each, every message in full by default.
+        :type capture_policy: :py:obj:`None` or
+                              :class:`blackhole.capture.CapturePolicy`
 
         .. note::
 
@@ -100,6 +139,13 @@ class Smtp(StreamReaderProtocol):
            an RFC 2822 Message-ID.
         """
         super().__init__(clients, loop)
+        self.reset_transaction()
+        self.stats = stats if stats is not None else Stats()
+        self.tls_context = tls_context
+        self.capture = capture
+        self.capture_policy = (
+            capture_policy if capture_policy is not None else CapturePolicy()
+        )
         self.message_id = message_id(self.fqdn)
 
     def connection_made(self, transport):
@@ -112,9 +158,58 @@ class Smtp(StreamReaderProtocol):
         logger.debug("Peer connected")
         self.transport = transport
         self.flags_from_transport()
+        self.stats.incr("connections")
+        self.record_tls()
         self.connection_closed = False
         self._handler_coroutine = self.loop.create_task(self._handle_client())
 
+    @property
+    def lmtp(self):
+        """
+        Whether the connection speaks LMTP.
+
+        LMTP is enabled with a listener's ``proto=lmtp`` flag --
+        https://kura.github.io/blackhole/configuration.html#listen
+
+        :returns: ``True`` when the listener speaks LMTP.
+        :rtype: :py:obj:`bool`
+        """
+        return self._proto == "lmtp"
+
+    @property
+    def responses(self):
+        """
+        How many responses are sent for a received message.
+
+        :returns: The number of recipients on LMTP connections, otherwise 1.
+        :rtype: :py:obj:`int`
+        """
+        return len(self.rcpt_to) if self.lmtp else 1
+
+    @property
+    def tls_active(self):
+        """
+        Whether the connection is using TLS.
+
+        :returns: ``True`` for TLS listeners and upgraded STARTTLS
+                  connections.
+        :rtype: :py:obj:`bool`
+        """
+        return self.transport.get_extra_info("ssl_object") is not None
+
+    def record_tls(self):
+        """
+        Count a completed TLS handshake and whether the session was resumed.
+
+        Recorded in the ``tls.handshakes`` and ``tls.resumed`` counters.
+        """
+        ssl_object = self.transport.get_extra_info("ssl_object")
+        if ssl_object is None:
+            return
+        self.stats.incr("tls.handshakes")
+        if ssl_object.session_reused:
+            self.stats.incr("tls.resumed")
+
     async def push(self, code, msg):
         """
         Write a response code and message to the client.
@@ -131,6 +226,9 @@ class Smtp(StreamReaderProtocol):
 
         This method greets the client and then accepts and handles each line
         the client sends, passing off to the currect verb handler.
+
+        The time taken by each handler is recorded in a histogram named after
+        the handler, i.e. ``do_MAIL``.
         """
         await self.greet()
         while not self.connection_closed:
@@ -143,7 +241,11 @@ class Smtp(StreamReaderProtocol):
             self._line = line
             handler = self.lookup_handler(line)
             if handler:
+                start = time.perf_counter()
                 await handler()
+                self.stats.record(
+                    handler.__name__, time.perf_counter() - start
+                )
             else:
                 await self.push(502, "5.5.2 Command not recognised")
 
@@ -367,7 +469,8 @@ class Smtp(StreamReaderProtocol):
 
     async def greet(self):
         """Send a greeting to the client."""
-        await self.push(220, "{0} ESMTP".format(self.fqdn))
+        greeting = "LMTP" if self.lmtp else "ESMTP"
+        await self.push(220, "{0} {1}".format(self.fqdn, greeting))
 
     def get_help_members(self):
         """
@@ -403,7 +506,14 @@ class Smtp(StreamReaderProtocol):
         await self.push(250, "Syntax: HELO domain.tld")
 
     async def do_HELO(self):
-        """Send response to HELO verb."""
+        """
+        Send response to HELO verb.
+
+        LMTP listeners only accept :meth:`do_LHLO`.
+        """
+        if self.lmtp:
+            await self.do_UNKNOWN()
+            return
         await self.push(250, "OK")
 
     async def help_EHLO(self):
@@ -415,12 +525,44 @@ class Smtp(StreamReaderProtocol):
         await self.push(250, "Syntax: EHLO domain.tld")
 
     async def do_EHLO(self):
-        """Send response to EHLO verb."""
+        """
+        Send response to EHLO verb.
+
+        LMTP listeners only accept :meth:`do_LHLO`.
+        """
+        if self.lmtp:
+            await self.do_UNKNOWN()
+            return
+        await self._extensions()
+
+    async def help_LHLO(self):
+        """
+        Send help for the LHLO verb.
+
+        https://kura.github.io/blackhole/communicating-with-blackhole.html#help
+        """
+        await self.push(250, "Syntax: LHLO domain.tld")
+
+    async def do_LHLO(self):
+        """
+        Send response to LHLO verb.
+
+        LHLO replaces EHLO on LMTP listeners, as described in
+        `RFC 2033 <https://tools.ietf.org/html/rfc2033>`_. SMTP listeners
+        treat it as an unknown command.
+        """
+        if not self.lmtp:
+            await self.do_UNKNOWN()
+            return
+        await self._extensions()
+
+    async def _extensions(self):
+        """Send the server's name and supported extensions."""
         response = "250-{0}\r\n".format(self.fqdn).encode("utf-8")
         self._writer.write(response)
         logger.debug("SENT %s", response)
         auth = " ".join(self.get_auth_members())
-        responses = (
+        responses = [
             "250-HELP",
             "250-PIPELINING",
             "250-AUTH {0}".format(auth),
@@ -429,10 +571,14 @@ class Smtp(StreamReaderProtocol):
             "250-ETRN",
             "250-ENHANCEDSTATUSCODES",
             "250-8BITMIME",
+            "250-BINARYMIME",
+            "250-CHUNKING",
             "250-SMTPUTF8",
             "250-EXPN",
             "250 DSN",
-        )
+        ]
+        if self.starttls_available:
+            responses.insert(2, "250-STARTTLS")
         for response in responses:
             response = "{0}\r\n".format(response).encode("utf-8")
             logger.debug("SENT %s", response)
@@ -470,15 +616,71 @@ class Smtp(StreamReaderProtocol):
         else:
             await self.push(250, "2.1.0 OK")
 
+    def envelope_address(self):
+        """
+        Get the address from a ``MAIL FROM`` or ``RCPT TO`` command.
+
+        :returns: The address, without angle brackets.
+        :rtype: :py:obj:`str`
+        """
+        value = self._line.split(":", 1)[-1].strip()
+        if value.startswith("<") and ">" in value:
+            return value[1:].split(">", 1)[0]
+        return value.split(" ")[0]
+
+    def reset_transaction(self):
+        """Forget the sender and recipients of the current message."""
+        self.mail_from = None
+        self.rcpt_to = []
+        self.sampled = False
+        self.binarymime = False
+        self.chunks = []
+        self.chunks_size = 0
+        self.chunks_start = None
+        self.chunk_headers = None
+
+    def finish_transaction(self):
+        """
+        Forget a message that has been responded to.
+
+        A new message id is generated so each message received in a session
+        is queued, captured and indexed with a message id of it's own.
+        """
+        self.reset_transaction()
+        self.message_id = message_id(self.fqdn)
+
+    def sample_transaction(self):
+        """
+        Decide whether the transaction being started is captured.
+
+        Sampled transactions are counted in ``capture.sampled`` and the rest
+        in ``capture.skipped``.
+        """
+        if self.capture is None:
+            return
+        self.sampled = self.capture_policy.sample()
+        self.stats.incr(
+            "capture.sampled" if self.sampled else "capture.skipped"
+        )
+
     async def do_MAIL(self):
         """
         Send response to MAIL TO verb.
 
+        Starts a new mail transaction, the sender is remembered for
+        :meth:`capture_message` and the transaction is sampled with
+        :meth:`sample_transaction`.
+
         .. note::
 
            Checks to see if ``SIZE=`` is passed, pass function off to have it's
-           size handled.
+           size handled. ``BODY=BINARYMIME`` messages must be sent with
+           :meth:`do_BDAT`.
         """
+        self.reset_transaction()
+        self.mail_from = self.envelope_address()
+        self.binarymime = "body=binarymime" in self._line.lower()
+        self.sample_transaction()
         if "size=" in self._line.lower():
             await self._size_in_mail()
         else:
@@ -494,6 +696,7 @@ class Smtp(StreamReaderProtocol):
 
     async def do_RCPT(self):
         """Send response to RCPT TO verb."""
+        self.rcpt_to.append(self.envelope_address())
         await self.push(250, "2.1.5 OK")
 
     async def help_DATA(self):
@@ -513,7 +716,7 @@ class Smtp(StreamReaderProtocol):
 
         https://kura.github.io/blackhole/dynamic-switches.html
 
-        :param str line: An email header.
+        :param str line: An email header, unfolded.
         """
         logger.debug("HEADER RECV: %s", line)
         if self.config.dynamic_switch is False:
@@ -522,7 +725,7 @@ class Smtp(StreamReaderProtocol):
         if self._disable_dynamic_switching is True:
             logger.debug("Dynamic switches are disabled by flags option.")
             return
-        key, value = line.split(":")
+        key, value = line.split(":", 1)
         key, value = key.lower().strip(), value.lower().strip()
         if key == "x-blackhole-delay":
             self.delay = value
@@ -538,19 +741,101 @@ class Smtp(StreamReaderProtocol):
 
         Response mode is configured in configuration file and can be overridden
         by email headers, if enabled.
+
+        LMTP connections are sent a response for each recipient, each drawn
+        from the response mode separately.
+
+        :returns: The response codes sent.
+        :rtype: :py:obj:`list`
         """
         logger.debug("MODE: %s", self.mode)
-        if self.mode == "bounce":
-            key = random.choice(list(self._bounce_responses.keys()))
-            await self.push(key, self._bounce_responses[key])
-        elif self.mode == "random":
-            resps = {250: "2.0.0 OK: queued as {0}".format(self.message_id)}
-            resps.update(self._bounce_responses)
-            key = random.choice(list(resps.keys()))
-            await self.push(key, resps[key])
-        else:
-            msg = "2.0.0 OK: queued as {0}".format(self.message_id)
-            await self.push(250, msg)
+        codes = []
+        for __ in range(self.responses):
+            if self.mode == "bounce":
+                key = random.choice(list(self._bounce_responses.keys()))
+                msg = self._bounce_responses[key]
+            elif self.mode == "random":
+                resps = {
+                    250: "2.0.0 OK: queued as {0}".format(self.message_id)
+                }
+                resps.update(self._bounce_responses)
+                key = random.choice(list(resps.keys()))
+                msg = resps[key]
+            else:
+                key = 250
+                msg = "2.0.0 OK: queued as {0}".format(self.message_id)
+            await self.push(key, msg)
+            codes.append(key)
+        return codes
+
+    async def push_message_response(self, code, msg):
+        """
+        Send a response to a received message.
+
+        LMTP connections are sent the response once for each recipient.
+
+        :param int code: SMTP code, i.e. 552.
+        :param str msg: The message for the SMTP code.
+        """
+        for __ in range(self.responses):
+            await self.push(code, msg)
+
+    def capture_message(self, lines, codes):
+        """
+        Queue a received message to be written to disk.
+
+        The message is stored without the terminating ``.`` line and with
+        dot-stuffing removed, cut down by the capture policy, along with the
+        time, peer, envelope, message id, response code sent and the size of
+        the whole message. Captured messages are counted in the
+        ``capture.records`` and ``capture.bytes`` counters, messages that
+        were cut down in ``capture.truncated`` and messages the writer had no
+        room to queue in ``capture.dropped``.
+
+        Messages received over LMTP are stored with the response code sent
+        for the first recipient and ``rcpt_codes``, the code sent for each
+        recipient.
+
+        :param list lines: The lines received after DATA.
+        :param list codes: The response codes sent for the message.
+        """
+        payload = b"".join(
+            line[1:] if line.startswith(b".") else line for line in lines[:-1]
+        )
+        self.capture_payload(payload, codes)
+
+    def capture_payload(self, payload, codes):
+        """
+        Queue a received message to be written to disk.
+
+        See :meth:`capture_message`, messages received with :meth:`do_BDAT`
+        are captured as they were sent.
+
+        :param bytes payload: The message.
+        :param list codes: The response codes sent for the message.
+        """
+        size = len(payload)
+        payload, truncated = self.capture_policy.apply(payload)
+        peer = self.transport.get_extra_info("peername")
+        metadata = {
+            "timestamp": time.time(),
+            "peer": list(peer) if isinstance(peer, tuple) else peer,
+            "mail_from": self.mail_from,
+            "rcpt_to": self.rcpt_to,
+            "message_id": self.message_id,
+            "code": codes[0],
+            "size": size,
+            "truncated": truncated,
+        }
+        if self.lmtp:
+            metadata["rcpt_codes"] = codes
+        if not self.capture.write(metadata, payload):
+            self.stats.incr("capture.dropped")
+            return
+        if truncated:
+            self.stats.incr("capture.truncated")
+        self.stats.incr("capture.records")
+        self.stats.incr("capture.bytes", len(payload))
 
     async def do_DATA(self):
         r"""
@@ -564,38 +849,268 @@ class Smtp(StreamReaderProtocol):
         https://kura.github.io/blackhole/configuration.html#delay
         https://kura.github.io/blackhole/dynamic-switches.html#dynamic-delay-switches
 
+        Dynamic switch headers are read by a
+        :class:`blackhole.headers.HeaderParser` and handled by
+        :meth:`process_header` once the header section ends, lines after the
+        header section are not parsed. --
+        https://kura.github.io/blackhole/dynamic-switches.html
+
         This method implements restrictions on message sizes. --
         https://kura.github.io/blackhole/configuration.html#max-message-size
+
+        Messages that are not rejected for their size are captured to disk
+        when capturing is enabled and the transaction was sampled. --
+        https://kura.github.io/blackhole/configuration.html#capture-dir
+
+        The time taken to receive the message and the time taken to respond
+        after receiving it are recorded in the ``data.ingest`` and
+        ``data.response`` histograms.
+
+        ``DATA`` is refused with a 503 response during a ``BDAT`` transfer or
+        after ``MAIL FROM`` with ``BODY=BINARYMIME``, and on LMTP connections
+        without any recipients.
+
+        LMTP connections are sent a response for each recipient once the
+        message has been received, see :meth:`response_from_mode`.
         """
+        if (
+            self.binarymime
+            or self.chunk_headers is not None
+            or (self.lmtp and not self.rcpt_to)
+        ):
+            await self.push(503, "5.5.1 Bad sequence of commands")
+            return
         await self.push(354, "End data with <CR><LF>.<CR><LF>")
-        on_body = False
+        start = time.perf_counter()
+        headers = HeaderParser(SWITCH_HEADERS)
         msg = []
         while not self.connection_closed:
             line = await self.wait()
             logger.debug("RECV %s", line)
             msg.append(line)
-            if line.lower().startswith(b"x-blackhole") and on_body is False:
-                self.process_header(line.decode("utf-8").rstrip("\n"))
-            if line == b"\n":
-                on_body = True
+            if not headers.done and headers.feed(line):
+                for header in headers.headers:
+                    self.process_header(header)
             if line == b".\r\n":
                 break
+        end = time.perf_counter()
+        self.stats.record("data.ingest", end - start)
         if len(b"".join(msg)) > self.config.max_message_size:
             msg = []
-            await self.push(
+            await self.push_message_response(
                 552, "Message size exceeds fixed maximum message size"
             )
+            self.reset_transaction()
+            return
+        if self.delay:
+            logger.debug("DELAYING RESPONSE: %s seconds", self.delay)
+            await asyncio.sleep(self.delay)
+        codes = await self.response_from_mode()
+        self.stats.record("data.response", time.perf_counter() - end)
+        if self.sampled and msg and msg[-1] == b".\r\n":
+            self.capture_message(msg, codes)
+        self.finish_transaction()
+
+    async def help_BDAT(self):
+        """
+        Send help for the BDAT verb.
+
+        https://kura.github.io/blackhole/communicating-with-blackhole.html#help
+        """
+        await self.push(250, "Syntax: BDAT <size> [LAST]")
+
+    async def read_chunk(self, size, keep):
+        """
+        Read a ``BDAT`` chunk from the client.
+
+        The chunk is read :const:`CHUNK_READ_SIZE` bytes at a time and each
+        part is passed to the transaction's header parser. Parts are only
+        kept when ``keep`` is ``True``, otherwise they are discarded as they
+        are read.
+
+        :param int size: The size of the chunk in bytes.
+        :param bool keep: Whether to keep the chunk.
+        :returns: The parts of the chunk that were kept, :py:obj:`None` when
+                  the client disconnected or timed out.
+        :rtype: :py:obj:`list` or :py:obj:`None`
+        """
+        parts = []
+        while size > 0:
+            try:
+                data = await asyncio.wait_for(
+                    self._reader.readexactly(min(size, CHUNK_READ_SIZE)),
+                    self.config.timeout,
+                    loop=self.loop,
+                )
+            except asyncio.TimeoutError:
+                await self.timeout()
+                return None
+            except asyncio.IncompleteReadError:
+                await self.close()
+                return None
+            size -= len(data)
+            if self.chunk_headers.feed_bytes(data):
+                for header in self.chunk_headers.headers:
+                    self.process_header(header)
+            if keep:
+                parts.append(data)
+        return parts
+
+    async def do_BDAT(self):
+        """
+        Receive a chunk of a message with the ``BDAT`` verb.
+
+        Implements ``CHUNKING`` and ``BINARYMIME`` as described in
+        `RFC 3030 <https://tools.ietf.org/html/rfc3030>`_. Each chunk is read
+        with :meth:`read_chunk`, chunks are not dot-stuffed and are only kept
+        in memory when the transaction will be captured. The size of every
+        chunk in a transaction counts towards
+        https://kura.github.io/blackhole/configuration.html#max-message-size,
+        once it is exceeded the remaining chunks are discarded and each is
+        sent a 552 response.
+
+        The response to the ``LAST`` chunk is sent as in :meth:`do_DATA`.
+        LMTP connections without any recipients are sent a 503 response to
+        the ``LAST`` chunk.
+        """
+        parts = self._line.split()
+        last = len(parts) == 3 and parts[2].upper() == "LAST"
+        if len(parts) not in (2, 3) or not CHUNK_SIZE.fullmatch(parts[1]):
+            await self.push(501, "5.5.4 Syntax: BDAT <size> [LAST]")
+            return
+        if len(parts) == 3 and not last:
+            await self.push(501, "5.5.4 Syntax: BDAT <size> [LAST]")
             return
+        if self.chunk_headers is None:
+            self.chunk_headers = HeaderParser(SWITCH_HEADERS)
+            self.chunks_start = time.perf_counter()
+        size = int(parts[1])
+        self.chunks_size += size
+        too_large = self.chunks_size > self.config.max_message_size
+        chunk = await self.read_chunk(size, self.sampled and not too_large)
+        if chunk is None:
+            return
+        if too_large:
+            self.chunks = []
+            msg = "Message size exceeds fixed maximum message size"
+            if last:
+                await self.push_message_response(552, msg)
+                self.reset_transaction()
+            else:
+                await self.push(552, msg)
+            return
+        self.chunks.extend(chunk)
+        if not last:
+            await self.push(250, "2.0.0 {0} octets received".format(size))
+            return
+        if self.lmtp and not self.rcpt_to:
+            self.reset_transaction()
+            await self.push(503, "5.5.1 Bad sequence of commands")
+            return
+        if self.chunk_headers.finish():
+            for header in self.chunk_headers.headers:
+                self.process_header(header)
+        end = time.perf_counter()
+        self.stats.record("data.ingest", end - self.chunks_start)
         if self.delay:
             logger.debug("DELAYING RESPONSE: %s seconds", self.delay)
             await asyncio.sleep(self.delay)
-        await self.response_from_mode()
+        codes = await self.response_from_mode()
+        self.stats.record("data.response", time.perf_counter() - end)
+        if self.sampled:
+            self.capture_payload(b"".join(self.chunks), codes)
+        self.finish_transaction()
+
+    @property
+    def starttls_available(self):
+        """
+        Whether the connection can be upgraded with STARTTLS.
+
+        :returns: ``True`` when a TLS certificate and key are configured, the
+                  connection is not already using TLS and the event loop
+                  supports :py:meth:`asyncio.loop.start_tls`.
+        :rtype: :py:obj:`bool`
+        """
+        if self.tls_context is None or self.tls_active:
+            return False
+        return hasattr(self.loop, "start_tls")
 
     async def do_STARTTLS(self):
-        """STARTTLS is not implemented."""
-        # It's currently not possible to implement STARTTLS due to lack of
-        # support in asyncio. - https://bugs.python.org/review/23749/
-        await self.do_NOT_IMPLEMENTED()
+        """
+        Send response to the STARTTLS verb and upgrade the connection.
+
+        https://tools.ietf.org/html/rfc3207
+
+        .. note::
+
+           Returns ``500 Not implemented`` when STARTTLS is not available,
+           see :attr:`starttls_available`. Anything the client sent after
+           STARTTLS, before the TLS handshake, is discarded and the SMTP
+           session is reset, the client must send EHLO again.
+
+           Upgraded connections are counted in the ``tls.starttls`` counter
+           and failed handshakes in ``tls.starttls_failures``.
+        """
+        if self.tls_active:
+            await self.push(503, "5.5.1 TLS already active")
+            return
+        if not self.starttls_available:
+            await self.do_NOT_IMPLEMENTED()
+            return
+        if self._line.strip().upper() != "STARTTLS":
+            await self.push(501, "5.5.4 Syntax: STARTTLS")
+            return
+        await self.push(220, "2.0.0 Ready to start TLS")
+        try:
+            await self._start_tls()
+        except (OSError, asyncio.TimeoutError) as err:
+            logger.debug("STARTTLS handshake failed: %s", err)
+            self.stats.incr("tls.starttls_failures")
+            await self.close()
+            self.connection_closed = True
+            return
+        self.stats.incr("tls.starttls")
+        self.record_tls()
+        self.reset_session()
+
+    async def _start_tls(self):
+        """
+        Upgrade the connection's transport and streams to TLS.
+
+        :raises OSError: When the TLS handshake fails.
+        :raises asyncio.TimeoutError: When the TLS handshake times out.
+
+        .. note::
+
+           asyncio has no public API for swapping the transport under a
+           :py:class:`asyncio.StreamReaderProtocol` and it's streams, so this
+           touches their private state. The streams are always asyncio's own,
+           whichever event loop is in use. Tested against CPython 3.7 and 3.8,
+           the versions with :py:meth:`asyncio.loop.start_tls`, on both the
+           default event loop and uvloop.
+        """
+        # RFC 3207 section 4.2 -- plaintext pipelined after STARTTLS must not
+        # be processed once TLS is active.
+        self._reader._buffer.clear()
+        transport = await self.loop.start_tls(
+            self.transport, self, self.tls_context, server_side=True
+        )
+        self.transport, self._transport = transport, transport
+        self._writer._transport = transport
+        self._over_ssl = True
+
+    def reset_session(self):
+        """
+        Discard everything known about the client's SMTP session.
+
+        A new message id is generated, the mail transaction is discarded and
+        any delay or mode set by dynamic switches is cleared.
+        """
+        self.reset_transaction()
+        self.message_id = message_id(self.fqdn)
+        self._failed_commands = 0
+        self._delay = None
+        self._mode = None
 
     async def help_NOOP(self):
         """
@@ -621,8 +1136,10 @@ class Smtp(StreamReaderProtocol):
         """
         Send response to the RSET verb.
 
-        A new message id is generated and assigned.
+        A new message id is generated and assigned and the mail transaction is
+        discarded.
         """
+        self.reset_transaction()
         old_msg_id = self.message_id
         self.message_id = message_id(self.fqdn)
         logger.debug("%s is now %s", old_msg_id, self.message_id)
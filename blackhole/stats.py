@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""Provides latency histograms and counters for runtime statistics."""
+
+
+import array
+import json
+import math
+
+
+__all__ = ("Histogram", "Stats")
+"""Tuple all the things."""
+
+
+class Histogram:
+    """
+    A fixed size, log-linear latency histogram.
+
+    Values are recorded as whole microseconds in to a flat array of counters.
+    Values below ``2 ** sub_bucket_bits`` are counted exactly, every power of
+    two above that is split in to ``2 ** (sub_bucket_bits - 1)`` linear
+    sub-buckets. With the defaults this gives a worst case relative error of
+    ~3% for values up to ``2 ** 36`` microseconds (~19 hours) using 1024
+    counters, no matter how many values are recorded.
+
+    Histograms with the same layout can be merged, so histograms recorded in
+    each child process can be combined by the supervisor.
+    """
+
+    sub_bucket_bits = 6
+    """The number of bits of precision kept for each recorded value."""
+
+    highest_bits = 36
+    """Values larger than ``2 ** highest_bits - 1`` are clamped."""
+
+    def __init__(self):
+        """Initialise the histogram with all counters set to zero."""
+        self._half = 1 << (self.sub_bucket_bits - 1)
+        self._highest = (1 << self.highest_bits) - 1
+        size = self._index(self._highest) + 1
+        self.counts = array.array("Q", bytes(8 * size))
+        self.count = 0
+        self.max = 0
+
+    def _index(self, value):
+        """
+        Get the counter index for a value.
+
+        :param int value: A value in microseconds.
+        :returns: The index of the counter for the value.
+        :rtype: :py:obj:`int`
+        """
+        shift = value.bit_length() - self.sub_bucket_bits
+        if shift <= 0:
+            return value
+        return shift * self._half + (value >> shift)
+
+    def _highest_equivalent(self, index):
+        """
+        Get the largest value that is counted by the counter at an index.
+
+        :param int index: The index of a counter.
+        :returns: A value in microseconds.
+        :rtype: :py:obj:`int`
+        """
+        if index < 2 * self._half:
+            return index
+        shift = index // self._half - 1
+        sub_bucket = index % self._half + self._half
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, value):
+        """
+        Record a value.
+
+        :param int value: A value in microseconds. Negative values are
+                          recorded as ``0`` and values that are too large are
+                          clamped.
+        """
+        value = min(max(int(value), 0), self._highest)
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percentile):
+        """
+        Get the value at a percentile.
+
+        :param float percentile: A percentile between ``0`` and ``100``.
+        :returns: The value, in microseconds, that ``percentile`` percent of
+                  recorded values are less than or equal to. ``0`` if nothing
+                  has been recorded.
+        :rtype: :py:obj:`int`
+        """
+        if self.count == 0:
+            return 0
+        target = max(math.ceil(self.count * percentile / 100.0), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    def merge(self, other):
+        """
+        Add the counters from another histogram to this one.
+
+        :param Histogram other: The histogram to merge.
+        """
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        """
+        Summarise the histogram.
+
+        :returns: The count, p50, p99, p999 and maximum in microseconds.
+        :rtype: :py:obj:`dict`
+        """
+        return {
+            "count": self.count,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+            "max": self.max,
+        }
+
+    def to_dict(self):
+        """
+        Convert the histogram to a sparse, serialisable form.
+
+        :returns: Non-zero counters and the maximum recorded value.
+        :rtype: :py:obj:`dict`
+        """
+        counts = {
+            str(index): count
+            for index, count in enumerate(self.counts)
+            if count
+        }
+        return {"counts": counts, "max": self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create a histogram from the output of :meth:`Histogram.to_dict`.
+
+        :param dict data: The sparse histogram.
+        :returns: A histogram.
+        :rtype: :class:`Histogram`
+        """
+        histogram = cls()
+        for index, count in data["counts"].items():
+            histogram.counts[int(index)] = count
+            histogram.count += count
+        histogram.max = data["max"]
+        return histogram
+
+
+class Stats:
+    """
+    Named histograms and counters for a single process.
+
+    Each child process keeps a single instance of this class, the number of
+    histograms is bounded by the number of verb handlers so memory usage per
+    child is constant.
+    """
+
+    def __init__(self):
+        """Initialise empty statistics."""
+        self.histograms = {}
+        self.counters = {}
+
+    def record(self, name, seconds):
+        """
+        Record a duration in a named histogram.
+
+        :param str name: The histogram name.
+        :param float seconds: The duration in seconds.
+        """
+        try:
+            histogram = self.histograms[name]
+        except KeyError:
+            histogram = self.histograms[name] = Histogram()
+        histogram.record(seconds * 1000000)
+
+    def incr(self, name, value=1):
+        """
+        Increment a named counter.
+
+        :param str name: The counter name.
+        :param int value: The amount to increment by. Default: ``1``.
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other):
+        """
+        Add the histograms and counters from another instance to this one.
+
+        :param Stats other: The statistics to merge.
+        """
+        for name, histogram in other.histograms.items():
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].merge(histogram)
+        for name, value in other.counters.items():
+            self.incr(name, value)
+
+    def summary(self):
+        """
+        Summarise all histograms and counters.
+
+        :returns: A summary of each histogram and the value of each counter.
+        :rtype: :py:obj:`dict`
+        """
+        histograms = {
+            name: histogram.summary()
+            for name, histogram in self.histograms.items()
+        }
+        return {"histograms": histograms, "counters": dict(self.counters)}
+
+    def dumps(self):
+        """
+        Serialise the statistics so they can be sent to another process.
+
+        :returns: JSON encoded statistics.
+        :rtype: :py:obj:`bytes`
+        """
+        histograms = {
+            name: histogram.to_dict()
+            for name, histogram in self.histograms.items()
+        }
+        data = {"histograms": histograms, "counters": self.counters}
+        return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+    @classmethod
+    def loads(cls, data):
+        """
+        Create statistics from the output of :meth:`Stats.dumps`.
+
+        :param bytes data: JSON encoded statistics.
+        :returns: Statistics.
+        :rtype: :class:`Stats`
+        """
+        data = json.loads(data.decode("utf-8"))
+        stats = cls()
+        for name, histogram in data["histograms"].items():
+            stats.histograms[name] = Histogram.from_dict(histogram)
+        stats.counters.update(data["counters"])
+        return stats
@@ -29,11 +29,14 @@ import asyncio
 import logging
 import os
 import signal
+import socket
 
 from .config import Config
-from .control import server
+from .control import contexts, server, servers
 from .exceptions import BlackholeRuntimeException
-from .utils import Singleton
+from .stats import Stats
+from .tls import generate_ticket_keys, load_certificates, set_ticket_keys
+from .utils import Singleton, available_cpus, use_uvloop
 from .worker import Worker
 
 
@@ -46,6 +49,8 @@ except ImportError:
 __all__ = ("Supervisor",)
 """Tuple all the things."""
 
+use_uvloop()
+
 
 logger = logging.getLogger("blackhole.supervisor")
 
@@ -75,7 +80,10 @@ class Supervisor(metaclass=Singleton):
         self.config = Config()
         self.loop = loop if loop is not None else asyncio.get_event_loop()
         self.socks = []
+        self.worker_socks = None
+        self.pools = {}
         self.workers = []
+        self.tls_mtimes = None
         if setproctitle:
             setproctitle.setproctitle("blackhole: master")
         try:
@@ -85,22 +93,106 @@ class Supervisor(metaclass=Singleton):
             raise BlackholeRuntimeException()
 
     def generate_servers(self):
-        """Spawn all of the required sockets and TLS contexts."""
+        """
+        Spawn all of the required sockets and TLS contexts.
+
+        .. note::
+
+           When :attr:`blackhole.config.Config.reuse_port` is enabled, each
+           worker is given it's own socket for every listener instead of all
+           workers sharing one.
+
+           When :attr:`blackhole.config.Config.tls_workers` is set,
+           ``listen`` and ``tls_listen`` are served by separate pools of
+           workers, recorded in :attr:`pools`.
+        """
         logger.debug("Attaching sockets to the supervisor")
-        self.create_socket(self.config.listen)
         tls_conf = (self.config.tls_cert, self.config.tls_key)
-        if len(self.config.tls_listen) > 0 and all(tls_conf):
-            self.create_socket(self.config.tls_listen, use_tls=True)
+        use_tls = len(self.config.tls_listen) > 0 and all(tls_conf)
+        workers = self.config.workers
+        count = workers
+        if use_tls and self.config.tls_workers:
+            count = workers + self.config.tls_workers
+            self.pools = {
+                "listen": range(0, workers),
+                "tls_listen": range(workers, count),
+            }
+        if self.config.reuse_port or self.pools:
+            self.worker_socks = [[] for _ in range(count)]
+        self.create_socket(
+            self.config.listen,
+            starttls=all(tls_conf),
+            pool=self.pools.get("listen"),
+        )
+        if use_tls:
+            self.create_socket(
+                self.config.tls_listen,
+                use_tls=True,
+                pool=self.pools.get("tls_listen"),
+            )
+
+    def create_socket(
+        self, listeners, use_tls=False, starttls=False, pool=None
+    ):
+        """
+        Create supervisor socket.
 
-    def create_socket(self, listeners, use_tls=False):
-        """Create supervisor socket."""
-        msg = "Attaching %s:%s with flags %s"
+        Plaintext listeners are given a STARTTLS context when ``starttls`` is
+        set. Sockets are only given to the workers in ``pool``, or every
+        worker when it is :py:obj:`None`. Every listener shares the same TLS
+        and STARTTLS contexts.
+        """
+        shared = contexts(use_tls=use_tls, starttls=starttls)
+        msg = "Attaching %s with flags %s"
         if use_tls:
-            msg = "Attaching %s:%s (TLS) with flags %s"
+            msg = "Attaching %s (TLS) with flags %s"
         for host, port, family, flags in listeners:
-            aserver = server(host, port, family, use_tls=use_tls)
-            self.socks.append(aserver)
-            logger.debug(msg, host, port, flags)
+            name = "{0}:{1}".format(host, port)
+            if family == socket.AF_UNIX:
+                name = "unix:{0}".format(host)
+            if self.worker_socks is None:
+                aserver = server(
+                    host,
+                    port,
+                    family,
+                    use_tls=use_tls,
+                    flags=flags,
+                    starttls=starttls,
+                    shared=shared,
+                )
+                self.socks.append(aserver)
+                logger.debug(msg, name, flags)
+                continue
+            if pool is None:
+                pool = range(len(self.worker_socks))
+            count = len(pool)
+            if self.config.reuse_port and family != socket.AF_UNIX:
+                aservers = servers(
+                    host,
+                    port,
+                    family,
+                    count,
+                    use_tls=use_tls,
+                    flags=flags,
+                    starttls=starttls,
+                    shared=shared,
+                )
+                self.socks.extend(aservers)
+            else:
+                aserver = server(
+                    host,
+                    port,
+                    family,
+                    use_tls=use_tls,
+                    flags=flags,
+                    starttls=starttls,
+                    shared=shared,
+                )
+                self.socks.append(aserver)
+                aservers = [aserver] * count
+            for idx, aserver in zip(pool, aservers):
+                self.worker_socks[idx].append(aserver)
+            logger.debug(msg + " (%s workers)", name, flags, count)
 
     def run(self):
         """
@@ -109,17 +201,180 @@ class Supervisor(metaclass=Singleton):
         Attaches signals and runs the event loop.
         """
         self.start_workers()
+        if self.config.tls_ticket_rotation and self.tls_contexts():
+            self.loop.call_later(
+                self.config.tls_ticket_rotation, self.rotate_ticket_keys
+            )
+        if self.tls_contexts():
+            self.tls_mtimes = self.tls_file_mtimes()
+            if self.config.tls_reload_interval:
+                self.loop.call_later(
+                    self.config.tls_reload_interval, self.check_tls_files
+                )
+        signal.signal(signal.SIGHUP, self.request_tls_reload)
         signal.signal(signal.SIGTERM, self.stop)
         signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGUSR1, self.report_stats)
+        signal.signal(signal.SIGUSR2, self.profile_workers)
         self.loop.run_forever()
 
     def start_workers(self):
         """Start each worker and it's child process."""
         logger.debug("Starting workers")
-        for idx in range(self.config.workers):
+        self.set_ticket_keys(generate_ticket_keys())
+        supervisor_cpu, cpus = self.config.worker_cpus()
+        compress_cpus = None
+        if supervisor_cpu is not None:
+            # Forked processes inherit the pinning, record every CPU first so
+            # the children's compression processes can be moved back to them.
+            compress_cpus = available_cpus()
+            logger.debug("Pinning supervisor to CPU %s", supervisor_cpu)
+            os.sched_setaffinity(0, {supervisor_cpu})
+        for idx, cpu in enumerate(cpus):
             num = "{0}".format(idx + 1)
-            logger.debug("Creating worker: %s", num)
-            self.workers.append(Worker(num, self.socks, self.loop))
+            socks = self.socks
+            if self.worker_socks is not None:
+                socks = self.worker_socks[idx]
+            logger.debug("Creating worker: %s (CPU %s)", num, cpu)
+            self.workers.append(
+                Worker(num, socks, self.loop, cpu=cpu, cpus=compress_cpus)
+            )
+
+    def tls_contexts(self):
+        """
+        Every TLS and STARTTLS context used by a listener.
+
+        :returns: TLS contexts.
+        :rtype: :py:obj:`list`
+        """
+        contexts = {}
+        for sock in self.socks:
+            for ctx in (sock["ssl"], sock.get("starttls")):
+                if ctx:
+                    contexts[id(ctx)] = ctx
+        return list(contexts.values())
+
+    def set_ticket_keys(self, keys):
+        """
+        Set the TLS session ticket keys of every TLS context.
+
+        Children forked afterwards inherit these keys, so a session resumed
+        with a ticket issued by one child can be resumed by any child.
+
+        :param bytes keys: Key material from
+                           :func:`blackhole.tls.generate_ticket_keys`.
+        :returns: Whether the keys were set on every context.
+        :rtype: :py:obj:`bool`
+        """
+        contexts = self.tls_contexts()
+        if all(set_ticket_keys(context, keys) for context in contexts):
+            return True
+        logger.warning(
+            "Unable to set TLS session ticket keys, children will share the "
+            "keys they inherited but they will not be rotated"
+        )
+        return False
+
+    def rotate_ticket_keys(self):
+        """
+        Generate new TLS session ticket keys and send them to every child.
+
+        Reschedules itself every
+        :attr:`blackhole.config.Config.tls_ticket_rotation` seconds.
+
+        .. note::
+
+           OpenSSL keeps one ticket key per context so the previous keys are
+           discarded. Children read new keys from their control pipe up to 5
+           seconds apart, until every child has them a ticket issued by one
+           child may not be resumed by another. Clients fall back to a full
+           handshake.
+        """
+        keys = generate_ticket_keys()
+        if not self.set_ticket_keys(keys):
+            return
+        logger.debug("Rotating TLS session ticket keys")
+        for worker in self.workers:
+            worker.send_ticket_keys(keys)
+        self.loop.call_later(
+            self.config.tls_ticket_rotation, self.rotate_ticket_keys
+        )
+
+    def tls_file_mtimes(self):
+        """
+        The modification times of the TLS certificate, key and dhparams.
+
+        :returns: Modification times in nanoseconds, :py:obj:`None` for a
+                  file that cannot be read.
+        :rtype: :py:obj:`tuple`
+        """
+        files = (
+            self.config.tls_cert,
+            self.config.tls_key,
+            self.config.tls_dhparams,
+        )
+        mtimes = []
+        for path in files:
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns if path else None)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def check_tls_files(self):
+        """
+        Reload the TLS certificate if any of it's files have changed.
+
+        Reschedules itself every
+        :attr:`blackhole.config.Config.tls_reload_interval` seconds.
+        """
+        mtimes = self.tls_file_mtimes()
+        if mtimes != self.tls_mtimes:
+            self.tls_mtimes = mtimes
+            logger.info("TLS certificate files changed")
+            self.reload_tls()
+        self.loop.call_later(
+            self.config.tls_reload_interval, self.check_tls_files
+        )
+
+    def request_tls_reload(self, *args, **kwargs):
+        """
+        Reload the TLS certificate from inside the event loop.
+
+        Generally should be called by a signal, nothing else.
+        """
+        self.loop.call_soon_threadsafe(self.reload_tls)
+
+    def reload_tls(self):
+        """
+        Reload the TLS certificate and tell every child to do the same.
+
+        The supervisor's own contexts are reloaded first, so the certificate
+        is validated before any child sees it and children that are
+        restarted later inherit it. Connections that have already been
+        established keep using the old certificate.
+
+        :returns: Whether the certificate was reloaded.
+        :rtype: :py:obj:`bool`
+        """
+        contexts = self.tls_contexts()
+        if not contexts:
+            return False
+        for context in contexts:
+            try:
+                load_certificates(
+                    context,
+                    self.config.tls_cert,
+                    self.config.tls_key,
+                    self.config.tls_dhparams,
+                )
+            except OSError as err:
+                logger.error("Unable to reload TLS certificate: %s", err)
+                return False
+        logger.info("Reloading TLS certificate")
+        for worker in self.workers:
+            worker.send_tls_reload()
+        return True
 
     def stop_workers(self):
         """Stop the workers and their respective child process."""
@@ -130,9 +385,81 @@ class Supervisor(metaclass=Singleton):
             worker.stop()
             worker_num += 1
 
+    def report_stats(self, *args, **kwargs):
+        """
+        Merge the statistics from each worker and log them.
+
+        Generally should be called by a signal, nothing else.
+
+        .. note::
+
+           Latencies are logged in microseconds.
+
+           When workers are split in to :attr:`pools`, the statistics of
+           each pool are also logged, prefixed with ``pool.<name>.``.
+        """
+        self.log_stats(self.workers)
+        for name, pool in sorted(self.pools.items()):
+            workers = [self.workers[idx] for idx in pool]
+            self.log_stats(workers, prefix="pool.{0}.".format(name))
+
+    def log_stats(self, workers, prefix=""):
+        """
+        Merge the statistics from some workers and log them.
+
+        :param list workers: The workers.
+        :param str prefix: Prefix for each statistic's name.
+        """
+        stats = Stats()
+        for worker in workers:
+            stats.merge(worker.stats)
+        summary = stats.summary()
+        for name, value in sorted(summary["counters"].items()):
+            logger.info("stats: %s %s", prefix + name, value)
+        handshakes = summary["counters"].get("tls.handshakes", 0)
+        if handshakes:
+            resumed = summary["counters"].get("tls.resumed", 0)
+            logger.info(
+                "stats: %s %.2f",
+                prefix + "tls.resumption_rate",
+                resumed / handshakes,
+            )
+        for name, hist in sorted(summary["histograms"].items()):
+            logger.info(
+                "stats: %s count=%s p50=%s p99=%s p999=%s max=%s",
+                prefix + name,
+                hist["count"],
+                hist["p50"],
+                hist["p99"],
+                hist["p999"],
+                hist["max"],
+            )
+
+    def profile_workers(self, *args, **kwargs):
+        """
+        Ask every child process to profile itself.
+
+        Generally should be called by a signal, nothing else.
+
+        .. note::
+
+           A single child can be profiled by sending ``SIGUSR2`` to it
+           directly.
+        """
+        for worker in self.workers:
+            try:
+                os.kill(worker.pid, signal.SIGUSR2)
+            except ProcessLookupError:
+                logger.debug("Worker %s has no child to profile", worker.idx)
+
     def close_socks(self):
         """Close all opened sockets."""
         for sock in self.socks:
+            if sock["sock"].family == socket.AF_UNIX:
+                try:
+                    os.unlink(sock["sock"].getsockname())
+                except OSError:
+                    pass
             sock["sock"].close()
 
     def stop(self, *args, **kwargs):
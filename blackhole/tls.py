@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+TLS certificate reloading and session ticket key management.
+
+Python's :py:mod:`ssl` module does not expose session ticket keys, they are
+set on the underlying OpenSSL ``SSL_CTX`` using :py:mod:`ctypes`. Finding the
+``SSL_CTX`` relies on CPython's object layout, so this is only done on
+CPython. When that is not possible every function here fails gracefully and
+blackhole falls back to the ticket keys OpenSSL generated when the context was
+created, which are still shared by every child forked after it.
+
+OpenSSL holds a single ticket key per context. When keys are rotated the old
+key is discarded, tickets issued with it can no longer be resumed and clients
+presenting them fall back to a full handshake.
+"""
+
+try:  # pragma: no cover
+    import ssl
+except ImportError:  # pragma: no cover
+    ssl = None
+
+import ctypes
+import logging
+import os
+import platform
+
+
+__all__ = (
+    "TICKET_KEY_LENGTH",
+    "generate_ticket_keys",
+    "get_ticket_keys",
+    "load_certificates",
+    "set_ticket_keys",
+)
+"""Tuple all the things."""
+
+
+logger = logging.getLogger("blackhole.tls")
+
+
+_SSL_CTRL_GET_TLSEXT_TICKET_KEYS = 58
+_SSL_CTRL_SET_TLSEXT_TICKET_KEYS = 59
+
+TICKET_KEY_LENGTH = 80
+"""
+Length of session ticket key material in bytes.
+
+A 16 byte key name, a 32 byte HMAC secret and a 32 byte AES key, as expected
+by OpenSSL 1.1.0 and newer. OpenSSL 1.0.2 expects 48 bytes.
+"""
+
+if ssl is not None and ssl.OPENSSL_VERSION_INFO < (
+    1,
+    1,
+    0,
+):  # pragma: no cover
+    TICKET_KEY_LENGTH = 48
+
+_ssl_ctx_ctrl = None
+
+
+def _ctrl():
+    """
+    Look up OpenSSL's ``SSL_CTX_ctrl`` function.
+
+    Only looked up on CPython, :func:`_ctx_pointer` depends on CPython's
+    object layout and would read the wrong memory elsewhere.
+
+    :returns: The function or :py:obj:`None` if it cannot be found.
+    :rtype: :py:class:`ctypes._CFuncPtr` or :py:obj:`None`
+    """
+    global _ssl_ctx_ctrl
+    if _ssl_ctx_ctrl is None:
+        implementation = platform.python_implementation()
+        if implementation != "CPython":
+            logger.debug(
+                "Session ticket keys cannot be set on %s", implementation
+            )
+            _ssl_ctx_ctrl = False
+            return None
+        try:
+            import _ssl
+
+            func = ctypes.CDLL(_ssl.__file__).SSL_CTX_ctrl
+        except (AttributeError, ImportError, OSError):
+            logger.debug("SSL_CTX_ctrl is not available")
+            _ssl_ctx_ctrl = False
+            return None
+        func.restype = ctypes.c_long
+        func.argtypes = (
+            ctypes.c_void_p,
+            ctypes.c_int,
+            ctypes.c_long,
+            ctypes.c_void_p,
+        )
+        _ssl_ctx_ctrl = func
+    return _ssl_ctx_ctrl or None
+
+
+def _ctx_pointer(context):
+    """
+    The address of the ``SSL_CTX`` wrapped by an :py:class:`ssl.SSLContext`.
+
+    The ``SSL_CTX`` pointer is the first member after the object header.
+    This is only true of CPython, :func:`_ctrl` is never available on other
+    implementations so this is never called on them.
+    """
+    address = id(context) + object.__basicsize__
+    return ctypes.c_void_p.from_address(address).value
+
+
+def generate_ticket_keys():
+    """
+    Generate new session ticket key material.
+
+    :returns: Random key material.
+    :rtype: :py:obj:`bytes`
+    """
+    return os.urandom(TICKET_KEY_LENGTH)
+
+
+def set_ticket_keys(context, keys):
+    """
+    Set the session ticket keys of a TLS context.
+
+    :param context: The TLS context.
+    :type context: :py:class:`ssl.SSLContext`
+    :param bytes keys: Key material from :func:`generate_ticket_keys`.
+    :returns: Whether the keys were set.
+    :rtype: :py:obj:`bool`
+    """
+    ctrl = _ctrl()
+    if ctrl is None or ssl is None:
+        return False
+    if not isinstance(context, ssl.SSLContext):
+        return False
+    if len(keys) != TICKET_KEY_LENGTH:
+        return False
+    result = ctrl(
+        _ctx_pointer(context),
+        _SSL_CTRL_SET_TLSEXT_TICKET_KEYS,
+        len(keys),
+        keys,
+    )
+    return result == 1
+
+
+def get_ticket_keys(context):
+    """
+    Get the session ticket keys of a TLS context.
+
+    :param context: The TLS context.
+    :type context: :py:class:`ssl.SSLContext`
+    :returns: The key material or :py:obj:`None` if it cannot be read.
+    :rtype: :py:obj:`bytes` or :py:obj:`None`
+    """
+    ctrl = _ctrl()
+    if ctrl is None or ssl is None:
+        return None
+    if not isinstance(context, ssl.SSLContext):
+        return None
+    buf = ctypes.create_string_buffer(TICKET_KEY_LENGTH)
+    result = ctrl(
+        _ctx_pointer(context),
+        _SSL_CTRL_GET_TLSEXT_TICKET_KEYS,
+        TICKET_KEY_LENGTH,
+        buf,
+    )
+    if result != 1:
+        return None
+    return buf.raw
+
+
+def load_certificates(context, cert, key, dhparams=None):
+    """
+    Load a new certificate, key and dhparams in to a TLS context in use.
+
+    The files are loaded in to a throwaway context first so a mismatched or
+    half written certificate and key never reach ``context``. Connections
+    accepted afterwards use the new certificate, connections that have
+    already been established keep the one they were accepted with.
+
+    :param context: The TLS context.
+    :type context: :py:class:`ssl.SSLContext`
+    :param str cert: Path to the certificate.
+    :param str key: Path to the key.
+    :param dhparams: Path to the Diffie Hellman ephemeral parameters.
+    :type dhparams: :py:obj:`str` or :py:obj:`None`
+    :raises OSError: When a file cannot be read. :py:exc:`ssl.SSLError`, a
+                     subclass, when the certificate, key or dhparams are
+                     invalid.
+    """
+    check = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    check.load_cert_chain(cert, key)
+    if dhparams:
+        check.load_dh_params(dhparams)
+    context.load_cert_chain(cert, key)
+    if dhparams:
+        context.load_dh_params(dhparams)
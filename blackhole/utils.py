@@ -25,13 +25,23 @@
 """Provides utility functionality."""
 
 import codecs
+import math
 import os
 import random
 import socket
 import time
 
 
-__all__ = ("blackhole_config_help", "mailname", "message_id", "get_version")
+__all__ = (
+    "available_cpus",
+    "blackhole_config_help",
+    "cgroup_cpu_limit",
+    "mailname",
+    "message_id",
+    "get_version",
+    "usable_cpus",
+    "use_uvloop",
+)
 
 
 class Singleton(type):
@@ -88,6 +98,132 @@ def message_id(domain):
     return "<{0}.{1}.{2}@{3}>".format(timeval, pid, randint, domain)
 
 
+def available_cpus():
+    """
+    The CPUs this process is allowed to run on.
+
+    :returns: A sorted list of CPU numbers.
+    :rtype: :py:obj:`list`
+
+    .. note::
+
+       Uses :py:func:`os.sched_getaffinity` where available, otherwise
+       assumes every CPU reported by :py:func:`os.cpu_count` is available.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _read_first_line(path):
+    try:
+        with open(path, "r") as fp:
+            return fp.readline().strip()
+    except OSError:
+        return None
+
+
+def _cgroups(proc_cgroup):
+    """
+    Parse a ``/proc/<pid>/cgroup`` file.
+
+    :param str proc_cgroup: Path to the file.
+    :returns: Each cgroup path keyed by controller, the cgroup v2 path is
+              keyed by an empty string.
+    :rtype: :py:obj:`dict`
+    """
+    cgroups = {}
+    try:
+        with open(proc_cgroup, "r") as fp:
+            lines = fp.readlines()
+    except OSError:
+        return cgroups
+    for line in lines:
+        parts = line.strip().split(":", 2)
+        if len(parts) != 3:
+            continue
+        _, controllers, path = parts
+        cgroups[controllers] = path.lstrip("/")
+    return cgroups
+
+
+def cgroup_cpu_limit(root="/sys/fs/cgroup", proc_cgroup="/proc/self/cgroup"):
+    """
+    The CPU limit imposed on this process by a cgroup quota.
+
+    :param str root: Where the cgroup filesystem is mounted. Default:
+                     ``/sys/fs/cgroup``.
+    :param str proc_cgroup: The file describing this process's cgroups.
+                            Default: ``/proc/self/cgroup``.
+    :returns: The number of CPUs the quota allows, i.e. ``1.5``, or
+              :py:obj:`None` when there is no quota.
+    :rtype: :py:obj:`float` or :py:obj:`None`
+
+    .. note::
+
+       Both cgroup v2 (``cpu.max``) and cgroup v1 (``cpu.cfs_quota_us`` and
+       ``cpu.cfs_period_us``) are supported.
+    """
+    cgroups = _cgroups(proc_cgroup)
+    if "" in cgroups:
+        for path in (os.path.join(root, cgroups[""]), root):
+            value = _read_first_line(os.path.join(path, "cpu.max"))
+            if value is None:
+                continue
+            quota, _, period = value.partition(" ")
+            if quota == "max" or not period:
+                return None
+            return int(quota) / int(period)
+    for controllers, cgroup in cgroups.items():
+        if "cpu" not in controllers.split(","):
+            continue
+        base = os.path.join(root, controllers)
+        for path in (os.path.join(base, cgroup), base):
+            quota = _read_first_line(os.path.join(path, "cpu.cfs_quota_us"))
+            period = _read_first_line(os.path.join(path, "cpu.cfs_period_us"))
+            if quota is None or period is None:
+                continue
+            if int(quota) <= 0:
+                return None
+            return int(quota) / int(period)
+    return None
+
+
+def usable_cpus():
+    """
+    The number of CPUs this process can make use of.
+
+    :returns: The number of CPUs in this process's affinity mask, lowered to
+              any cgroup CPU quota. Always at least 1.
+    :rtype: :py:obj:`int`
+    """
+    cpus = len(available_cpus())
+    limit = cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, int(math.floor(limit)))
+    return max(cpus, 1)
+
+
+def use_uvloop():
+    """
+    Use uvloop's event loop policy when uvloop is installed.
+
+    Called by the modules that run an event loop rather than on import of
+    the package, so the configuration tools don't import :py:mod:`asyncio`.
+
+    :returns: Whether uvloop is in use.
+    :rtype: :py:obj:`bool`
+    """
+    try:
+        import asyncio
+
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
 def get_version():
     """
     Extract the __version__ from a file without importing it.
@@ -160,7 +296,7 @@ blackhole_config_help = '''BLACKHOLE_CONFIG(1)
 
     {f.bold}listen{f.reset}
         {f.bold}Syntax{f.reset}
-            {f.bold}listen{f.reset} = {f.under}[address]:port [mode=MODE] [delay=DELAY]{f.reset}
+            {f.bold}listen{f.reset} = {f.under}[address]:port [mode=MODE] [delay=DELAY] [socket flags]{f.reset}
 
         {f.bold}Default{f.reset}
             127.0.0.1:25,  127.0.0.1:587, :::25, :::587
@@ -183,11 +319,42 @@ blackhole_config_help = '''BLACKHOLE_CONFIG(1)
         The flags accept the same options as {f.under}dynamic-switches{f.reset}, including setting
         a delay range.
 
+        Socket flags tune the listening socket and each connection accepted
+        on it: {f.under}backlog={f.reset} (default 1024), {f.under}defer_accept={f.reset} (seconds),
+        {f.under}fastopen={f.reset} (queue length), {f.under}nodelay={f.reset} (true or false),
+        {f.under}rcvbuf={f.reset} and {f.under}sndbuf={f.reset} (bytes) and {f.under}user_timeout={f.reset} (milliseconds).
+
+            listen = :25 backlog=4096 defer_accept=5 fastopen=256
+
+        {f.under}capture_codec={f.reset} and {f.under}capture_level={f.reset} override capture_codec and
+        capture_level for messages received on a listener.
+
+        {f.under}capture_policy={f.reset}, {f.under}capture_sample_rate={f.reset} and {f.under}capture_max_bytes={f.reset}
+        override capture_policy, capture_sample_rate and capture_max_bytes for
+        a listener.
+
+        Listeners can be UNIX domain sockets, {f.under}unix:{f.reset} followed by an
+        absolute path. {f.under}owner={f.reset}, {f.under}group={f.reset} and {f.under}perm={f.reset} (octal) set the
+        socket's ownership and permissions.
+
+            listen = unix:/run/blackhole/smtp.sock owner=postfix perm=660
+
+        {f.under}proto=lmtp{f.reset} makes a listener speak LMTP (RFC 2033), a response is sent
+        for each recipient after DATA.
+
+            listen = :25, :2424 proto=lmtp mode=random
+
+        A port can be a range, {f.under}:2500-2999{f.reset}, and an address a CIDR network,
+        {f.under}10.0.0.0/30{f.reset}. Each address and port is listened on with the same
+        flags, up to 65536 listeners per directive.
+
+            listen = :2500-2599 mode=bounce, 10.0.0.0/30:25
+
                                             ----
 
     {f.bold}tls_listen{f.reset}
         {f.bold}Syntax{f.reset}
-            {f.bold}tls_listen{f.reset} = {f.under}[address]:port [mode=MODE] [delay=DELAY]{f.reset}
+            {f.bold}tls_listen{f.reset} = {f.under}[address]:port [mode=MODE] [delay=DELAY] [socket flags]{f.reset}
 
         {f.bold}Default{f.reset}
             None
@@ -281,7 +448,8 @@ blackhole_config_help = '''BLACKHOLE_CONFIG(1)
             None
 
         The certificate file in x509 format for wrapping a connection in
-        SSL/TLS.
+        SSL/TLS. When set with tls_key, STARTTLS is also offered on every
+        listen address.
 
                                             ----
 
@@ -354,7 +522,7 @@ blackhole_config_help = '''BLACKHOLE_CONFIG(1)
 
     {f.bold}workers{f.reset}
         {f.bold}Syntax{f.reset}
-            {f.bold}workers{f.reset} = {f.under}number{f.reset}
+            {f.bold}workers{f.reset} = {f.under}number | auto{f.reset}
 
         {f.bold}Default{f.reset}
             1
@@ -363,5 +531,371 @@ blackhole_config_help = '''BLACKHOLE_CONFIG(1)
         spawn to handle incoming mail. The absolute minimum is actually 2. Even
         by setting the workers value to 1, a supervisor process will always
         exist meaning that you would have 1 worker and a supervisor.
+
+        Setting workers to auto spawns one worker per usable CPU. Usable CPUs
+        are the CPUs blackhole is allowed to run on, reduced to any cgroup CPU
+        quota. With cpu_affinity enabled one CPU is left for the supervisor,
+        so auto spawns one worker fewer, with a minimum of 1.
+
+        Workers cannot outnumber the CPUs blackhole is allowed to run on, less
+        the supervisor's CPU when cpu_affinity is enabled.
+
+                                            ----
+
+    {f.bold}profile_dir{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}profile_dir{f.reset} = {f.under}/path/to/directory{f.reset}
+
+        {f.bold}Default{f.reset}
+            /tmp
+
+        Directory that profiles are written to. Sending SIGUSR2 to a child
+        process profiles it for profile_duration seconds without interrupting
+        it, sending SIGUSR2 to the supervisor profiles every child. Profiles
+        are written as blackhole-child-<worker>-<pid>-<timestamp>.prof and can
+        be read with pstats.
+
+                                            ----
+
+    {f.bold}profile_duration{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}profile_duration{f.reset} = {f.under}seconds{f.reset}
+
+        {f.bold}Default{f.reset}
+            30 -- Maximum value of 3600 seconds.
+
+        How long a child process is profiled for after receiving SIGUSR2.
+        Profiling happens inside the child's event loop, connections are not
+        interrupted or dropped while a profile is running. See profile_dir.
+
+                                            ----
+
+    {f.bold}loop_monitor{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}loop_monitor{f.reset} = {f.under}true | false{f.reset}
+
+        {f.bold}Default{f.reset}
+            false -- valid options are:- true, false.
+
+        Monitor the event loop of each child process. The loop is sampled ten
+        times a second and how late each sample runs is recorded in the
+        loop.lag histogram. When the loop is blocked for longer than
+        loop_monitor_threshold the loop.slow_callbacks counter is incremented
+        and the function blocking the loop, along with the peer and last
+        command of the connection it was serving, is logged. Slow callback
+        messages are logged at most once every 10 seconds.
+
+        Statistics are logged when the supervisor receives SIGUSR1.
+
+                                            ----
+
+    {f.bold}loop_monitor_threshold{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}loop_monitor_threshold{f.reset} = {f.under}milliseconds{f.reset}
+
+        {f.bold}Default{f.reset}
+            100 -- Maximum value of 60000 milliseconds.
+
+        How long the event loop can be blocked before the callback blocking it
+        is considered slow. Only used when loop_monitor is enabled. Also used
+        as asyncio.loop.slow_callback_duration when asyncio debug mode is
+        enabled.
+
+                                            ----
+
+    {f.bold}cpu_affinity{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}cpu_affinity{f.reset} = {f.under}true | false{f.reset}
+
+        {f.bold}Default{f.reset}
+            false -- valid options are:- true, false.
+
+        Pin the supervisor and each worker to a CPU. The supervisor is pinned
+        to the first CPU blackhole is allowed to run on and workers are spread
+        over the remaining CPUs, stopping children from moving between cores.
+        If only one CPU is available everything is pinned to it. The processes
+        that compress capture segments are not pinned, they run on any CPU
+        blackhole is allowed to run on. Only supported on platforms with
+        sched_setaffinity, i.e. Linux.
+
+                                            ----
+
+    {f.bold}reuse_port{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}reuse_port{f.reset} = {f.under}true | false{f.reset}
+
+        {f.bold}Default{f.reset}
+            false -- valid options are:- true, false.
+
+        Give each worker it's own listening socket for every listener instead
+        of every worker sharing one. The sockets are bound with SO_REUSEPORT by
+        the supervisor before privileges are dropped, the kernel then
+        distributes incoming connections across workers rather than waking
+        every worker to race for each connection. This spreads load more evenly
+        and reduces wasted CPU.
+
+        Connections the kernel assigns to a worker wait for that worker, if a
+        worker is restarted it's connections queue until the new child starts.
+        Requires SO_REUSEPORT, i.e. Linux 3.9+.
+
+                                            ----
+
+    {f.bold}tls_ticket_rotation{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}tls_ticket_rotation{f.reset} = {f.under}int{f.reset}
+
+        {f.bold}Default{f.reset}
+            3600 -- seconds
+
+        How often, in seconds, the TLS session ticket keys shared by all
+        workers are rotated. The supervisor generates the keys before forking
+        so any worker can resume a session started on another worker, then
+        sends new keys to each worker over its control pipe on this interval.
+
+        Previous keys are discarded, tickets issued with them, or by a worker
+        that picked up new keys a few seconds before another, fall back to a
+        full handshake. Keys are only set on CPython.
+
+        Set to 0 to disable rotation, otherwise the value must be between 60
+        and 86400.
+
+                                            ----
+
+    {f.bold}tls_reload_interval{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}tls_reload_interval{f.reset} = {f.under}int{f.reset}
+
+        {f.bold}Default{f.reset}
+            60 -- seconds
+
+        How often, in seconds, the supervisor checks whether tls_cert, tls_key
+        or tls_dhparams have been modified. When they have, the new certificate
+        is validated and loaded by the supervisor and every child without
+        restarting them. Connections that are already established keep the
+        certificate they were accepted with.
+
+        Sending SIGHUP to the supervisor reloads the certificate immediately.
+        Set to 0 to only reload on SIGHUP, otherwise the value must be between
+        1 and 86400.
+
+        The files are read again after privileges have been dropped, so they
+        must be readable by user or group.
+
+                                            ----
+
+    {f.bold}tls_workers{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}tls_workers{f.reset} = {f.under}int{f.reset}
+
+        {f.bold}Default{f.reset}
+            0
+
+        How many workers to dedicate to tls_listen. TLS handshakes are much
+        more expensive than plaintext sessions, so a burst of TLS connections
+        can starve plaintext listeners served by the same worker.
+
+        With the default of 0, every worker serves both listen and tls_listen.
+        Otherwise workers only serve listen, including STARTTLS, and this many
+        additional workers only serve tls_listen. workers and tls_workers
+        combined cannot exceed the number of processors or cores.
+
+        Statistics are reported for all workers and for each pool, prefixed
+        with pool.listen. and pool.tls_listen..
+
+                                            ----
+
+    {f.bold}capture_dir{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}capture_dir{f.reset} = {f.under}/path/to/directory{f.reset}
+
+        {f.bold}Default{f.reset}
+            None -- capturing is disabled
+
+        Directory to write received messages to. Capturing is disabled unless
+        this is set, the directory must exist and be writable by user or group.
+
+        Every message that is not rejected for exceeding max_message_size is
+        written, along with the time it was received, the client's address, the
+        sender and recipients, the message id and the response code sent,
+        regardless of the response mode. Each child appends messages to it's
+        own segment files, named worker-<id>-<sequence>.seg, a new file is
+        started when one reaches capture_segment_size. Messages can also be
+        delivered in to a Maildir, see capture_format.
+
+        Messages are written in batches from a background thread, see
+        capture_flush_size and capture_flush_interval. Messages that have not
+        been written yet are lost if a child is killed with SIGKILL.
+
+                                            ----
+
+    {f.bold}capture_segment_size{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}capture_segment_size{f.reset} = {f.under}int{f.reset}
+
+        {f.bold}Default{f.reset}
+            67108864 -- bytes
+
+        The size, in bytes, at which a capture segment file is closed and a new
+        one started. A message larger than this is written to a segment of it's
+        own. Must be between 65536 and 4294967296.
+
+                                            ----
+
+    {f.bold}capture_flush_size{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}capture_flush_size{f.reset} = {f.under}int{f.reset}
+
+        {f.bold}Default{f.reset}
+            1048576 -- bytes
+
+        How many bytes of captured messages each child holds in memory before
+        writing them to disk. Must be between 1 and 268435456.
+
+        If the disk falls behind, each child queues at most 67108864 bytes, or
+        twice capture_flush_size when that is larger. Messages received while
+        the queue is full are not captured and are counted in the
+        capture.dropped statistic.
+
+                                            ----
+
+    {f.bold}capture_flush_interval{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}capture_flush_interval{f.reset} = {f.under}int{f.reset}
+
+        {f.bold}Default{f.reset}
+            1000 -- milliseconds
+
+        The longest time, in milliseconds, a captured message is held in memory
+        before it is written to disk, even if capture_flush_size has not been
+        reached. Must be between 1 and 60000.
+
+                                            ----
+
+    {f.bold}capture_format{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}capture_format{f.reset} = {f.under}segment | maildir{f.reset}
+
+        {f.bold}Default{f.reset}
+            segment
+
+        How messages captured to capture_dir are stored.
+
+        segment appends messages to segment files, see capture_segment_size.
+
+        maildir delivers each message in to a Maildir at capture_dir, creating
+        tmp, new and cur if they do not exist. Messages are written to tmp by a
+        small pool of threads and then moved to new, where any Maildir reader
+        can find them. The sender and recipients are added to each message as
+        Return-Path and Delivered-To headers. Each batch is written in full
+        and then each message is synced to disk before it is moved to new, the
+        tmp and new directories are each synced once per batch rather than
+        once per message, see capture_flush_size and capture_flush_interval.
+
+                                            ----
+
+    {f.bold}capture_codec{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}capture_codec{f.reset} = {f.under}none | zlib | lzma | bz2{f.reset}
+
+        {f.bold}Default{f.reset}
+            none
+
+        Compress capture segments with zlib, lzma or bz2. Each segment is
+        compressed once it reaches capture_segment_size, or when the child
+        stops, by a separate process so compression does not slow the child
+        down. The compressed segment replaces the original, .gz, .xz or .bz2 is
+        added to it's name. zlib segments are written with a gzip header so
+        standard tools can read them.
+
+        Can be set per listener with the capture_codec= flag, see listen. Has
+        no effect when capture_format is maildir.
+
+        blackhole.capture.read_records reads compressed and uncompressed
+        segments, decompressing them as they are read.
+
+                                            ----
+
+    {f.bold}capture_level{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}capture_level{f.reset} = {f.under}int{f.reset}
+
+        {f.bold}Default{f.reset}
+            6
+
+        The compression level used by capture_codec, from 1, the fastest, to 9,
+        the smallest. Can be set per listener with the capture_level= flag, see
+        listen.
+
+                                            ----
+
+    {f.bold}capture_index{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}capture_index{f.reset} = {f.under}true | false{f.reset}
+
+        {f.bold}Default{f.reset}
+            false
+
+        Keep an SQLite index of captured messages in index.sqlite in
+        capture_dir, so messages can be found by message id, sender, recipient
+        and time without reading every segment. The message id is the one sent
+        in the queued as response, each message in a session is given it's
+        own, it is not the message's Message-ID header.
+
+        Each batch written by a child is added to the index in a single
+        transaction. The index records the response code sent for each message
+        and where it was written, the segment and the offset of it's record or
+        the path of the message in a Maildir. The index uses write-ahead
+        logging, so it can be queried while blackhole is running. See
+        blackhole.index.CaptureIndex.
+
+                                            ----
+
+    {f.bold}capture_policy{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}capture_policy{f.reset} = {f.under}none | headers | full{f.reset}
+
+        {f.bold}Default{f.reset}
+            full -- valid options are:- none, headers, full.
+
+        How much of each sampled message is captured when capture_dir is set.
+        full captures the whole message, headers captures the headers and the
+        blank line that ends them and none captures nothing, no capture writer
+        is started for listeners with the none policy.
+
+        Captured messages record the size of the whole message and whether it
+        was cut down. Can be set per listener with the capture_policy= flag,
+        see listen.
+
+                                            ----
+
+    {f.bold}capture_sample_rate{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}capture_sample_rate{f.reset} = {f.under}float{f.reset}
+
+        {f.bold}Default{f.reset}
+            1.0 -- a number between 0 and 1.
+
+        The fraction of mail transactions that are captured, 0.01 captures
+        roughly one transaction in every hundred. The decision is made when
+        MAIL FROM is received, transactions that are not sampled are never
+        copied or written to disk.
+
+        Sampled transactions are counted in the capture.sampled statistic and
+        the rest in capture.skipped. Can be set per listener with the
+        capture_sample_rate= flag, see listen.
+
+                                            ----
+
+    {f.bold}capture_max_bytes{f.reset}
+        {f.bold}Syntax{f.reset}
+            {f.bold}capture_max_bytes{f.reset} = {f.under}int{f.reset}
+
+        {f.bold}Default{f.reset}
+            0 -- no limit.
+
+        The most bytes of each message that are captured, after capture_policy
+        is applied. Longer messages are cut down and counted in the
+        capture.truncated statistic. 0 captures messages of any size. Can be
+        set per listener with the capture_max_bytes= flag, see listen.
 '''.format(f=formatting)  # noqa
 # fmt: on
@@ -29,11 +29,13 @@ import asyncio
 import logging
 import os
 import signal
+import struct
 import time
 
 from . import protocols
 from .child import Child
 from .control import setgid, setuid
+from .stats import Stats
 from .streams import StreamProtocol
 
 
@@ -62,7 +64,7 @@ class Worker:
     _started = False
     ping_count = 0
 
-    def __init__(self, idx, socks, loop=None):
+    def __init__(self, idx, socks, loop=None, cpu=None, cpus=None):
         """
         Initialise the worker.
 
@@ -72,10 +74,18 @@ class Worker:
         :type loop: :py:class:`asyncio.unix_events._UnixSelectorEventLoop` or
                     :py:obj:`None` to get the current event loop using
                     :py:func:`asyncio.get_event_loop`.
+        :param cpu: The CPU to pin the child to.
+        :type cpu: :py:obj:`int` or :py:obj:`None` to not pin the child.
+        :param cpus: The CPUs the child's compression process runs on.
+        :type cpus: :py:obj:`list` or :py:obj:`None` to use the child's CPU
+                    affinity.
         """
         self.loop = loop if loop is not None else asyncio.get_event_loop()
         self.socks = socks
         self.idx = idx
+        self.cpu = cpu
+        self.cpus = cpus
+        self.stats = Stats()
         self.start()
 
     def start(self):
@@ -96,10 +106,14 @@ class Worker:
         """Basic setup for the child process and starting it."""
         setgid()
         setuid()
+        if self.cpu is not None:
+            os.sched_setaffinity(0, {self.cpu})
         asyncio.set_event_loop(None)
         if setproctitle:
             setproctitle.setproctitle("blackhole: worker")
-        process = Child(self.up_read, self.down_write, self.socks, self.idx)
+        process = Child(
+            self.up_read, self.down_write, self.socks, self.idx, cpus=self.cpus
+        )
         process.start()
 
     def restart_child(self):
@@ -175,9 +189,12 @@ class Worker:
 
            - b'x01' -- :const:`blackhole.protocols.PING`
            - b'x02' -- :const:`blackhole.protocols.PONG`
+           - b'x03' -- :const:`blackhole.protocols.STATS`
 
            Read data coming in from the child. If a PONG is received, we'll
            update the worker, setting this PONG as a 'PING' from the child.
+           If STATS is received, the statistics that follow replace the last
+           statistics received from the child.
 
            These message values are defined in the :mod:`blackhole.protocols`
            schema. Documentation is available at --
@@ -192,6 +209,11 @@ class Worker:
                     )
                     self.ping = time.monotonic()
                     self.ping_count += 1
+                elif msg == protocols.STATS:
+                    header = await reader.readexactly(4)
+                    (length,) = struct.unpack(">I", header)
+                    self.stats = Stats.loads(await reader.readexactly(length))
+                    continue
             except:  # noqa
                 self.stop()
             await asyncio.sleep(5)
@@ -219,6 +241,26 @@ class Worker:
         self.chat_task = asyncio.ensure_future(self.chat(reader))
         self.heartbeat_task = asyncio.ensure_future(self.heartbeat(writer))
 
+    def send_ticket_keys(self, keys):
+        """
+        Send TLS session ticket keys to the child.
+
+        :param bytes keys: Key material from
+                           :func:`blackhole.tls.generate_ticket_keys`.
+        """
+        wtransport = getattr(self, "wtransport", None)
+        if wtransport is None or wtransport.is_closing():
+            return
+        header = protocols.TICKET_KEYS + struct.pack(">I", len(keys))
+        wtransport.write(header + keys)
+
+    def send_tls_reload(self):
+        """Tell the child to reload the TLS certificate and key."""
+        wtransport = getattr(self, "wtransport", None)
+        if wtransport is None or wtransport.is_closing():
+            return
+        wtransport.write(protocols.TLS_RELOAD)
+
     def stop(self):
         """Terminate the worker and it's respective child process."""
         self.kill_child()
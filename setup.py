@@ -35,6 +35,8 @@ __version__ = get_version("blackhole/__init__.py")
 entry_points = {
     "console_scripts": (
         "blackhole = blackhole.application:run",
+        "blackhole-bench = blackhole.application:blackhole_bench",
+        "blackhole-query = blackhole.application:blackhole_query",
         "blackhole_config = blackhole.application:blackhole_config",
     )
 }
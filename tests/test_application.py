@@ -25,12 +25,14 @@
 
 import logging
 import os
+import subprocess
+import sys
 
 from unittest import mock
 
 import pytest
 
-from blackhole.application import blackhole_config, run
+from blackhole.application import blackhole_bench, blackhole_config, run
 from blackhole.config import Config
 from blackhole.exceptions import (
     BlackholeRuntimeException,
@@ -225,3 +227,38 @@ def test_blackhole_config():
     with pytest.raises(SystemExit) as exc:
         blackhole_config()
     assert exc.value.code == 0
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_blackhole_bench():
+    with mock.patch("sys.argv", ["blackhole-bench", "-n", "1"]), mock.patch(
+        "blackhole.bench.run_bench"
+    ) as mock_run:
+        blackhole_bench()
+    assert mock_run.call_args[0][0].messages == 1
+
+
+_LAZY = (
+    "import blackhole.application",
+    "from blackhole.application import blackhole_config; blackhole_config()",
+    "from blackhole.application import run; run()",
+)
+
+
+@pytest.mark.parametrize("code,argv", zip(_LAZY, ([], [], ["--version"])))
+def test_entry_points_import_lazily(code, argv):
+    script = (
+        "import sys\n"
+        "sys.argv[1:] = {0!r}\n"
+        "try:\n"
+        "    {1}\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(sorted(m for m in sys.modules if m in {2!r}))\n"
+    ).format(argv, code, ("asyncio", "ssl", "blackhole.supervisor"))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    out = subprocess.check_output(
+        [sys.executable, "-c", script], env=env, stderr=subprocess.DEVNULL
+    )
+    assert out.decode().splitlines()[-1] == "[]"
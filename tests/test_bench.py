@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import json
+import socket
+
+from unittest import mock
+
+import pytest
+
+from blackhole.bench import Bench, format_report, parse_bench_args, run_bench
+from blackhole.config import Config
+from blackhole.control import _socket
+from blackhole.smtp import Smtp
+
+
+from ._utils import (  # noqa: F401; isort:skip
+    Args,
+    cleandir,
+    create_config,
+    create_file,
+    reset,
+)
+
+
+def test_parse_bench_args_defaults():
+    args = parse_bench_args([])
+    assert args.host == "127.0.0.1"
+    assert args.port == 25
+    assert args.concurrency == 10
+    assert args.pipelining is False
+    assert args.tls is False
+
+
+def test_build_message_size_and_headers():
+    args = parse_bench_args(
+        ["--size", "4096", "--mode", "bounce", "--delay", "5,10"]
+    )
+    message = Bench(args, loop=mock.MagicMock()).build_message()
+    assert abs(len(message) - 4096) < 10
+    assert b"X-Blackhole-Mode: bounce\r\n" in message
+    assert b"X-Blackhole-Delay: 5,10\r\n" in message
+    assert message.endswith(b"\r\n.\r\n")
+
+
+def test_format_report():
+    args = parse_bench_args([])
+    bench = Bench(args, loop=mock.MagicMock())
+    bench.stats.record("mail", 0.002)
+    bench.stats.incr("messages", 10)
+    text = format_report(bench.report(2))
+    assert "messages/s: 5.0" in text
+    assert "mail" in text
+
+
+async def _serve(loop):
+    sock = _socket("127.0.0.1", 0, socket.AF_INET)
+    server = await loop.create_server(lambda: Smtp([], loop=loop), sock=sock)
+    return server, sock.getsockname()[1]
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+@pytest.mark.parametrize("pipelining", ([], ["--pipelining"]))
+async def test_bench_run(event_loop, pipelining):
+    Config(None).mailname = "blackhole.io"
+    server, port = await _serve(event_loop)
+    args = parse_bench_args(
+        [
+            "--port",
+            str(port),
+            "-c",
+            "3",
+            "-n",
+            "10",
+            "-m",
+            "2",
+            "-r",
+            "3",
+            "--auth",
+            "pass",
+            "--vrfy",
+            "fail",
+            "--mode",
+            "accept",
+        ]
+        + pipelining
+    )
+    report = await Bench(args, loop=event_loop).run()
+    server.close()
+    await server.wait_closed()
+    counters = report["counters"]
+    assert counters["messages"] == 10
+    assert counters["connections"] == 5
+    assert counters["code.250"] == 10
+    assert "errors" not in counters
+    assert report["phases"]["auth"]["count"] == 5
+    assert report["phases"]["vrfy"]["count"] == 10
+    if pipelining:
+        assert report["phases"]["envelope"]["count"] == 10
+    else:
+        assert report["phases"]["rcpt"]["count"] == 30
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_bench_connection_refused(event_loop, unused_tcp_port):
+    args = parse_bench_args(["--port", str(unused_tcp_port), "-n", "2"])
+    report = await Bench(args, loop=event_loop).run()
+    assert report["counters"]["errors"] == 2
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_bench_malformed_reply(event_loop):
+    async def handle(reader, writer):
+        writer.write(b"220 ready\r\n")
+        await reader.readline()
+        writer.write(b"garbage\r\n")
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    args = parse_bench_args(["--port", str(port), "-c", "2", "-n", "2"])
+    report = await Bench(args, loop=event_loop).run()
+    server.close()
+    await server.wait_closed()
+    assert report["counters"]["errors"] == 2
+    assert report["counters"]["connections"] == 2
+    assert "messages" not in report["counters"]
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_run_bench_json():
+    args = parse_bench_args(["--json"])
+    loop = mock.MagicMock()
+    loop.run_until_complete.return_value = {"messages_per_second": 1}
+    with mock.patch("blackhole.bench.Bench.run", mock.MagicMock()), mock.patch(
+        "blackhole.bench.logger.info"
+    ) as mock_info, pytest.raises(SystemExit) as exc:
+        run_bench(args, loop=loop)
+    assert exc.value.code == 0
+    assert json.loads(mock_info.call_args[0][0]) == {"messages_per_second": 1}
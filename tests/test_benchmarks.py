@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import socket
+
+import pytest
+
+from benchmarks.accept_distribution import run_mode
+
+
+from ._utils import cleandir, reset  # noqa: F401; isort:skip
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_accept_distribution_shared():
+    result = run_mode("shared", 2, 6, 2)
+    assert sum(result["accepted"]) == 6
+    assert len(result["cpu"]) == 2
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.skipif(
+    not hasattr(socket, "SO_REUSEPORT"), reason="SO_REUSEPORT not supported"
+)
+def test_accept_distribution_reuse_port():
+    result = run_mode("reuse_port", 2, 6, 2)
+    assert sum(result["accepted"]) == 6
+    assert len(result["cpu"]) == 2
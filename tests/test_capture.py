@@ -0,0 +1,614 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import gzip
+import os
+import signal
+import sqlite3
+import threading
+
+from unittest import mock
+
+import pytest
+
+from blackhole.index import CaptureIndex
+from blackhole.capture import (
+    CODECS,
+    SEGMENT_MAGIC,
+    BatchWriter,
+    CapturePolicy,
+    MaildirWriter,
+    SegmentWriter,
+    compress_segment,
+    compression_pool,
+    encode_record,
+    maildir_path,
+    open_segment,
+    read_record,
+    read_records,
+)
+
+
+from ._utils import (  # noqa: F401; isort:skip
+    Args,
+    cleandir,
+    create_config,
+    create_file,
+    reset,
+)
+
+
+class ListWriter(BatchWriter):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.batches = []
+        self.flushed = threading.Event()
+
+    def write_batch(self, batch):
+        self.batches.append(batch)
+        self.flushed.set()
+
+
+def _segments():
+    return sorted(f for f in os.listdir(os.getcwd()) if f.endswith(".seg"))
+
+
+def test_encode_record():
+    record = encode_record({"code": 250}, b"abc")
+    assert record == b"\x00\x00\x00\x0c\x00\x00\x00\x03" + b'{"code":250}abc'
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_read_records():
+    with open("test.seg", "wb") as segment:
+        segment.write(SEGMENT_MAGIC)
+        segment.write(encode_record({"code": 250}, b"one"))
+        segment.write(encode_record({"code": 550}, b""))
+    assert list(read_records("test.seg")) == [
+        ({"code": 250}, b"one"),
+        ({"code": 550}, b""),
+    ]
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_read_records_not_a_segment():
+    with open("test.seg", "wb") as segment:
+        segment.write(b"nope")
+    with pytest.raises(ValueError):
+        list(read_records("test.seg"))
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_read_records_truncated():
+    with open("test.seg", "wb") as segment:
+        segment.write(SEGMENT_MAGIC)
+        segment.write(encode_record({"code": 250}, b"one")[:-1])
+    with pytest.raises(ValueError):
+        list(read_records("test.seg"))
+    with open("test.seg", "wb") as segment:
+        segment.write(SEGMENT_MAGIC + b"\x00\x00")
+    with pytest.raises(ValueError):
+        list(read_records("test.seg"))
+
+
+def test_flush_on_size():
+    writer = ListWriter(10, 60)
+    writer.start()
+    writer.write({}, b"12345")
+    assert writer.flushed.wait(0.2) is False
+    writer.write({}, b"67890")
+    assert writer.flushed.wait(5) is True
+    writer.close()
+    assert writer.batches == [[({}, b"12345"), ({}, b"67890")]]
+
+
+def test_flush_on_interval():
+    writer = ListWriter(1024, 0.05)
+    writer.start()
+    writer.write({}, b"12345")
+    assert writer.flushed.wait(5) is True
+    writer.close()
+    assert writer.batches == [[({}, b"12345")]]
+
+
+def test_close_flushes():
+    writer = ListWriter(1024, 60)
+    writer.start()
+    writer.write({}, b"12345")
+    writer.close()
+    assert writer.batches == [[({}, b"12345")]]
+    writer.write({}, b"ignored")
+    assert writer.batches == [[({}, b"12345")]]
+
+
+def test_write_error_is_logged():
+    writer = ListWriter(1, 60)
+    writer.write_batch = mock.MagicMock(side_effect=OSError("disk full"))
+    with mock.patch("blackhole.capture.logger.error") as mock_error:
+        writer.start()
+        writer.write({}, b"12345")
+        writer.close()
+    assert mock_error.called is True
+
+
+def test_unexpected_write_error_is_logged():
+    failed = threading.Event()
+    writer = ListWriter(1, 60)
+
+    def write_batch(batch):
+        if not failed.is_set():
+            failed.set()
+            raise RuntimeError("broken pool")
+        ListWriter.write_batch(writer, batch)
+
+    writer.write_batch = write_batch
+    with mock.patch("blackhole.capture.logger.exception") as mock_exception:
+        writer.start()
+        writer.write({}, b"12345")
+        assert failed.wait(5) is True
+        writer.write({}, b"67890")
+        assert writer.flushed.wait(5) is True
+        writer.close()
+    assert mock_exception.call_count == 1
+    assert writer.batches == [[({}, b"67890")]]
+
+
+def test_write_drops_when_queue_full():
+    writer = ListWriter(10, 60)
+    writer.queue_size = 50
+    assert writer.write({}, b"a" * 100) is True
+    assert writer.write({}, b"b") is False
+    writer.start()
+    writer.close()
+    assert writer.batches == [[({}, b"a" * 100)]]
+    assert writer.write({}, b"c") is False
+
+
+def test_write_queues_up_to_limit():
+    writer = ListWriter(10, 60)
+    writer.queue_size = 50
+    for _ in range(5):
+        assert writer.write({}, b"a" * 10) is True
+    assert writer.write({}, b"a") is False
+    writer = ListWriter(100, 60)
+    writer.queue_size = 50
+    for _ in range(20):
+        assert writer.write({}, b"a" * 10) is True
+    assert writer.write({}, b"a") is False
+
+
+def test_batch_writer_is_abstract():
+    with pytest.raises(TypeError):
+        BatchWriter(10, 60)
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_segment_writer():
+    writer = SegmentWriter(os.getcwd(), "worker-1", 1024, 1024, 60)
+    writer.start()
+    writer.write({"code": 250}, b"one")
+    writer.write({"code": 451}, b"two")
+    writer.close()
+    assert _segments() == ["worker-1-000001.seg"]
+    assert list(read_records("worker-1-000001.seg")) == [
+        ({"code": 250}, b"one"),
+        ({"code": 451}, b"two"),
+    ]
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_segment_writer_rotates():
+    writer = SegmentWriter(os.getcwd(), "worker-1", 100, 1, 60)
+    writer.start()
+    for payload in (b"a" * 40, b"b" * 40, b"c" * 200, b"d"):
+        writer.write({}, payload)
+    writer.close()
+    segments = _segments()
+    assert segments == [
+        "worker-1-000001.seg",
+        "worker-1-000002.seg",
+        "worker-1-000003.seg",
+        "worker-1-000004.seg",
+    ]
+    records = [[p for _, p in read_records(s)] for s in segments]
+    assert records == [[b"a" * 40], [b"b" * 40], [b"c" * 200], [b"d"]]
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_segment_writer_rotates_within_batch():
+    writer = SegmentWriter(os.getcwd(), "worker-1", 100, 1024, 60)
+    writer.write_batch([({}, b"a" * 30), ({}, b"b" * 30), ({}, b"c" * 30)])
+    writer.finish()
+    segments = _segments()
+    records = [[p for _, p in read_records(s)] for s in segments]
+    assert records == [[b"a" * 30, b"b" * 30], [b"c" * 30]]
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_segment_writer_skips_existing_segments():
+    create_file("worker-1-000001.seg", "existing")
+    writer = SegmentWriter(os.getcwd(), "worker-1", 1024, 1024, 60)
+    writer.write_batch([({}, b"new")])
+    writer.finish()
+    assert writer.path.endswith("worker-1-000002.seg")
+    with open("worker-1-000001.seg") as existing:
+        assert existing.read() == "existing"
+    assert list(read_records(writer.path)) == [({}, b"new")]
+
+
+def _metadata(**kwargs):
+    metadata = {
+        "timestamp": 1600000000.5,
+        "mail_from": "sender@example.com",
+        "rcpt_to": ["one@example.com", "two@example.com"],
+        "message_id": "<1.2.3@blackhole.io>",
+    }
+    metadata.update(kwargs)
+    return metadata
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_maildir_writer():
+    writer = MaildirWriter("Maildir", 1024, 60)
+    writer.start()
+    writer.write(_metadata(), b"Subject: one\r\n\r\none\r\n")
+    writer.write(_metadata(), b"Subject: two\r\n\r\ntwo\r\n")
+    with mock.patch("os.fsync") as mock_fsync:
+        writer.close()
+    assert mock_fsync.call_count == 2
+    assert os.listdir("Maildir/tmp") == []
+    assert os.listdir("Maildir/cur") == []
+    assert sorted(os.listdir("Maildir/new")) == [
+        "1600000000.1_2_3_1.blackhole.io",
+        "1600000000.1_2_3_2.blackhole.io",
+    ]
+    with open("Maildir/new/1600000000.1_2_3_1.blackhole.io", "rb") as msg:
+        assert msg.read() == (
+            b"Return-Path: <sender@example.com>\r\n"
+            b"Delivered-To: one@example.com\r\n"
+            b"Delivered-To: two@example.com\r\n"
+            b"Subject: one\r\n\r\none\r\n"
+        )
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_maildir_writer_syncs_messages_before_rename():
+    calls = mock.MagicMock()
+    rename = os.rename
+    calls.rename.side_effect = rename
+    writer = MaildirWriter("Maildir", 1024, 60, threads=1)
+    writer.start()
+    writer.write(_metadata(), b"Subject: one\r\n\r\none\r\n")
+    writer.write(_metadata(), b"Subject: two\r\n\r\ntwo\r\n")
+    write_tmp = writer._write_tmp
+    calls.write_tmp.side_effect = write_tmp
+    with mock.patch("os.fdatasync", calls.fdatasync), mock.patch(
+        "os.fsync", calls.fsync
+    ), mock.patch("os.rename", calls.rename), mock.patch.object(
+        writer, "_write_tmp", calls.write_tmp
+    ):
+        writer.close()
+    names = [name for name, __, __ in calls.mock_calls]
+    assert names == [
+        "write_tmp",
+        "write_tmp",
+        "fdatasync",
+        "fdatasync",
+        "fsync",
+        "rename",
+        "rename",
+        "fsync",
+    ]
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_maildir_readable_by_mailbox():
+    import mailbox
+
+    writer = MaildirWriter("Maildir", 1024, 60)
+    writer.start()
+    writer.write(_metadata(mail_from=None), b"Subject: test\r\n\r\ntest\r\n")
+    writer.close()
+    messages = list(mailbox.Maildir("Maildir", create=False))
+    assert len(messages) == 1
+    assert messages[0]["Subject"] == "test"
+    assert messages[0]["Return-Path"] == "<>"
+
+
+def test_maildir_filename_escapes():
+    writer = MaildirWriter.__new__(MaildirWriter)
+    writer.delivered = 0
+    name = writer.filename(_metadata(message_id="<a/b:c@blackhole.io>"))
+    assert name == "1600000000.a\\057b\\072c_1.blackhole.io"
+
+
+def _write_segment(path, records):
+    with open(path, "wb") as segment:
+        segment.write(SEGMENT_MAGIC)
+        for metadata, payload in records:
+            segment.write(encode_record(metadata, payload))
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_compress_segment():
+    records = [({"code": 250}, b"one" * 1000), ({"code": 451}, b"two")]
+    for codec, (ext, __) in CODECS.items():
+        _write_segment("test.seg", records)
+        assert compress_segment("test.seg", codec, 1) == "test.seg" + ext
+        assert os.path.exists("test.seg") is False
+        assert os.path.exists("test.seg{0}.part".format(ext)) is False
+        assert os.path.getsize("test.seg" + ext) < 3000
+        assert list(read_records("test.seg" + ext)) == records
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_zlib_segments_are_gzip():
+    _write_segment("test.seg", [({}, b"one")])
+    compress_segment("test.seg", "zlib", 9)
+    with gzip.open("test.seg.gz") as segment:
+        assert segment.read(len(SEGMENT_MAGIC)) == SEGMENT_MAGIC
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_open_segment_streams():
+    _write_segment("test.seg", [({}, b"x" * 100000)])
+    compress_segment("test.seg", "lzma", 6)
+    with mock.patch("lzma.LZMAFile.read") as mock_read:
+        mock_read.side_effect = [SEGMENT_MAGIC, b""]
+        list(read_records("test.seg.xz"))
+    assert mock_read.call_args_list == [
+        mock.call(len(SEGMENT_MAGIC)),
+        mock.call(8),
+    ]
+    with open_segment("test.seg.xz") as segment:
+        assert segment.read(len(SEGMENT_MAGIC)) == SEGMENT_MAGIC
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_segment_writer_compresses():
+    writer = SegmentWriter(
+        os.getcwd(), "worker-1", 65536, 1, 60, codec="bz2", level=9
+    )
+    writer.start()
+    writer.write({}, b"a" * 40000)
+    writer.write({}, b"b" * 40000)
+    writer.close()
+    assert _segments() == []
+    assert sorted(os.listdir(os.getcwd())) == [
+        "worker-1-000001.seg.bz2",
+        "worker-1-000002.seg.bz2",
+    ]
+    assert [p for _, p in read_records("worker-1-000002.seg.bz2")] == [
+        b"b" * 40000
+    ]
+
+
+def _compressor_state(fd):
+    try:
+        os.fstat(fd)
+        closed = False
+    except OSError:
+        closed = True
+    handlers = [
+        signal.getsignal(signum)
+        for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGUSR2)
+    ]
+    return closed, handlers
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_compression_pool():
+    read_fd, write_fd = os.pipe()
+    previous = signal.signal(signal.SIGUSR2, lambda *args: None)
+    try:
+        pool = compression_pool([read_fd])
+        closed, handlers = pool.submit(_compressor_state, read_fd).result()
+        pool.shutdown()
+    finally:
+        signal.signal(signal.SIGUSR2, previous)
+    os.fstat(read_fd)
+    os.close(read_fd)
+    os.close(write_fd)
+    assert closed is True
+    assert handlers == [signal.SIG_DFL] * 3
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.skipif(
+    not hasattr(os, "sched_setaffinity"), reason="CPU affinity not supported"
+)
+def test_compression_pool_cpus():
+    cpus = sorted(os.sched_getaffinity(0))
+    pool = compression_pool(cpus=cpus[-1:])
+    assert pool.submit(os.sched_getaffinity, 0).result() == {cpus[-1]}
+    pool.shutdown()
+    pool = compression_pool()
+    assert pool.submit(os.sched_getaffinity, 0).result() == set(cpus)
+    pool.shutdown()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_segment_writers_share_pool():
+    pool = compression_pool()
+    writers = [
+        SegmentWriter(
+            os.getcwd(), prefix, 65536, 1, 60, codec="bz2", level=1, pool=pool
+        )
+        for prefix in ("worker-1-a", "worker-1-b")
+    ]
+    with mock.patch("concurrent.futures.ProcessPoolExecutor") as mock_pool:
+        for writer in writers:
+            writer.start()
+            writer.write({}, b"a" * 100)
+        for writer in writers:
+            writer.close()
+    assert mock_pool.called is False
+    assert sorted(os.listdir(os.getcwd())) == [
+        "worker-1-a-000001.seg.bz2",
+        "worker-1-b-000001.seg.bz2",
+    ]
+    assert pool.submit(os.getpid).result() != os.getpid()
+    pool.shutdown()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_segment_writer_skips_compressed_segments():
+    create_file("worker-1-000001.seg.xz", "existing")
+    writer = SegmentWriter(os.getcwd(), "worker-1", 1024, 1024, 60)
+    writer.write_batch([({}, b"new")])
+    writer.finish()
+    assert writer.path.endswith("worker-1-000002.seg")
+
+
+def test_compression_error_is_logged():
+    writer = SegmentWriter(os.getcwd(), "worker-1", 1024, 1024, 60)
+    future = mock.MagicMock()
+    future.exception.return_value = OSError("disk full")
+    with mock.patch("blackhole.capture.logger.error") as mock_error:
+        writer._compressed(future)
+    assert mock_error.called is True
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_segment_writer_index():
+    index = CaptureIndex.for_directory(os.getcwd())
+    writer = SegmentWriter(os.getcwd(), "worker-1", 500, 1024, 60, index=index)
+    writer.start()
+    for idx in range(3):
+        metadata = _metadata(message_id="<{0}@blackhole.io>".format(idx))
+        metadata["code"] = 250
+        writer.write(metadata, str(idx).encode("utf-8") * 50)
+    writer.close()
+    assert index._conn is None
+    messages = index.lookup(rcpt_to="two@example.com")
+    assert [m["location"] for m in messages] == [
+        "worker-1-000001.seg",
+        "worker-1-000001.seg",
+        "worker-1-000002.seg",
+    ]
+    for idx, message in enumerate(messages):
+        path = os.path.join(os.getcwd(), message["location"])
+        metadata, payload = read_record(path, message["offset"])
+        assert metadata["message_id"] == message["message_id"]
+        assert payload == str(idx).encode("utf-8") * 50
+    index.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_read_record_compressed():
+    _write_segment("test.seg", [({"n": 1}, b"one"), ({"n": 2}, b"two")])
+    offset = len(SEGMENT_MAGIC) + len(encode_record({"n": 1}, b"one"))
+    compress_segment("test.seg", "zlib", 6)
+    assert read_record("test.seg", offset) == ({"n": 2}, b"two")
+    assert read_record("test.seg.gz", offset) == ({"n": 2}, b"two")
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_maildir_writer_index():
+    index = CaptureIndex.for_directory("Maildir")
+    writer = MaildirWriter("Maildir", 1024, 60, index=index)
+    writer.start()
+    metadata = _metadata()
+    metadata["code"] = 550
+    writer.write(metadata, b"Subject: test\r\n\r\ntest\r\n")
+    writer.close()
+    message = index.lookup(message_id="<1.2.3@blackhole.io>")[0]
+    assert message["code"] == 550
+    assert message["offset"] is None
+    assert message["location"] == "1600000000.1_2_3_1.blackhole.io"
+    path = maildir_path("Maildir", message["location"])
+    with open(path, "rb") as msg:
+        assert len(msg.read()) == message["length"]
+    index.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_maildir_path():
+    name = "1600000000.1_2_3_1.blackhole.io"
+    for sub in ("new", "cur"):
+        os.makedirs(os.path.join("Maildir", sub))
+    with pytest.raises(FileNotFoundError):
+        maildir_path("Maildir", name)
+    create_file(os.path.join("Maildir", "new", name))
+    assert maildir_path("Maildir", name) == os.path.join(
+        "Maildir", "new", name
+    )
+    os.rename(
+        os.path.join("Maildir", "new", name),
+        os.path.join("Maildir", "cur", name),
+    )
+    assert maildir_path("Maildir", name) == os.path.join(
+        "Maildir", "cur", name
+    )
+    os.rename(
+        os.path.join("Maildir", "cur", name),
+        os.path.join("Maildir", "cur", name + ":2,S"),
+    )
+    assert maildir_path("Maildir", name) == os.path.join(
+        "Maildir", "cur", name + ":2,S"
+    )
+    with pytest.raises(FileNotFoundError):
+        maildir_path("Maildir", name[:-3])
+
+
+def test_index_error_is_logged():
+    index = mock.MagicMock()
+    index.add.side_effect = sqlite3.OperationalError("database is locked")
+    writer = ListWriter(1024, 60)
+    writer.index = index
+    with mock.patch("blackhole.capture.logger.error") as mock_error:
+        writer.index_batch([({}, "a.seg", 8, 10)])
+    assert mock_error.called is True
+
+
+def test_capture_policy_apply():
+    message = b"Subject: test\r\n\r\nbody\r\n"
+    assert CapturePolicy().apply(message) == (message, False)
+    assert CapturePolicy("headers").apply(message) == (
+        b"Subject: test\r\n\r\n",
+        True,
+    )
+    assert CapturePolicy("headers").apply(b"Subject: test\n\nbody") == (
+        b"Subject: test\n\n",
+        True,
+    )
+    assert CapturePolicy("headers").apply(b"Subject: test") == (
+        b"Subject: test",
+        False,
+    )
+    assert CapturePolicy("full", max_bytes=4).apply(message) == (b"Subj", True)
+    assert CapturePolicy("full", max_bytes=100).apply(message) == (
+        message,
+        False,
+    )
+
+
+def test_capture_policy_sample():
+    assert CapturePolicy().sample() is True
+    assert CapturePolicy("none").sample() is False
+    assert CapturePolicy("full", 0).enabled is False
+    policy = CapturePolicy("full", 0.25)
+    with mock.patch("random.random", side_effect=(0.1, 0.25, 0.9)):
+        assert [policy.sample() for __ in range(3)] == [True, False, False]
@@ -26,13 +26,16 @@
 import asyncio
 import os
 import socket
+import struct
 
 from unittest import mock
 
 import pytest
 
 from blackhole import protocols
+from blackhole.capture import MaildirWriter, SegmentWriter
 from blackhole.child import Child
+from blackhole.config import Config
 from blackhole.control import _socket
 from blackhole.streams import StreamProtocol
 
@@ -74,6 +77,176 @@ def test_start():
     assert mock_exit.called is True
 
 
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_start_loop_monitor():
+    cfile = create_config(("loop_monitor=true",))
+    Config(cfile).load()
+    child = Child("", "", [], "1")
+    with mock.patch("asyncio.Task"), mock.patch(
+        "blackhole.child.Child.heartbeat"
+    ), mock.patch("{0}.run_forever".format(_LOOP)), mock.patch(
+        "{0}.call_soon".format(_LOOP)
+    ) as mock_call_soon, mock.patch(
+        "blackhole.child.Child.stop"
+    ), mock.patch(
+        "os._exit"
+    ):
+        child.start()
+    assert child.monitor.threshold == 0.1
+    mock_call_soon.assert_called_once_with(child.monitor.start)
+    child.loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_start_capture():
+    cfile = create_config(
+        ("capture_dir={0}".format(os.getcwd()), "capture_flush_interval=50")
+    )
+    Config(cfile).load()
+    child = Child("", "", [], "1")
+    with mock.patch("asyncio.Task"), mock.patch(
+        "blackhole.child.Child.heartbeat"
+    ), mock.patch("{0}.run_forever".format(_LOOP)), mock.patch(
+        "blackhole.child.Child.start_capture"
+    ) as mock_capture, mock.patch(
+        "blackhole.child.Child.stop"
+    ), mock.patch(
+        "os._exit"
+    ):
+        child.start()
+    assert mock_capture.called is True
+    child.loop.close()
+
+
+def _capture_sock(port):
+    sock = mock.MagicMock()
+    sock.getsockname.return_value = ("127.0.0.1", port)
+    return {"sock": sock, "ssl": None}
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_start_capture_per_listener():
+    cfile = create_config(
+        (
+            "listen=:1025, :1026 capture_codec=lzma capture_level=9, "
+            ":1027 capture_codec=none",
+            "capture_dir={0}".format(os.getcwd()),
+            "capture_codec=zlib",
+        )
+    )
+    Config(cfile).load()
+    socks = [_capture_sock(port) for port in (1025, 1026, 1027, 1028)]
+    child = Child(3, 4, socks, "1", cpus=[0, 1])
+    calls = mock.MagicMock()
+    with mock.patch("blackhole.child.SegmentWriter", calls.writer), mock.patch(
+        "blackhole.child.compression_pool", calls.pool
+    ):
+        child.start_capture(Config())
+    assert set(child.captures) == {(None, None), ("lzma", 9), ("zlib", 6)}
+    assert calls.writer.return_value.start.call_count == 3
+    assert [name for name, __, __ in calls.mock_calls][:2] == [
+        "pool",
+        "writer",
+    ]
+    fds = [sock["sock"].fileno.return_value for sock in socks]
+    calls.pool.assert_called_once_with(fds + [3, 4], cpus=[0, 1])
+    for writer_call in calls.writer.call_args_list:
+        assert writer_call[1]["pool"] is calls.pool.return_value
+    assert socks[0]["capture"] is child.captures[("zlib", 6)]
+    assert socks[1]["capture"] is child.captures[("lzma", 9)]
+    assert socks[2]["capture"] is child.captures[(None, None)]
+    assert socks[3]["capture"] is child.captures[("zlib", 6)]
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_capture_options_maildir():
+    cfile = create_config(
+        (
+            "listen=:1025 capture_codec=lzma",
+            "capture_format=maildir",
+        )
+    )
+    config = Config(cfile).load()
+    child = Child("", "", [], "1")
+    assert child.capture_options(_capture_sock(1025), config) == (None, None)
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_start_capture_policies():
+    cfile = create_config(
+        (
+            "listen=:1025, :1026 capture_policy=none, "
+            ":1027 capture_sample_rate=0.25 capture_max_bytes=100, "
+            ":1028 capture_sample_rate=0",
+            "capture_dir={0}".format(os.getcwd()),
+            "capture_policy=headers",
+        )
+    )
+    Config(cfile).load()
+    socks = [_capture_sock(port) for port in (1025, 1026, 1027, 1028)]
+    child = Child("", "", socks, "1")
+    with mock.patch("blackhole.child.SegmentWriter"), mock.patch(
+        "blackhole.child.compression_pool"
+    ) as mock_pool:
+        child.start_capture(Config())
+    assert mock_pool.called is False
+    assert child.compressor is None
+    policy = socks[0]["capture_policy"]
+    assert (policy.policy, policy.sample_rate, policy.max_bytes) == (
+        "headers",
+        1.0,
+        0,
+    )
+    policy = socks[2]["capture_policy"]
+    assert (policy.policy, policy.sample_rate, policy.max_bytes) == (
+        "headers",
+        0.25,
+        100,
+    )
+    for sock in (socks[1], socks[3]):
+        assert "capture" not in sock
+        assert "capture_policy" not in sock
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_capture_writer():
+    cfile = create_config(
+        ("capture_dir={0}".format(os.getcwd()), "capture_format=maildir")
+    )
+    config = Config(cfile).load()
+    child = Child("", "", [], "1")
+    writer = child.capture_writer(config)
+    assert isinstance(writer, MaildirWriter)
+    assert writer.directory == os.getcwd()
+    assert writer.flush_interval == 1
+    config.capture_format = "segment"
+    writer = child.capture_writer(config)
+    assert isinstance(writer, SegmentWriter)
+    assert writer.prefix == "worker-1"
+    assert writer.codec is None
+    writer = child.capture_writer(config, "bz2", 3)
+    assert writer.prefix == "worker-1-bz2-3"
+    assert writer.codec == "bz2"
+    assert writer.level == 3
+    assert writer.index is None
+    config.capture_index = "true"
+    writer = child.capture_writer(config)
+    assert writer.index.path == os.path.join(os.getcwd(), "index.sqlite")
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_stop_capture():
+    child = Child("", "", [], "1")
+    child.loop = mock.MagicMock()
+    child.heartbeat_task = mock.MagicMock()
+    child.server_task = mock.MagicMock()
+    capture = mock.MagicMock()
+    child.captures[(None, None)] = capture
+    with mock.patch("os._exit"):
+        child.stop()
+    assert capture.close.called is True
+
+
 @pytest.mark.usefixtures("reset", "cleandir")
 def test_stop():
     socks = [{"sock": None, "ssl": None}, {"sock": None, "ssl": "abc"}]
@@ -121,6 +294,27 @@ async def test_start_child_loop(event_loop):
         server.close()
 
 
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_start_child_loop_starttls(event_loop):
+    sock = _socket("127.0.0.1", 0, socket.AF_INET)
+    ctx = mock.MagicMock()
+    socks = ({"sock": sock, "ssl": None, "starttls": ctx},)
+    child = Child("", "", socks, "1")
+    child.loop = event_loop
+    with mock.patch("blackhole.child.Smtp") as mock_smtp:
+        await child._start()
+        transport, _ = await event_loop.create_connection(
+            asyncio.Protocol, *sock.getsockname()
+        )
+        await asyncio.sleep(0.1)
+        transport.close()
+    assert mock_smtp.call_args[1]["tls_context"] is ctx
+    assert child.tls_contexts() == [ctx]
+    for server in child.servers:
+        server.close()
+
+
 @pytest.mark.usefixtures("reset", "cleandir")
 @pytest.mark.asyncio
 async def test_child_heartbeat_not_started(event_loop):
@@ -170,3 +364,109 @@ async def test_child_heartbeat_started(event_loop):
     assert mock_task.called is True
     assert mock_start.called is True
     assert mock_stop.called is True
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_profile_schedules_start():
+    child = Child("", "", [], "1")
+    child.loop = mock.MagicMock()
+    child.profile()
+    child.loop.call_soon_threadsafe.assert_called_once_with(
+        child.start_profile
+    )
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_profile(event_loop):
+    cfile = create_config(
+        ("profile_dir={0}".format(os.getcwd()), "profile_duration=1")
+    )
+    Config(cfile).load()
+    child = Child("", "", [], "1")
+    child.loop = event_loop
+    with mock.patch.object(event_loop, "call_later") as mock_later:
+        child.start_profile()
+        child.start_profile()
+    assert mock_later.call_count == 1
+    assert child.profiler is not None
+    await child.stop_profile()
+    assert child.profiler is None
+    profiles = [f for f in os.listdir(".") if f.endswith(".prof")]
+    assert len(profiles) == 1
+    assert profiles[0].startswith("blackhole-child-1-")
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_profile_write_error(event_loop):
+    cfile = create_config(("profile_dir=/fake/path",))
+    Config(cfile).load()
+    child = Child("", "", [], "1")
+    child.loop = event_loop
+    with mock.patch.object(event_loop, "call_later"):
+        child.start_profile()
+    with mock.patch("blackhole.child.logger.error") as mock_error:
+        await child.stop_profile()
+    assert mock_error.called is True
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_set_ticket_keys():
+    ctx = mock.MagicMock()
+    socks = [
+        {"sock": None, "ssl": None},
+        {"sock": None, "ssl": ctx},
+        {"sock": None, "ssl": ctx},
+    ]
+    child = Child("", "", socks, "1")
+    with mock.patch("blackhole.child.set_ticket_keys") as mock_set:
+        child.set_ticket_keys(b"keys")
+    mock_set.assert_called_once_with(ctx, b"keys")
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_child_heartbeat_ticket_keys(event_loop):
+    up_read, up_write = os.pipe()
+    down_read, down_write = os.pipe()
+    os.write(up_write, protocols.TICKET_KEYS + struct.pack(">I", 4) + b"keys")
+    os.close(up_write)
+    os.close(down_read)
+    child = Child(up_read, down_write, [], "1")
+    child.loop = event_loop
+    child._started = True
+
+    def stop(keys):
+        child._started = False
+
+    with mock.patch("asyncio.Task"), mock.patch(
+        "blackhole.child.Child._start"
+    ), mock.patch("blackhole.child.Child.stop"), mock.patch(
+        "blackhole.child.Child.set_ticket_keys", side_effect=stop
+    ) as mock_set:
+        await child.heartbeat()
+    mock_set.assert_called_once_with(b"keys")
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_reload_tls():
+    cfile = create_config(("tls_cert=/a.crt", "tls_key=/a.key"))
+    Config(cfile).load()
+    ctx = mock.MagicMock()
+    socks = [{"sock": None, "ssl": ctx}, {"sock": None, "ssl": ctx}]
+    child = Child("", "", socks, "1")
+    with mock.patch("blackhole.child.load_certificates") as mock_load:
+        child.reload_tls()
+    mock_load.assert_called_once_with(ctx, "/a.crt", "/a.key", None)
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_reload_tls_error():
+    ctx = mock.MagicMock()
+    child = Child("", "", [{"sock": None, "ssl": ctx}], "1")
+    with mock.patch(
+        "blackhole.child.load_certificates", side_effect=OSError
+    ), mock.patch("blackhole.child.logger.error") as mock_error:
+        child.reload_tls()
+    assert mock_error.called is True
@@ -27,6 +27,7 @@ import getpass
 import grp
 import logging
 import os
+import pwd
 import socket
 import time
 import unittest
@@ -131,6 +132,14 @@ def test_invalid_options():
         Config(cfile).load()
 
 
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_invalid_option_suggestion():
+    cfile = create_config(("worker=2",))
+    with pytest.raises(ConfigException) as exc:
+        Config(cfile).load()
+    assert "Did you mean 'workers'?" in str(exc.value)
+
+
 @pytest.mark.usefixtures("reset", "cleandir")
 class TestCmdParser(unittest.TestCase):
     def test_default_conf(self):
@@ -278,6 +287,243 @@ class TestListen(unittest.TestCase):
         conf = Config(cfile).load()
         assert conf.flags_from_listener("::1", 25) == {"mode": "bounce"}
 
+    def test_socket_flags(self):
+        cfile = create_config(
+            (
+                "listen=:25 backlog=4096 defer_accept=5 fastopen=256 "
+                "nodelay=false rcvbuf=65536 sndbuf=131072 user_timeout=30000 "
+                "mode=bounce",
+            )
+        )
+        conf = Config(cfile).load()
+        assert conf.listen == [
+            (
+                "",
+                25,
+                socket.AF_INET,
+                {
+                    "backlog": 4096,
+                    "defer_accept": 5,
+                    "fastopen": 256,
+                    "nodelay": False,
+                    "rcvbuf": 65536,
+                    "sndbuf": 131072,
+                    "user_timeout": 30000,
+                    "mode": "bounce",
+                },
+            )
+        ]
+        conf.test_socket_flags()
+
+    def test_socket_flags_invalid(self):
+        for flag in (
+            "backlog=0",
+            "backlog=65536",
+            "backlog=abc",
+            "defer_accept=3601",
+            "fastopen=-1",
+            "nodelay=maybe",
+            "rcvbuf=0",
+            "user_timeout=1.5",
+        ):
+            cfile = create_config(("listen=:25 {0}".format(flag),))
+            with pytest.raises(ConfigException):
+                Config(cfile).load()
+
+    def test_proto_flag(self):
+        cfile = create_config(("listen=:24 proto=lmtp, :25 proto=smtp",))
+        conf = Config(cfile).load()
+        assert conf.flags_from_listener("", 24) == {"proto": "lmtp"}
+        assert conf.flags_from_listener("", 25) == {"proto": "smtp"}
+
+    def test_proto_flag_invalid(self):
+        cfile = create_config(("listen=:25 proto=esmtp",))
+        with pytest.raises(ConfigException):
+            Config(cfile).load()
+
+    def test_port_range(self):
+        cfile = create_config(("listen=:2500-2502 mode=bounce, :::25",))
+        conf = Config(cfile).load()
+        flags = {"mode": "bounce"}
+        assert conf.listen == [
+            ("", 2500, socket.AF_INET, flags),
+            ("", 2501, socket.AF_INET, flags),
+            ("", 2502, socket.AF_INET, flags),
+            ("::", 25, socket.AF_INET6, {}),
+        ]
+        assert conf.flags_from_listener("127.0.0.1", 2501) == flags
+        assert conf.flags_from_listener("127.0.0.1", 2503) == {}
+
+    def test_port_range_invalid(self):
+        for listener in (":2502-2500", ":25-abc", ":-25", ":1-70000"):
+            cfile = create_config(("listen={0}".format(listener),))
+            with pytest.raises(ConfigException):
+                Config(cfile).load()
+
+    def test_network(self):
+        cfile = create_config(("listen=10.0.0.0/30:25-26 delay=5",))
+        conf = Config(cfile).load()
+        assert [(addr, port) for addr, port, __, __ in conf.listen] == [
+            ("10.0.0.1", 25),
+            ("10.0.0.1", 26),
+            ("10.0.0.2", 25),
+            ("10.0.0.2", 26),
+        ]
+        assert conf.flags_from_listener("10.0.0.2", 26) == {"delay": "5"}
+
+    def test_network_single_address(self):
+        cfile = create_config(("listen=10.0.0.1/32:25, fd00::1/128:25",))
+        conf = Config(cfile).load()
+        assert conf.listen == [
+            ("10.0.0.1", 25, socket.AF_INET, {}),
+            ("fd00::1", 25, socket.AF_INET6, {}),
+        ]
+
+    def test_network_invalid(self):
+        for listener in ("10.0.0.300/30:25", "10.0.0.0/8:25", "fd00::/64:25"):
+            cfile = create_config(("listen={0}".format(listener),))
+            with pytest.raises(ConfigException):
+                Config(cfile).load()
+
+    def test_network_expands_too_far(self):
+        cfile = create_config(("listen=10.0.0.0/24:1000-1999",))
+        with pytest.raises(ConfigException):
+            Config(cfile).load()
+
+    def test_flags_index_follows_listen(self):
+        cfile = create_config(("listen=:25 mode=bounce",))
+        conf = Config(cfile).load()
+        assert conf.flags_from_listener("", 25) == {"mode": "bounce"}
+        conf.listen = ":25 mode=random"
+        assert conf.flags_from_listener("", 25) == {"mode": "random"}
+
+    def test_same_listeners(self):
+        cfile = create_config(("listen=:1025, 127.0.0.1:1026, :1025",))
+        conf = Config(cfile).load()
+        with pytest.raises(ConfigException):
+            conf.test_same_listeners()
+
+    def test_same_tls_listeners(self):
+        cfile = create_config(("tls_listen=:1465, :1465",))
+        conf = Config(cfile).load()
+        with pytest.raises(ConfigException):
+            conf.test_same_listeners()
+
+    def test_port_binds_each_listener_once(self):
+        cfile = create_config(
+            ("listen=127.0.0.1:1025, 127.0.0.1:1026, 127.0.0.1:1025",)
+        )
+        conf = Config(cfile).load()
+        with mock.patch("socket.socket") as mock_socket:
+            conf.test_port()
+        assert mock_socket.call_count == 2
+
+    def test_port_checks_permissions_before_binding(self):
+        cfile = create_config(("listen=127.0.0.1:1025, 127.0.0.1:25",))
+        conf = Config(cfile).load()
+        with mock.patch("os.getuid", return_value=9000), mock.patch(
+            "socket.socket"
+        ) as mock_socket, pytest.raises(ConfigException):
+            conf.test_port()
+        assert mock_socket.called is False
+
+    def test_socket_flags_not_supported(self):
+        cfile = create_config(("listen=:25 defer_accept=5",))
+        conf = Config(cfile).load()
+        with mock.patch("blackhole.config.socket") as mock_socket:
+            del mock_socket.TCP_DEFER_ACCEPT
+            with pytest.raises(ConfigException):
+                conf.test_socket_flags()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestUnixListen(unittest.TestCase):
+    def test_unix_listener(self):
+        path = os.path.join(os.getcwd(), "smtp.sock")
+        cfile = create_config(("listen=unix:{0} mode=bounce".format(path),))
+        conf = Config(cfile).load()
+        assert conf.listen == [
+            (path, None, socket.AF_UNIX, {"mode": "bounce"})
+        ]
+        assert conf.flags_from_sockname(path) == {"mode": "bounce"}
+        conf.test_port()
+
+    def test_unix_and_tcp_listeners(self):
+        cfile = create_config(("listen=:25, unix:/tmp/smtp.sock",))
+        conf = Config(cfile).load()
+        assert conf.listen == [
+            ("", 25, socket.AF_INET, {}),
+            ("/tmp/smtp.sock", None, socket.AF_UNIX, {}),
+        ]
+        assert conf.flags_from_sockname(("127.0.0.1", 25)) == {}
+
+    def test_unix_flags(self):
+        user = pwd.getpwuid(os.getuid()).pw_name
+        group = grp.getgrgid(os.getgid()).gr_name
+        cfile = create_config(
+            (
+                "listen=unix:/tmp/smtp.sock owner={0} group={1} perm=660 "
+                "backlog=16".format(user, group),
+            )
+        )
+        conf = Config(cfile).load()
+        assert conf.listen[0][3] == {
+            "owner": user,
+            "group": group,
+            "perm": 0o660,
+            "backlog": 16,
+        }
+
+    def test_relative_path(self):
+        cfile = create_config(("listen=unix:smtp.sock",))
+        with pytest.raises(ConfigException):
+            Config(cfile).load()
+
+    def test_tcp_flag_on_unix(self):
+        cfile = create_config(("listen=unix:/tmp/smtp.sock nodelay=true",))
+        with pytest.raises(ConfigException):
+            Config(cfile).load()
+
+    def test_unix_flag_on_tcp(self):
+        cfile = create_config(("listen=:25 perm=660",))
+        with pytest.raises(ConfigException):
+            Config(cfile).load()
+
+    def test_invalid_unix_flags(self):
+        for flag in (
+            "perm=abc",
+            "perm=1777",
+            "owner=blackhole-no-such-user",
+            "group=blackhole-no-such-group",
+        ):
+            cfile = create_config(
+                ("listen=unix:/tmp/smtp.sock {0}".format(flag),)
+            )
+            with pytest.raises(ConfigException):
+                Config(cfile).load()
+
+    def test_no_directory(self):
+        path = os.path.join(os.getcwd(), "missing", "smtp.sock")
+        cfile = create_config(("listen=unix:{0}".format(path),))
+        conf = Config(cfile).load()
+        with pytest.raises(ConfigException):
+            conf.test_port()
+
+    def test_not_a_socket(self):
+        path = create_file("smtp.sock")
+        cfile = create_config(("tls_listen=unix:{0}".format(path),))
+        conf = Config(cfile).load()
+        with pytest.raises(ConfigException):
+            conf.test_tls_port()
+
+    def test_no_permission(self):
+        cfile = create_config(("listen=unix:/tmp/smtp.sock",))
+        conf = Config(cfile).load()
+        with mock.patch("os.access", return_value=False), pytest.raises(
+            ConfigException
+        ):
+            conf.test_port()
+
 
 @pytest.mark.usefixtures("reset", "cleandir")
 class TestPort(unittest.TestCase):
@@ -607,8 +853,7 @@ class TestTls(unittest.TestCase):
         settings = ("tls_cert={}".format(cert), "tls_key={}".format(key))
         cfile = create_config(settings)
         conf = Config(cfile).load()
-        with pytest.raises(ConfigException):
-            conf.test_tls_settings()
+        conf.test_tls_settings()
         assert conf.tls_listen == []
         assert conf.tls_cert == cert
         assert conf.tls_key == key
@@ -882,15 +1127,549 @@ class TestWorkers(unittest.TestCase):
         assert conf.workers == 1
 
     def test_more_than_cpus(self):
-        conf = Config(None).load()
+        cfile = create_config(("workers=2",))
+        conf = Config(cfile).load()
         with mock.patch(
-            "multiprocessing.cpu_count", return_value=0
+            "blackhole.config.available_cpus", return_value=[0]
         ), pytest.raises(ConfigException):
             conf.test_workers()
 
     def test_ok(self):
         cfile = create_config(("workers=4",))
         conf = Config(cfile).load()
-        with mock.patch("multiprocessing.cpu_count", return_value=4):
+        with mock.patch(
+            "blackhole.config.available_cpus", return_value=[0, 1, 2, 3]
+        ):
             conf.test_workers()
         assert conf.workers is 4
+
+    def test_auto(self):
+        cfile = create_config(("workers=auto",))
+        conf = Config(cfile).load()
+        with mock.patch(
+            "blackhole.config.usable_cpus", return_value=3
+        ), mock.patch(
+            "blackhole.config.available_cpus", return_value=[0, 1, 2, 3]
+        ):
+            conf.test_workers()
+            assert conf.workers == 3
+
+    def test_auto_cpu_affinity(self):
+        cfile = create_config(("workers=auto", "cpu_affinity=true"))
+        conf = Config(cfile).load()
+        with mock.patch(
+            "blackhole.config.usable_cpus", return_value=4
+        ), mock.patch(
+            "blackhole.config.available_cpus", return_value=[0, 1, 2, 3]
+        ):
+            conf.test_workers()
+            assert conf.workers == 3
+
+    def test_auto_cpu_affinity_single_cpu(self):
+        cfile = create_config(("workers=auto", "cpu_affinity=true"))
+        conf = Config(cfile).load()
+        with mock.patch(
+            "blackhole.config.usable_cpus", return_value=1
+        ), mock.patch("blackhole.config.available_cpus", return_value=[0]):
+            conf.test_workers()
+            assert conf.workers == 1
+
+    def test_more_than_cpus_cpu_affinity(self):
+        cfile = create_config(("workers=4", "cpu_affinity=true"))
+        conf = Config(cfile).load()
+        with mock.patch(
+            "blackhole.config.available_cpus", return_value=[0, 1, 2, 3]
+        ), pytest.raises(ConfigException):
+            conf.test_workers()
+
+    def test_invalid(self):
+        cfile = create_config(("workers=many",))
+        conf = Config(cfile).load()
+        with pytest.raises(ConfigException):
+            conf.test_workers()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestProfile(unittest.TestCase):
+    def test_default(self):
+        conf = Config(None).load()
+        assert conf.profile_dir == "/tmp"
+        assert conf.profile_duration == 30
+        conf.test_profile_dir()
+        conf.test_profile_duration()
+
+    def test_profile_dir(self):
+        cfile = create_config(("profile_dir={0}".format(os.getcwd()),))
+        conf = Config(cfile).load()
+        conf.test_profile_dir()
+        assert conf.profile_dir == os.getcwd()
+
+    def test_profile_dir_not_a_directory(self):
+        cfile = create_config(("profile_dir=/fake/path",))
+        conf = Config(cfile).load()
+        with pytest.raises(ConfigException):
+            conf.test_profile_dir()
+
+    def test_profile_dir_no_permission(self):
+        cfile = create_config(("profile_dir={0}".format(os.getcwd()),))
+        conf = Config(cfile).load()
+        with mock.patch("os.access", return_value=False), pytest.raises(
+            ConfigException
+        ):
+            conf.test_profile_dir()
+
+    def test_profile_duration(self):
+        cfile = create_config(("profile_duration=5",))
+        conf = Config(cfile).load()
+        conf.test_profile_duration()
+        assert conf.profile_duration == 5
+
+    def test_profile_duration_invalid(self):
+        cfile = create_config(("profile_duration=abc",))
+        conf = Config(cfile).load()
+        with pytest.raises(ConfigException):
+            conf.test_profile_duration()
+
+    def test_profile_duration_out_of_range(self):
+        for duration in ("0", "3601"):
+            cfile = create_config(("profile_duration={0}".format(duration),))
+            conf = Config(cfile).load()
+            with pytest.raises(ConfigException):
+                conf.test_profile_duration()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestLoopMonitor(unittest.TestCase):
+    def test_default(self):
+        conf = Config(None).load()
+        assert conf.loop_monitor is False
+        assert conf.loop_monitor_threshold == 100
+        conf.test_loop_monitor_threshold()
+
+    def test_enabled(self):
+        cfile = create_config(
+            ("loop_monitor=true", "loop_monitor_threshold=250")
+        )
+        conf = Config(cfile).load()
+        conf.test_loop_monitor_threshold()
+        assert conf.loop_monitor is True
+        assert conf.loop_monitor_threshold == 250
+
+    def test_invalid(self):
+        cfile = create_config(("loop_monitor=abc",))
+        with pytest.raises(ConfigException):
+            Config(cfile).load()
+
+    def test_threshold_invalid(self):
+        for threshold in ("0", "60001", "abc"):
+            cfile = create_config(
+                ("loop_monitor_threshold={0}".format(threshold),)
+            )
+            conf = Config(cfile).load()
+            with pytest.raises(ConfigException):
+                conf.test_loop_monitor_threshold()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestCpuAffinity(unittest.TestCase):
+    def test_default(self):
+        conf = Config(None).load()
+        assert conf.cpu_affinity is False
+        assert conf.worker_cpus() == (None, [None])
+        conf.test_cpu_affinity()
+
+    def test_invalid(self):
+        cfile = create_config(("cpu_affinity=abc",))
+        with pytest.raises(ConfigException):
+            Config(cfile).load()
+
+    def test_worker_cpus(self):
+        cfile = create_config(("cpu_affinity=true", "workers=4"))
+        conf = Config(cfile).load()
+        with mock.patch(
+            "blackhole.config.available_cpus", return_value=[2, 3, 4]
+        ):
+            assert conf.worker_cpus() == (2, [3, 4, 3, 4])
+
+    def test_worker_cpus_single_cpu(self):
+        cfile = create_config(("cpu_affinity=true", "workers=2"))
+        conf = Config(cfile).load()
+        with mock.patch("blackhole.config.available_cpus", return_value=[0]):
+            assert conf.worker_cpus() == (0, [0, 0])
+
+    def test_not_supported(self):
+        cfile = create_config(("cpu_affinity=true",))
+        conf = Config(cfile).load()
+        with mock.patch("blackhole.config.os") as mock_os, pytest.raises(
+            ConfigException
+        ):
+            del mock_os.sched_setaffinity
+            conf.test_cpu_affinity()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestReusePort(unittest.TestCase):
+    def test_default(self):
+        conf = Config(None).load()
+        assert conf.reuse_port is False
+        conf.test_reuse_port()
+
+    def test_enabled(self):
+        cfile = create_config(("reuse_port=true",))
+        conf = Config(cfile).load()
+        assert conf.reuse_port is True
+
+    def test_invalid(self):
+        cfile = create_config(("reuse_port=abc",))
+        with pytest.raises(ConfigException):
+            Config(cfile).load()
+
+    def test_not_supported(self):
+        cfile = create_config(("reuse_port=true",))
+        conf = Config(cfile).load()
+        with mock.patch("blackhole.config.socket") as mock_socket:
+            del mock_socket.SO_REUSEPORT
+            with pytest.raises(ConfigException):
+                conf.test_reuse_port()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestTlsTicketRotation(unittest.TestCase):
+    def test_default(self):
+        conf = Config(None).load()
+        assert conf.tls_ticket_rotation == 3600
+        conf.test_tls_ticket_rotation()
+
+    def test_disabled(self):
+        cfile = create_config(("tls_ticket_rotation=0",))
+        conf = Config(cfile).load()
+        conf.test_tls_ticket_rotation()
+        assert conf.tls_ticket_rotation == 0
+
+    def test_invalid(self):
+        for rotation in ("59", "86401", "abc"):
+            cfile = create_config(
+                ("tls_ticket_rotation={0}".format(rotation),)
+            )
+            conf = Config(cfile).load()
+            with pytest.raises(ConfigException):
+                conf.test_tls_ticket_rotation()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestTlsReloadInterval(unittest.TestCase):
+    def test_default(self):
+        conf = Config(None).load()
+        assert conf.tls_reload_interval == 60
+        conf.test_tls_reload_interval()
+
+    def test_valid(self):
+        for interval in ("0", "1", "86400"):
+            cfile = create_config(
+                ("tls_reload_interval={0}".format(interval),)
+            )
+            conf = Config(cfile).load()
+            conf.test_tls_reload_interval()
+            assert conf.tls_reload_interval == int(interval)
+
+    def test_invalid(self):
+        for interval in ("-1", "86401", "abc"):
+            cfile = create_config(
+                ("tls_reload_interval={0}".format(interval),)
+            )
+            conf = Config(cfile).load()
+            with pytest.raises(ConfigException):
+                conf.test_tls_reload_interval()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestTlsWorkers(unittest.TestCase):
+    def test_default(self):
+        conf = Config(None).load()
+        assert conf.tls_workers == 0
+        conf.test_tls_workers()
+
+    def test_valid(self):
+        cfile = create_config(
+            ("workers=2", "tls_workers=2", "tls_listen=127.0.0.1:465")
+        )
+        conf = Config(cfile).load()
+        with mock.patch(
+            "blackhole.config.available_cpus", return_value=[0, 1, 2, 3]
+        ):
+            conf.test_tls_workers()
+        assert conf.tls_workers == 2
+
+    def test_too_many(self):
+        cfile = create_config(
+            ("workers=2", "tls_workers=2", "tls_listen=127.0.0.1:465")
+        )
+        conf = Config(cfile).load()
+        with mock.patch(
+            "blackhole.config.available_cpus", return_value=[0, 1, 2]
+        ), pytest.raises(ConfigException):
+            conf.test_tls_workers()
+
+    def test_no_tls_listen(self):
+        cfile = create_config(("tls_workers=1",))
+        conf = Config(cfile).load()
+        with pytest.raises(ConfigException):
+            conf.test_tls_workers()
+
+    def test_invalid(self):
+        for workers in ("-1", "abc"):
+            cfile = create_config(
+                (
+                    "tls_listen=127.0.0.1:465",
+                    "tls_workers={0}".format(workers),
+                )
+            )
+            conf = Config(cfile).load()
+            with pytest.raises(ConfigException):
+                conf.test_tls_workers()
+
+    def test_worker_cpus(self):
+        cfile = create_config(
+            (
+                "cpu_affinity=true",
+                "workers=1",
+                "tls_workers=2",
+                "tls_listen=127.0.0.1:465",
+            )
+        )
+        conf = Config(cfile).load()
+        with mock.patch(
+            "blackhole.config.available_cpus", return_value=[0, 1, 2, 3]
+        ):
+            assert conf.worker_cpus() == (0, [1, 2, 3])
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestCapture(unittest.TestCase):
+    def test_default(self):
+        conf = Config(None).load()
+        assert conf.capture_dir is None
+        assert conf.capture_format == "segment"
+        assert conf.capture_segment_size == 67108864
+        assert conf.capture_flush_size == 1048576
+        assert conf.capture_flush_interval == 1000
+        conf.test_capture_dir()
+        conf.test_capture_format()
+        conf.test_capture_segment_size()
+        conf.test_capture_flush_size()
+        conf.test_capture_flush_interval()
+
+    def test_capture_dir(self):
+        cfile = create_config(("capture_dir={0}".format(os.getcwd()),))
+        conf = Config(cfile).load()
+        conf.test_capture_dir()
+        assert conf.capture_dir == os.getcwd()
+
+    def test_capture_dir_not_a_directory(self):
+        cfile = create_config(("capture_dir=/fake/path",))
+        conf = Config(cfile).load()
+        with pytest.raises(ConfigException):
+            conf.test_capture_dir()
+
+    def test_capture_dir_no_permission(self):
+        cfile = create_config(("capture_dir={0}".format(os.getcwd()),))
+        conf = Config(cfile).load()
+        with mock.patch("os.access", return_value=False), pytest.raises(
+            ConfigException
+        ):
+            conf.test_capture_dir()
+
+    def test_capture_format(self):
+        for capture_format in ("segment", "Maildir"):
+            cfile = create_config(
+                ("capture_format={0}".format(capture_format),)
+            )
+            conf = Config(cfile).load()
+            conf.test_capture_format()
+            assert conf.capture_format == capture_format.lower()
+
+    def test_capture_format_invalid(self):
+        cfile = create_config(("capture_format=mbox",))
+        conf = Config(cfile).load()
+        with pytest.raises(ConfigException):
+            conf.test_capture_format()
+
+    def test_valid(self):
+        cfile = create_config(
+            (
+                "capture_segment_size=65536",
+                "capture_flush_size=1",
+                "capture_flush_interval=60000",
+            )
+        )
+        conf = Config(cfile).load()
+        conf.test_capture_segment_size()
+        conf.test_capture_flush_size()
+        conf.test_capture_flush_interval()
+        assert conf.capture_segment_size == 65536
+        assert conf.capture_flush_size == 1
+        assert conf.capture_flush_interval == 60000
+
+    def test_invalid_segment_size(self):
+        for size in ("65535", "4294967297", "abc"):
+            cfile = create_config(("capture_segment_size={0}".format(size),))
+            conf = Config(cfile).load()
+            with pytest.raises(ConfigException):
+                conf.test_capture_segment_size()
+
+    def test_invalid_flush_size(self):
+        for size in ("0", "268435457", "abc"):
+            cfile = create_config(("capture_flush_size={0}".format(size),))
+            conf = Config(cfile).load()
+            with pytest.raises(ConfigException):
+                conf.test_capture_flush_size()
+
+    def test_invalid_flush_interval(self):
+        for interval in ("0", "60001", "abc"):
+            cfile = create_config(
+                ("capture_flush_interval={0}".format(interval),)
+            )
+            conf = Config(cfile).load()
+            with pytest.raises(ConfigException):
+                conf.test_capture_flush_interval()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestCaptureCompression(unittest.TestCase):
+    def test_default(self):
+        conf = Config(None).load()
+        assert conf.capture_codec == "none"
+        assert conf.capture_level == 6
+        conf.test_capture_codec()
+        conf.test_capture_level()
+
+    def test_valid(self):
+        for codec in ("none", "zlib", "LZMA", "bz2"):
+            cfile = create_config(
+                ("capture_codec={0}".format(codec), "capture_level=9")
+            )
+            conf = Config(cfile).load()
+            conf.test_capture_codec()
+            conf.test_capture_level()
+            assert conf.capture_codec == codec.lower()
+            assert conf.capture_level == 9
+
+    def test_invalid_codec(self):
+        cfile = create_config(("capture_codec=zstd",))
+        conf = Config(cfile).load()
+        with pytest.raises(ConfigException):
+            conf.test_capture_codec()
+
+    def test_invalid_level(self):
+        for level in ("0", "10", "abc"):
+            cfile = create_config(("capture_level={0}".format(level),))
+            conf = Config(cfile).load()
+            with pytest.raises(ConfigException):
+                conf.test_capture_level()
+
+    def test_listener_flags(self):
+        cfile = create_config(
+            ("listen=:25 capture_codec=LZMA capture_level=1, :26",)
+        )
+        conf = Config(cfile).load()
+        assert conf.flags_from_listener("", 25) == {
+            "capture_codec": "lzma",
+            "capture_level": 1,
+        }
+        assert conf.flags_from_listener("", 26) == {}
+
+    def test_listener_flags_invalid(self):
+        for flag in ("capture_codec=zstd", "capture_level=10"):
+            cfile = create_config(("listen=:25 {0}".format(flag),))
+            with pytest.raises(ConfigException):
+                Config(cfile).load()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestCapturePolicy(unittest.TestCase):
+    def test_default(self):
+        conf = Config(None).load()
+        assert conf.capture_policy == "full"
+        assert conf.capture_sample_rate == 1.0
+        assert conf.capture_max_bytes == 0
+        conf.test_capture_policy()
+        conf.test_capture_sample_rate()
+        conf.test_capture_max_bytes()
+
+    def test_valid(self):
+        cfile = create_config(
+            (
+                "capture_policy=Headers",
+                "capture_sample_rate=0.05",
+                "capture_max_bytes=4096",
+            )
+        )
+        conf = Config(cfile).load()
+        conf.test_capture_policy()
+        conf.test_capture_sample_rate()
+        conf.test_capture_max_bytes()
+        assert conf.capture_policy == "headers"
+        assert conf.capture_sample_rate == 0.05
+        assert conf.capture_max_bytes == 4096
+
+    def test_invalid_policy(self):
+        cfile = create_config(("capture_policy=body",))
+        conf = Config(cfile).load()
+        with pytest.raises(ConfigException):
+            conf.test_capture_policy()
+
+    def test_invalid_sample_rate(self):
+        for rate in ("-0.1", "1.5", "nan", "abc"):
+            cfile = create_config(("capture_sample_rate={0}".format(rate),))
+            conf = Config(cfile).load()
+            with pytest.raises(ConfigException):
+                conf.test_capture_sample_rate()
+
+    def test_invalid_max_bytes(self):
+        for size in ("-1", "abc"):
+            cfile = create_config(("capture_max_bytes={0}".format(size),))
+            conf = Config(cfile).load()
+            with pytest.raises(ConfigException):
+                conf.test_capture_max_bytes()
+
+    def test_listener_flags(self):
+        cfile = create_config(
+            (
+                "listen=:25 capture_policy=NONE, :26 capture_sample_rate=0.5 "
+                "capture_max_bytes=10",
+            )
+        )
+        conf = Config(cfile).load()
+        assert conf.flags_from_listener("", 25) == {"capture_policy": "none"}
+        assert conf.flags_from_listener("", 26) == {
+            "capture_sample_rate": 0.5,
+            "capture_max_bytes": 10,
+        }
+
+    def test_listener_flags_invalid(self):
+        for flag in (
+            "capture_policy=body",
+            "capture_sample_rate=2",
+            "capture_sample_rate=abc",
+            "capture_max_bytes=-1",
+        ):
+            cfile = create_config(("listen=:25 {0}".format(flag),))
+            with pytest.raises(ConfigException):
+                Config(cfile).load()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestCaptureIndex(unittest.TestCase):
+    def test_default(self):
+        conf = Config(None).load()
+        assert conf.capture_index is False
+
+    def test_capture_index(self):
+        cfile = create_config(("capture_index=true",))
+        conf = Config(cfile).load()
+        assert conf.capture_index is True
+
+    def test_capture_index_invalid(self):
+        cfile = create_config(("capture_index=maybe",))
+        with pytest.raises(ConfigException):
+            Config(cfile).load()
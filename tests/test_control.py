@@ -25,6 +25,7 @@
 
 import os
 import socket
+import stat
 import unittest
 
 from unittest import mock
@@ -35,8 +36,10 @@ from blackhole.config import Config
 from blackhole.control import (
     _context,
     _socket,
+    contexts,
     pid_permissions,
     server,
+    servers,
     setgid,
     setuid,
 )
@@ -254,6 +257,129 @@ def test_create_server_tls_ipv6_bind_works():
     assert mock_ssl.call_count is 1
 
 
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_create_servers_reuse_port():
+    cfile = create_config(("listen=127.0.0.1:0",))
+    Config(cfile).load()
+    probe = _socket("127.0.0.1", 0, socket.AF_INET)
+    port = probe.getsockname()[1]
+    probe.close()
+    _servers = servers("127.0.0.1", port, socket.AF_INET, 3)
+    assert len(_servers) == 3
+    assert len(set(s["sock"].fileno() for s in _servers)) == 3
+    assert all(s["sock"].getsockname()[1] == port for s in _servers)
+    assert all(s["ssl"] is None for s in _servers)
+    for _server in _servers:
+        _server["sock"].close()
+
+
+@unittest.skipIf(ssl is None, "No ssl module")
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_create_servers_tls_share_context():
+    cfile = create_config(("listen=127.0.0.1:25", "tls_listen=127.0.0.1:9000"))
+    conf = Config(cfile).load()
+    conf.args = Args((("less_secure", False),))
+    with mock.patch("socket.socket.bind"), mock.patch(
+        "ssl.create_default_context"
+    ) as mock_ssl:
+        _servers = servers("127.0.0.1", 9000, socket.AF_INET, 2, use_tls=True)
+    assert mock_ssl.call_count == 1
+    assert _servers[0]["ssl"] is _servers[1]["ssl"]
+    for _server in _servers:
+        _server["sock"].close()
+
+
+@unittest.skipIf(ssl is None, "No ssl module")
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_create_servers_starttls_share_context():
+    cfile = create_config(("listen=127.0.0.1:25",))
+    conf = Config(cfile).load()
+    conf.args = Args((("less_secure", False),))
+    with mock.patch("socket.socket.bind"), mock.patch(
+        "ssl.create_default_context"
+    ) as mock_ssl:
+        _servers = servers("127.0.0.1", 25, socket.AF_INET, 2, starttls=True)
+    assert mock_ssl.call_count == 1
+    assert all(s["ssl"] is None for s in _servers)
+    assert _servers[0]["starttls"] is _servers[1]["starttls"]
+    assert _servers[0]["starttls"] is not None
+    for _server in _servers:
+        _server["sock"].close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_contexts_without_tls():
+    assert contexts() == (None, None)
+
+
+@unittest.skipIf(ssl is None, "No ssl module")
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_create_server_shared_contexts():
+    cfile = create_config(("listen=127.0.0.1:25", "tls_listen=127.0.0.1:9000"))
+    conf = Config(cfile).load()
+    conf.args = Args((("less_secure", False),))
+    with mock.patch("socket.socket.bind"), mock.patch(
+        "ssl.create_default_context"
+    ) as mock_ssl:
+        shared = contexts(use_tls=True, starttls=True)
+        first = server("127.0.0.1", 9000, socket.AF_INET, shared=shared)
+        second = server("127.0.0.1", 9001, socket.AF_INET, shared=shared)
+    assert mock_ssl.call_count == 2
+    assert first["ssl"] is second["ssl"] is shared[0]
+    assert first["starttls"] is second["starttls"] is shared[1]
+    first["sock"].close()
+    second["sock"].close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_create_servers_bind_fails_closes():
+    cfile = create_config(("listen=127.0.0.1:9000",))
+    Config(cfile).load()
+    with mock.patch(
+        "blackhole.control._socket",
+        side_effect=[mock.MagicMock(), BlackholeRuntimeException],
+    ) as mock_socket, pytest.raises(BlackholeRuntimeException):
+        servers("127.0.0.1", 9000, socket.AF_INET, 2)
+    assert mock_socket.call_count == 2
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_create_socket_default_backlog():
+    with mock.patch("socket.socket.listen") as mock_listen:
+        sock = _socket("127.0.0.1", 0, socket.AF_INET)
+    sock.close()
+    mock_listen.assert_called_once_with(1024)
+
+
+@unittest.skipIf(not hasattr(socket, "TCP_DEFER_ACCEPT"), "Linux only")
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_create_socket_flags():
+    flags = {
+        "backlog": 16,
+        "defer_accept": 5,
+        "fastopen": 8,
+        "rcvbuf": 65536,
+        "sndbuf": 65536,
+        "user_timeout": 30000,
+    }
+    with mock.patch("socket.socket.listen") as mock_listen:
+        sock = _socket("127.0.0.1", 0, socket.AF_INET, flags)
+    mock_listen.assert_called_once_with(16)
+    tcp = socket.IPPROTO_TCP
+    assert sock.getsockopt(tcp, socket.TCP_DEFER_ACCEPT) > 0
+    assert sock.getsockopt(tcp, socket.TCP_USER_TIMEOUT) == 30000
+    assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) >= 65536
+    sock.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_create_socket_flags_fails():
+    with mock.patch(
+        "socket.socket.setsockopt", side_effect=[None, None, OSError]
+    ), pytest.raises(BlackholeRuntimeException):
+        _socket("127.0.0.1", 0, socket.AF_INET, {"rcvbuf": 1})
+
+
 class Grp(mock.MagicMock):
     gr_name = "testgroup"
     gr_gid = 9000
@@ -368,3 +494,40 @@ def test_set_pid_permissions():
     ) as err:
         pid_permissions()
     assert err.value.code == 64
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_create_unix_socket():
+    path = os.path.join(os.getcwd(), "smtp.sock")
+    sock = _socket(path, None, socket.AF_UNIX, {"perm": 0o660})
+    assert sock.family == socket.AF_UNIX
+    assert sock.getsockname() == path
+    assert stat.S_ISSOCK(os.stat(path).st_mode)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o660
+    sock.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_create_unix_socket_removes_stale():
+    path = os.path.join(os.getcwd(), "smtp.sock")
+    stale = _socket(path, None, socket.AF_UNIX)
+    stale.close()
+    sock = _socket(path, None, socket.AF_UNIX)
+    assert sock.getsockname() == path
+    sock.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_create_unix_socket_not_a_socket():
+    path = create_file("smtp.sock")
+    with pytest.raises(BlackholeRuntimeException):
+        _socket(path, None, socket.AF_UNIX)
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_create_unix_socket_chown_fails():
+    path = os.path.join(os.getcwd(), "smtp.sock")
+    with mock.patch("os.chown", side_effect=PermissionError), pytest.raises(
+        BlackholeRuntimeException
+    ):
+        _socket(path, None, socket.AF_UNIX, {"owner": "root"})
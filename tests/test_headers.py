@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from blackhole.headers import HeaderParser
+
+
+def _parse(lines, names=("x-blackhole-mode", "x-blackhole-delay")):
+    parser = HeaderParser(names)
+    for idx, line in enumerate(lines):
+        if parser.feed(line):
+            return parser.headers, idx
+    return parser.headers, None
+
+
+def test_wanted_headers():
+    headers, end = _parse(
+        [
+            b"From: kura@example.com\r\n",
+            b"X-Blackhole-Mode: bounce\r\n",
+            b"x-blackhole-delay: 5\r\n",
+            b"\r\n",
+            b"body\r\n",
+        ]
+    )
+    assert headers == ["X-Blackhole-Mode: bounce", "x-blackhole-delay: 5"]
+    assert end == 3
+
+
+def test_folded_headers():
+    headers, end = _parse(
+        [
+            b"Subject: a folded\r\n",
+            b"  subject: with colons\r\n",
+            b"X-Blackhole-Delay:\r\n",
+            b"\t5,\r\n",
+            b" 10\r\n",
+            b"\n",
+        ]
+    )
+    assert headers == ["X-Blackhole-Delay: 5, 10"]
+    assert end == 5
+
+
+def test_header_value_with_colon():
+    headers, __ = _parse([b"X-Blackhole-Mode: a:b\r\n", b"\r\n"])
+    assert headers == ["X-Blackhole-Mode: a:b"]
+
+
+def test_ends_at_end_of_message():
+    headers, end = _parse([b"X-Blackhole-Mode: bounce\r\n", b".\r\n"])
+    assert headers == ["X-Blackhole-Mode: bounce"]
+    assert end == 1
+
+
+def test_ends_at_first_non_header():
+    for line in (b"not a header\r\n", b": no name\r\n", b"Dear Bob: hi\r\n"):
+        headers, end = _parse(
+            [b"Subject: test\r\n", line, b"X-Blackhole-Mode: bounce\r\n"]
+        )
+        assert headers == []
+        assert end == 1
+
+
+def test_done():
+    parser = HeaderParser(())
+    assert parser.feed(b"Subject: test\r\n") is False
+    assert parser.done is False
+    assert parser.feed(b"\r\n") is True
+    assert parser.done is True
+    assert parser.headers == []
+
+
+def test_feed_bytes():
+    parser = HeaderParser(("x-blackhole-mode",))
+    assert parser.feed_bytes(b"Subject: test\r\nX-Blackhole-") is False
+    assert parser.feed_bytes(b"Mode:\r\n") is False
+    assert parser.feed_bytes(b" bounce\r\n\r\nbody") is True
+    assert parser.headers == ["X-Blackhole-Mode: bounce"]
+    assert parser.feed_bytes(b"X-Blackhole-Mode: accept\r\n") is False
+    assert parser.headers == ["X-Blackhole-Mode: bounce"]
+
+
+def test_feed_bytes_long_line():
+    parser = HeaderParser(("x-blackhole-mode",))
+    assert parser.feed_bytes(b"X-Blackhole-Mode: bounce\r\n") is False
+    assert parser.feed_bytes(b"x" * 1000) is True
+    assert parser.done is True
+    assert parser.headers == ["X-Blackhole-Mode: bounce"]
+
+
+def test_finish():
+    parser = HeaderParser(("x-blackhole-mode",))
+    parser.feed_bytes(b"Subject: test\r\nX-Blackhole-Mode: bounce")
+    assert parser.finish() is True
+    assert parser.headers == ["X-Blackhole-Mode: bounce"]
+    assert parser.finish() is False
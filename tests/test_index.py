@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+
+import pytest
+
+from blackhole.index import CaptureIndex
+
+
+from ._utils import (  # noqa: F401; isort:skip
+    Args,
+    cleandir,
+    create_config,
+    create_file,
+    reset,
+)
+
+
+def _metadata(idx, **kwargs):
+    metadata = {
+        "timestamp": 1600000000.0 + idx,
+        "mail_from": "sender{0}@example.com".format(idx % 2),
+        "rcpt_to": ["rcpt{0}@example.com".format(idx), "all@example.com"],
+        "message_id": "<{0}@blackhole.io>".format(idx),
+        "code": 250,
+    }
+    metadata.update(kwargs)
+    return metadata
+
+
+@pytest.fixture
+def index(cleandir):
+    index = CaptureIndex.for_directory(os.getcwd())
+    index.add(
+        [
+            (_metadata(idx), "worker-1-000001.seg", 8 + idx * 100, 100)
+            for idx in range(10)
+        ]
+    )
+    yield index
+    index.close()
+
+
+def test_for_directory(cleandir):
+    index = CaptureIndex.for_directory(os.getcwd())
+    assert index.path == os.path.join(os.getcwd(), "index.sqlite")
+
+
+def test_lookup_message_id(index):
+    messages = index.lookup(message_id="<3@blackhole.io>")
+    assert messages == [
+        {
+            "id": 4,
+            "message_id": "<3@blackhole.io>",
+            "mail_from": "sender1@example.com",
+            "rcpt_to": ["rcpt3@example.com", "all@example.com"],
+            "timestamp": 1600000003.0,
+            "code": 250,
+            "location": "worker-1-000001.seg",
+            "offset": 308,
+            "length": 100,
+        }
+    ]
+
+
+def test_lookup_message_id_every_match(index):
+    index.add([(_metadata(3), "worker-2-000001.seg", 8, 100)])
+    messages = index.lookup(message_id="<3@blackhole.io>")
+    assert [m["location"] for m in messages] == [
+        "worker-1-000001.seg",
+        "worker-2-000001.seg",
+    ]
+
+
+def test_lookup_rcpt_to(index):
+    messages = index.lookup(rcpt_to="rcpt7@example.com")
+    assert [m["message_id"] for m in messages] == ["<7@blackhole.io>"]
+    assert len(index.lookup(rcpt_to="all@example.com")) == 10
+    assert index.lookup(rcpt_to="nobody@example.com") == []
+
+
+def test_lookup_mail_from_and_time(index):
+    messages = index.lookup(
+        mail_from="sender0@example.com",
+        since=1600000002.0,
+        until=1600000008.0,
+    )
+    assert [m["message_id"] for m in messages] == [
+        "<2@blackhole.io>",
+        "<4@blackhole.io>",
+        "<6@blackhole.io>",
+    ]
+
+
+def test_lookup_combined(index):
+    assert (
+        index.lookup(
+            message_id="<3@blackhole.io>", rcpt_to="rcpt4@example.com"
+        )
+        == []
+    )
+    messages = index.lookup(
+        message_id="<3@blackhole.io>", rcpt_to="all@example.com"
+    )
+    assert len(messages) == 1
+
+
+def test_lookup_paging(index):
+    first = index.lookup(rcpt_to="all@example.com", limit=4)
+    assert [m["id"] for m in first] == [1, 2, 3, 4]
+    second = index.lookup(
+        rcpt_to="all@example.com", after=first[-1]["id"], limit=4
+    )
+    assert [m["id"] for m in second] == [5, 6, 7, 8]
+
+
+def test_lookups_use_indexes(index):
+    for column in ("message_id", "mail_from", "timestamp"):
+        plan = index.conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM messages WHERE {0} = ?".format(
+                column
+            ),
+            (1,),
+        ).fetchall()
+        assert plan[0][-1].startswith("SEARCH")
+        assert "INDEX messages_{0}".format(column) in plan[0][-1]
+    plan = index.conn.execute(
+        "EXPLAIN QUERY PLAN SELECT message FROM recipients WHERE rcpt = ?",
+        ("a",),
+    ).fetchall()
+    assert "COVERING INDEX recipients_rcpt" in plan[0][-1]
+
+
+def test_add_empty(cleandir):
+    index = CaptureIndex.for_directory(os.getcwd())
+    index.add([])
+    assert index._conn is None
+
+
+def test_shared_between_connections(index):
+    other = CaptureIndex.for_directory(os.getcwd())
+    other.add([(_metadata(10, mail_from=None), "new/a", None, 5)])
+    messages = index.lookup(message_id="<10@blackhole.io>")
+    assert messages[0]["mail_from"] is None
+    assert messages[0]["location"] == "new/a"
+    assert messages[0]["offset"] is None
+    other.close()
+    other.close()
+
+
+def test_get(index):
+    message = index.get(4)
+    assert message["message_id"] == "<3@blackhole.io>"
+    assert message["rcpt_to"] == ["rcpt3@example.com", "all@example.com"]
+    assert index.get(100) is None
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import sys
+import time
+
+from unittest import mock
+
+import pytest
+
+from blackhole.monitor import LoopMonitor
+from blackhole.smtp import Smtp
+from blackhole.stats import Stats
+
+
+from ._utils import (  # noqa: F401; isort:skip
+    Args,
+    cleandir,
+    create_config,
+    create_file,
+    reset,
+)
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_records_lag(event_loop):
+    stats = Stats()
+    monitor = LoopMonitor(event_loop, stats, 1)
+    monitor.interval = 0.01
+    monitor.start()
+    await asyncio.sleep(0.1)
+    monitor.stop()
+    assert event_loop.slow_callback_duration == 1
+    assert stats.histograms["loop.lag"].count > 0
+    assert "loop.slow_callbacks" not in stats.counters
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_slow_callback(event_loop):
+    stats = Stats()
+    monitor = LoopMonitor(event_loop, stats, 0.05)
+    monitor.interval = 0.01
+    monitor.start()
+    await asyncio.sleep(0.02)
+
+    def block():
+        time.sleep(0.3)
+
+    with mock.patch("blackhole.monitor.logger.warning") as mock_warning:
+        event_loop.call_soon(block)
+        await asyncio.sleep(0.05)
+    monitor.stop()
+    assert stats.counters["loop.slow_callbacks"] == 1
+    assert mock_warning.call_count == 1
+    args = mock_warning.call_args[0]
+    assert args[1] >= 0.25
+    assert "block" in args[3]
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_log_rate_limited():
+    monitor = LoopMonitor(mock.MagicMock(), Stats(), 0.1)
+    with mock.patch("blackhole.monitor.logger.warning") as mock_warning:
+        monitor._log(1, None)
+        monitor._log(1, None)
+        monitor._log(1, None)
+    assert mock_warning.call_count == 1
+    assert monitor._suppressed == 2
+    monitor._last_log -= monitor.log_interval
+    with mock.patch("blackhole.monitor.logger.warning") as mock_warning:
+        monitor._log(1, None)
+    assert mock_warning.call_args[0][-1] == 2
+    assert monitor._suppressed == 0
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_describe_smtp_connection():
+    smtp = Smtp([])
+    smtp.transport = mock.MagicMock()
+    smtp.transport.get_extra_info.return_value = ("127.0.0.1", 1234)
+    smtp._line = "EHLO " + "a" * 100
+
+    def do_EHLO(self):
+        return sys._getframe()
+
+    report = LoopMonitor.describe(do_EHLO(smtp))
+    assert report["where"].endswith("in do_EHLO")
+    assert "peer=('127.0.0.1', 1234)" in report["state"]
+    assert report["state"].endswith("...'")
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_describe_unknown():
+    report = LoopMonitor.describe(sys._getframe())
+    assert report["handler"] == "unknown"
+    assert report["state"] == ""
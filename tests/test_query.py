@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import json
+import os
+import threading
+
+from unittest import mock
+
+import pytest
+
+from blackhole.capture import (
+    SEGMENT_MAGIC,
+    compress_segment,
+    encode_record,
+)
+from blackhole.index import CaptureIndex
+from blackhole.query import QueryServer, parse_query_args, run_query
+
+
+from ._utils import (  # noqa: F401; isort:skip
+    Args,
+    cleandir,
+    create_config,
+    create_file,
+    reset,
+)
+
+
+def _metadata(idx):
+    return {
+        "timestamp": 1600000000.0 + idx,
+        "mail_from": "sender{0}@example.com".format(idx % 2),
+        "rcpt_to": ["rcpt{0}@example.com".format(idx)],
+        "message_id": "<{0}@blackhole.io>".format(idx),
+        "code": 250,
+    }
+
+
+def _payload(idx):
+    return "Subject: {0}\r\n\r\n{1}\r\n".format(idx, "x" * idx).encode()
+
+
+def _capture(directory):
+    entries = []
+    for base, name in ((0, "plain.seg"), (5, "packed.seg")):
+        with open(os.path.join(directory, name), "wb") as segment:
+            segment.write(SEGMENT_MAGIC)
+            for idx in range(base, base + 5):
+                record = encode_record(_metadata(idx), _payload(idx))
+                entries.append(
+                    (_metadata(idx), name, segment.tell(), len(record))
+                )
+                segment.write(record)
+    compress_segment(os.path.join(directory, "packed.seg"), "lzma", 1)
+    os.mkdir(os.path.join(directory, "new"))
+    with open(os.path.join(directory, "new", "mail"), "wb") as mail:
+        mail.write(_payload(10))
+    entries.append((_metadata(10), "mail", None, len(_payload(10))))
+    index = CaptureIndex.for_directory(directory)
+    index.add(entries)
+    index.close()
+
+
+async def _serve(loop, directory):
+    api = QueryServer(directory, loop=loop)
+    server = await asyncio.start_server(api.handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def _request(reader, writer, path, method="GET", close=True):
+    connection = "close" if close else "keep-alive"
+    writer.write(
+        "{0} {1} HTTP/1.1\r\nConnection: {2}\r\n\r\n".format(
+            method, path, connection
+        ).encode()
+    )
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode().strip()
+        if not line:
+            break
+        name, __, value = line.partition(":")
+        headers[name.lower()] = value.strip()
+    body = await reader.readexactly(int(headers["content-length"]))
+    if headers["content-type"] == "application/json":
+        body = json.loads(body.decode())
+    return status, body
+
+
+async def _get(port, *paths, method="GET"):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    responses = [
+        await _request(reader, writer, p, method, p == paths[-1])
+        for p in paths
+    ]
+    assert await reader.read() == b""
+    writer.close()
+    return responses if len(responses) > 1 else responses[0]
+
+
+def test_parse_query_args_defaults():
+    args = parse_query_args([])
+    assert args.host == "127.0.0.1"
+    assert args.port == 8025
+    assert args.unix is None
+    assert args.capture_dir is None
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_list_and_filter(event_loop):
+    _capture(os.getcwd())
+    server, port = await _serve(event_loop, os.getcwd())
+    status, body = await _get(port, "/messages")
+    assert status == 200
+    assert len(body["messages"]) == 11
+    assert body["next"] is None
+    status, body = await _get(
+        port, "/messages?mail_from=sender1%40example.com&since=1600000004"
+    )
+    assert [m["message_id"] for m in body["messages"]] == [
+        "<5@blackhole.io>",
+        "<7@blackhole.io>",
+        "<9@blackhole.io>",
+    ]
+    status, body = await _get(port, "/messages?rcpt_to=rcpt3%40example.com")
+    assert [m["id"] for m in body["messages"]] == [4]
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_pagination(event_loop):
+    _capture(os.getcwd())
+    server, port = await _serve(event_loop, os.getcwd())
+    ids, path = [], "/messages?limit=4"
+    while path:
+        status, body = await _get(port, path)
+        ids.extend(m["id"] for m in body["messages"])
+        path = None
+        if body["next"]:
+            path = "/messages?limit=4&cursor={0}".format(body["next"])
+    assert ids == list(range(1, 12))
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_message_and_bodies(event_loop):
+    _capture(os.getcwd())
+    server, port = await _serve(event_loop, os.getcwd())
+    status, body = await _get(port, "/messages/3")
+    assert status == 200
+    assert body["message_id"] == "<2@blackhole.io>"
+    paths = ["/messages/{0}/body".format(i) for i in (1, 5, 6, 10, 11)]
+    responses = await _get(port, *paths)
+    assert responses == [
+        (200, _payload(0)),
+        (200, _payload(4)),
+        (200, _payload(5)),
+        (200, _payload(9)),
+        (200, _payload(10)),
+    ]
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_body_moved_to_cur(event_loop):
+    _capture(os.getcwd())
+    os.mkdir("cur")
+    os.rename(os.path.join("new", "mail"), os.path.join("cur", "mail:2,S"))
+    server, port = await _serve(event_loop, os.getcwd())
+    assert await _get(port, "/messages/11/body") == (200, _payload(10))
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_body_without_sendfile(event_loop):
+    _capture(os.getcwd())
+    loop = mock.MagicMock(spec=["run_in_executor"])
+    loop.run_in_executor.side_effect = event_loop.run_in_executor
+    api = QueryServer(os.getcwd(), loop=loop)
+    server = await asyncio.start_server(api.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    assert await _get(port, "/messages/2/body") == (200, _payload(1))
+    server.close()
+    await server.wait_closed()
+    api.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error", (NotImplementedError, RuntimeError))
+async def test_body_sendfile_unsupported(event_loop, error):
+    _capture(os.getcwd())
+    api = QueryServer(os.getcwd(), loop=event_loop)
+    server = await asyncio.start_server(api.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    with mock.patch.object(
+        event_loop, "sendfile", side_effect=error, create=True
+    ) as mock_sendfile:
+        responses = await _get(port, "/messages/2/body", "/messages/11/body")
+    assert mock_sendfile.call_count == 2
+    assert responses == [(200, _payload(1)), (200, _payload(10))]
+    server.close()
+    await server.wait_closed()
+    api.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_index_lookups_run_in_executor(event_loop):
+    _capture(os.getcwd())
+    api = QueryServer(os.getcwd(), loop=event_loop)
+    server = await asyncio.start_server(api.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    threads = []
+    get, lookup = api.index.get, api.index.lookup
+
+    def record(func):
+        def wrapper(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    with mock.patch.object(api.index, "get", record(get)), mock.patch.object(
+        api.index, "lookup", record(lookup)
+    ):
+        await _get(port, "/messages", "/messages/1")
+    assert len(threads) == 2
+    assert threading.get_ident() not in threads
+    server.close()
+    await server.wait_closed()
+    api.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_errors(event_loop):
+    server, port = await _serve(event_loop, os.getcwd())
+    status, __ = await _get(port, "/messages")
+    assert status == 503
+    _capture(os.getcwd())
+    for path in (
+        "/",
+        "/other",
+        "/messages/100",
+        "/messages/a",
+        "/messages/1/x",
+    ):
+        status, __ = await _get(port, path)
+        assert status == 404
+    for query in ("limit=0", "limit=a", "cursor=a", "since=a"):
+        status, __ = await _get(port, "/messages?" + query)
+        assert status == 400
+    status, __ = await _get(port, "/messages", method="POST")
+    assert status == 405
+    os.remove("plain.seg")
+    status, __ = await _get(port, "/messages/1/body")
+    assert status == 404
+    os.remove(os.path.join("new", "mail"))
+    status, __ = await _get(port, "/messages/11/body")
+    assert status == 404
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_body_errors(event_loop):
+    _capture(os.getcwd())
+    server, port = await _serve(event_loop, os.getcwd())
+    with open("packed.seg.xz", "r+b") as segment:
+        segment.seek(20)
+        segment.write(b"corrupt" * 10)
+    with open("plain.seg", "r+b") as segment:
+        segment.truncate(len(SEGMENT_MAGIC) + 4)
+    with mock.patch("blackhole.query.logger.error") as mock_error:
+        for path in ("/messages/2/body", "/messages/10/body"):
+            status, body = await _get(port, path)
+            assert status == 500
+            assert body == {"error": "Unable to read message"}
+    assert mock_error.call_count == 2
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_body_truncated_closes_connection(event_loop):
+    _capture(os.getcwd())
+    loop = mock.MagicMock(spec=["run_in_executor"])
+    loop.run_in_executor.side_effect = event_loop.run_in_executor
+    api = QueryServer(os.getcwd(), loop=loop)
+    server = await asyncio.start_server(api.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    with open(os.path.join("new", "mail"), "r+b") as mail:
+        mail.truncate(5)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /messages/11/body HTTP/1.1\r\n\r\n")
+    with mock.patch("blackhole.query.logger.error") as mock_error:
+        response = await reader.read()
+    assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert response.endswith(b"\r\n\r\n" + _payload(10)[:5])
+    assert mock_error.called is True
+    writer.close()
+    server.close()
+    await server.wait_closed()
+    api.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_body_read_in_executor(event_loop):
+    _capture(os.getcwd())
+    loop = mock.MagicMock(spec=["run_in_executor"])
+    loop.run_in_executor.side_effect = event_loop.run_in_executor
+    api = QueryServer(os.getcwd(), loop=loop)
+    server = await asyncio.start_server(api.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    threads = []
+    locate_body = api.locate_body
+
+    def record(message):
+        threads.append(threading.get_ident())
+        return locate_body(message)
+
+    with mock.patch.object(api, "locate_body", record):
+        assert await _get(port, "/messages/7/body") == (200, _payload(6))
+    assert len(threads) == 1
+    assert threading.get_ident() not in threads
+    server.close()
+    await server.wait_closed()
+    api.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_run_query_requires_directory():
+    with pytest.raises(SystemExit) as exc:
+        run_query(parse_query_args([]), loop=mock.MagicMock())
+    assert exc.value.code == os.EX_USAGE
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_run_query_unix_socket():
+    _capture(os.getcwd())
+    path = os.path.join(os.getcwd(), "query.sock")
+    loop = asyncio.new_event_loop()
+
+    async def client():
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+        reader, writer = await asyncio.open_unix_connection(path)
+        response = await _request(reader, writer, "/messages/11/body")
+        await reader.read()
+        writer.close()
+        loop.stop()
+        return response
+
+    task = loop.create_task(client())
+    args = parse_query_args(["--dir", os.getcwd(), "--unix", path])
+    with pytest.raises(SystemExit) as exc:
+        run_query(args, loop=loop)
+    assert exc.value.code == os.EX_OK
+    assert task.result() == (200, _payload(10))
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_run_query_config_file():
+    cfile = create_config(("capture_dir={0}".format(os.getcwd()),))
+    loop = mock.MagicMock()
+    args = parse_query_args(["--conf", cfile, "--port", "0"])
+    with mock.patch("blackhole.query.QueryServer") as mock_api, mock.patch(
+        "asyncio.start_server", mock.MagicMock()
+    ), pytest.raises(SystemExit) as exc:
+        run_query(args, loop=loop)
+    assert exc.value.code == os.EX_OK
+    assert mock_api.call_args[0][0] == os.getcwd()
+    assert loop.run_forever.called is True
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import pytest
+
+from blackhole.config import SCHEMA, Config
+from blackhole.schema import Option, Schema
+
+
+class Settings:
+    _size = 10
+    _name = None
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def name(self):
+        return self._name
+
+    def test_size(self):
+        pass
+
+    def test_name(self):
+        pass
+
+    def test_both(self):
+        pass
+
+
+def test_compile():
+    schema = Schema(
+        (
+            Option("size", "int", ("test_size", "test_both")),
+            Option("name", "str", ("test_name", "test_both"), default="x"),
+        ),
+        checks=("test_both",),
+    ).compile(Settings)
+    assert "size" in schema
+    assert "length" not in schema
+    assert schema.names == ("size", "name")
+    assert schema.validators == ("test_both", "test_size", "test_name")
+    assert schema.options["size"].default == 10
+    assert schema.options["name"].default == "x"
+    assert repr(schema.options["size"]) == "<Option size (int)>"
+
+
+def test_compile_not_a_property():
+    with pytest.raises(AttributeError):
+        Schema((Option("test_size", "int"),)).compile(Settings)
+
+
+def test_compile_missing_validator():
+    with pytest.raises(AttributeError):
+        Schema((Option("size", "int", ("test_length",)),)).compile(Settings)
+
+
+def test_invalid():
+    schema = Schema((Option("size", "int"), Option("name", "str")))
+    msg = schema.invalid("sizes")
+    assert msg.startswith("Invalid configuration option 'sizes'. Did you")
+    assert msg.endswith("Valid options are: 'size' and 'name'")
+    assert "Did you mean" not in schema.invalid("kura")
+
+
+def test_describe():
+    schema = Schema(
+        (Option("size", "int", default=1), Option("length", "int"))
+    )
+    assert schema.describe() == [
+        "size    int         1",
+        "length  int         None",
+    ]
+
+
+def test_config_schema_describes_workers():
+    assert SCHEMA.options["workers"].kind == "int|auto"
+
+
+def test_config_schema_covers_validators():
+    # Protection against adding a validator without adding it to the schema
+    validators = [name for name in dir(Config) if name.startswith("test_")]
+    assert sorted(validators) == sorted(SCHEMA.validators)
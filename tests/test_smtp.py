@@ -25,8 +25,10 @@
 
 import asyncio
 import inspect
+import os
 import random
 import socket
+import ssl
 import string
 import threading
 import time
@@ -37,9 +39,11 @@ from unittest import mock
 
 import pytest
 
+from blackhole.capture import CapturePolicy
 from blackhole.config import Config
 from blackhole.control import _socket
 from blackhole.smtp import Smtp
+from blackhole.stats import Stats
 
 
 from ._utils import (  # noqa: F401; isort:skip
@@ -57,7 +61,7 @@ try:
 
     asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 except ImportError:
-    pass
+    uvloop = None
 
 
 @pytest.mark.usefixtures("reset", "cleandir")
@@ -89,6 +93,7 @@ def test_handler_lookup():
     assert smtp.lookup_handler("HELP") == smtp.do_HELP
     assert smtp.lookup_handler("DATA") == smtp.do_DATA
     assert smtp.lookup_handler("EHLO") == smtp.do_EHLO
+    assert smtp.lookup_handler("LHLO") == smtp.do_LHLO
     assert smtp.lookup_handler("ETRN") == smtp.do_ETRN
     assert smtp.lookup_handler("EXPN") == smtp.do_EXPN
     assert smtp.lookup_handler("HELO") == smtp.do_HELO
@@ -107,6 +112,7 @@ def test_handler_lookup():
     assert smtp.lookup_handler("HELP ETRN") == smtp.help_ETRN
     assert smtp.lookup_handler("HELP EXPN") == smtp.help_EXPN
     assert smtp.lookup_handler("HELP HELO") == smtp.help_HELO
+    assert smtp.lookup_handler("HELP LHLO") == smtp.help_LHLO
     assert smtp.lookup_handler("HELP MAIL") == smtp.help_MAIL
     assert smtp.lookup_handler("HELP NOOP") == smtp.help_NOOP
     assert smtp.lookup_handler("HELP QUIT") == smtp.help_QUIT
@@ -120,12 +126,14 @@ def test_handler_lookup():
 def test_unknown_handlers():
     # Protection against adding/removing without updating tests
     verbs = [
+        "do_BDAT",
         "do_DATA",
         "do_EHLO",
         "do_ETRN",
         "do_EXPN",
         "do_HELO",
         "do_HELP",
+        "do_LHLO",
         "do_MAIL",
         "do_NOOP",
         "do_NOT_IMPLEMENTED",
@@ -138,11 +146,13 @@ def test_unknown_handlers():
     ]
     helps = [
         "help_AUTH",
+        "help_BDAT",
         "help_DATA",
         "help_EHLO",
         "help_ETRN",
         "help_EXPN",
         "help_HELO",
+        "help_LHLO",
         "help_MAIL",
         "help_NOOP",
         "help_QUIT",
@@ -165,12 +175,24 @@ def test_unknown_handlers():
 
 @pytest.mark.usefixtures("reset", "cleandir")
 class Controller:
-    def __init__(self, sock=None):
+    def __init__(
+        self,
+        sock=None,
+        tls_context=None,
+        stats=None,
+        capture=None,
+        capture_policy=None,
+        loop=None,
+    ):
         if sock is not None:
             self.sock = sock
         else:
             self.sock = _socket("127.0.0.1", 0, socket.AF_INET)
-        self.loop = asyncio.new_event_loop()
+        self.tls_context = tls_context
+        self.stats = stats
+        self.capture = capture
+        self.capture_policy = capture_policy
+        self.loop = loop if loop is not None else asyncio.new_event_loop()
         self.server = None
         self._thread = None
 
@@ -178,7 +200,16 @@ class Controller:
         asyncio.set_event_loop(self.loop)
         conf = Config(None)
         conf.mailname = "blackhole.io"
-        _server = self.loop.create_server(lambda: Smtp([]), sock=self.sock)
+        _server = self.loop.create_server(
+            lambda: Smtp(
+                [],
+                stats=self.stats,
+                tls_context=self.tls_context,
+                capture=self.capture,
+                capture_policy=self.capture_policy,
+            ),
+            sock=self.sock,
+        )
         self.server = self.loop.run_until_complete(_server)
         self.loop.call_soon(ready_event.set)
         self.loop.run_forever()
@@ -206,6 +237,63 @@ class Controller:
             task.cancel()
 
 
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_connection_made_tls_stats():
+    Config(None).load()
+    stats = Stats()
+    sock = mock.MagicMock()
+    sock.getsockname.return_value = ("127.0.0.1", 465)
+    resumed, fresh = mock.MagicMock(), mock.MagicMock()
+    resumed.session_reused = True
+    fresh.session_reused = False
+    for ssl_object in (resumed, fresh, None):
+        smtp = Smtp([], stats=stats)
+        transport = mock.MagicMock()
+        transport.get_extra_info.side_effect = lambda name, _o=ssl_object: {
+            "socket": sock,
+            "ssl_object": _o,
+        }.get(name)
+        with mock.patch.object(smtp.loop, "create_task"), mock.patch.object(
+            smtp, "_handle_client"
+        ):
+            smtp.connection_made(transport)
+    assert stats.counters["connections"] == 3
+    assert stats.counters["tls.handshakes"] == 2
+    assert stats.counters["tls.resumed"] == 1
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_flags_from_transport_socket_flags():
+    cfile = create_config(("listen=:2525 backlog=64 nodelay=false",))
+    Config(cfile).load()
+    smtp = Smtp([])
+    sock = mock.MagicMock()
+    sock.getsockname.return_value = ("127.0.0.1", 2525)
+    smtp.transport = mock.MagicMock()
+    smtp.transport.get_extra_info.return_value = sock
+    smtp.flags_from_transport()
+    sock.setsockopt.assert_called_once_with(
+        socket.IPPROTO_TCP, socket.TCP_NODELAY, 0
+    )
+    assert smtp._disable_dynamic_switching is False
+    assert smtp._flags == {}
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_flags_from_transport_mode_and_socket_flags():
+    cfile = create_config(("listen=:2525 backlog=64 mode=bounce",))
+    Config(cfile).load()
+    smtp = Smtp([])
+    sock = mock.MagicMock()
+    sock.getsockname.return_value = ("127.0.0.1", 2525)
+    smtp.transport = mock.MagicMock()
+    smtp.transport.get_extra_info.return_value = sock
+    smtp.flags_from_transport()
+    assert sock.setsockopt.called is False
+    assert smtp._disable_dynamic_switching is True
+    assert smtp._flags == {"mode": "bounce"}
+
+
 @pytest.mark.usefixtures("reset", "cleandir")
 @pytest.mark.asyncio
 async def test_mode_directive(event_loop, unused_tcp_port):
@@ -235,6 +323,29 @@ async def test_mode_directive(event_loop, unused_tcp_port):
     controller.stop()
 
 
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_mode_directive_unix():
+    path = os.path.join(os.getcwd(), "smtp.sock")
+    cfile = create_config(("listen=unix:{0} mode=bounce".format(path),))
+    Config(cfile).load()
+    controller = Controller(_socket(path, None, socket.AF_UNIX))
+    controller.start()
+    client = SMTP(local_hostname="example.com")
+    client.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.sock.connect(path)
+    try:
+        assert client.getreply()[0] == 220
+        client.helo()
+        assert client.docmd("MAIL FROM:<kura@example.com>")[0] == 250
+        assert client.docmd("RCPT TO:<kura@example.com>")[0] == 250
+        code, resp = client.data(b"Subject: Test\r\n\r\nTesting 1, 2, 3")
+        assert code in [450, 451, 452, 458, 521, 550, 551, 552, 553, 571]
+        client.quit()
+    finally:
+        client.close()
+        controller.stop()
+
+
 @pytest.mark.usefixtures("reset", "cleandir")
 @pytest.mark.asyncio
 @pytest.mark.slow
@@ -430,6 +541,8 @@ class TestSmtp(unittest.TestCase):
                 "ETRN",
                 "ENHANCEDSTATUSCODES",
                 "8BITMIME",
+                "BINARYMIME",
+                "CHUNKING",
                 "SMTPUTF8",
                 "EXPN",
                 "DSN",
@@ -584,6 +697,32 @@ class TestSmtp(unittest.TestCase):
             assert code == 250
             assert resp.startswith(b"2.0.0 OK: queued as")
 
+    def test_data_folded_header(self):
+        with SMTP(self.host, self.port) as client:
+            msg = [
+                "From: kura@example.com",
+                "Subject: Test: with a colon",
+                "X-Blackhole-Mode:",
+                "    bounce",
+                "",
+                "Testing 1, 2, 3",
+            ]
+            msg = "\r\n".join(msg)
+            code, resp = client.data(msg.encode("utf-8"))
+            assert code in [450, 451, 452, 458, 521, 550, 551, 552, 553, 571]
+
+    def test_data_header_in_body(self):
+        with SMTP(self.host, self.port) as client:
+            msg = [
+                "From: kura@example.com",
+                "Subject: Test",
+                "",
+                "X-Blackhole-Mode: bounce",
+            ]
+            msg = "\r\n".join(msg)
+            code, resp = client.data(msg.encode("utf-8"))
+            assert code == 250
+
     def test_rset(self):
         with SMTP(self.host, self.port) as client:
             code, resp = client.rset()
@@ -714,8 +853,8 @@ class TestSmtp(unittest.TestCase):
     def test_help(self):
         with SMTP(self.host, self.port) as client:
             eresp = (
-                "Supported commands: AUTH DATA EHLO ETRN EXPN HELO MAIL "
-                "NOOP QUIT RCPT RSET VRFY"
+                "Supported commands: AUTH BDAT DATA EHLO ETRN EXPN HELO LHLO "
+                "MAIL NOOP QUIT RCPT RSET VRFY"
             )
             assert client.help() == eresp.encode("utf-8")
 
@@ -778,8 +917,8 @@ class TestSmtp(unittest.TestCase):
         with SMTP(self.host, self.port) as client:
             code, resp = client.docmd("HELP", "KURA")
             eresp = (
-                "Supported commands: AUTH DATA EHLO ETRN EXPN HELO MAIL "
-                "NOOP QUIT RCPT RSET VRFY"
+                "Supported commands: AUTH BDAT DATA EHLO ETRN EXPN HELO LHLO "
+                "MAIL NOOP QUIT RCPT RSET VRFY"
             )
             assert code == 501
             assert resp == eresp.encode("utf-8")
@@ -892,3 +1031,434 @@ class TestSmtp(unittest.TestCase):
                 code, resp = client.docmd("KURA")
             assert code == 502
             assert resp == b"5.5.3 Too many unknown commands"
+
+
+CERTS = os.path.join(os.path.dirname(__file__), "certs")
+
+
+def _client_context():
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestStartTls(unittest.TestCase):
+    def setUp(self):
+        cfile = create_config(("timeout=5",))
+        Config(cfile).load()
+        tls_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        tls_context.load_cert_chain(
+            os.path.join(CERTS, "blackhole.crt"),
+            os.path.join(CERTS, "blackhole.key"),
+        )
+        self.stats = Stats()
+        controller = Controller(
+            tls_context=tls_context, stats=self.stats, loop=self.new_loop()
+        )
+        controller.start()
+        self.host, self.port = controller.sock.getsockname()
+        self.addCleanup(controller.stop)
+
+    def new_loop(self):
+        return asyncio.SelectorEventLoop()
+
+    def test_starttls(self):
+        with SMTP(self.host, self.port) as client:
+            client.ehlo("example.com")
+            assert client.has_extn("starttls") is True
+            code, resp = client.starttls(context=_client_context())
+            assert code == 220
+            assert resp == b"2.0.0 Ready to start TLS"
+            assert isinstance(client.sock, ssl.SSLSocket)
+            client.ehlo("example.com")
+            assert client.has_extn("starttls") is False
+            code, resp = client.docmd("STARTTLS")
+            assert code == 503
+            assert resp == b"5.5.1 TLS already active"
+            code, resp = client.mail("test@example.com")
+            assert code == 250
+            code, resp = client.rcpt("test@blackhole.io")
+            assert code == 250
+            code, resp = client.data(b"Subject: test\r\n\r\ntest")
+            assert code == 250
+        assert self.stats.counters["tls.starttls"] == 1
+        assert self.stats.counters["tls.handshakes"] == 1
+
+    def test_starttls_syntax(self):
+        with SMTP(self.host, self.port) as client:
+            code, resp = client.docmd("STARTTLS", "now")
+            assert code == 501
+            assert resp == b"5.5.4 Syntax: STARTTLS"
+
+    def test_starttls_discards_pipelined_commands(self):
+        sock = socket.create_connection((self.host, self.port))
+        reader = sock.makefile("rb")
+        assert reader.readline().startswith(b"220 ")
+        sock.sendall(b"STARTTLS\r\nHELO injected.com\r\n")
+        assert reader.readline() == b"220 2.0.0 Ready to start TLS\r\n"
+        tls = _client_context().wrap_socket(sock)
+        tls.sendall(b"NOOP\r\n")
+        assert tls.makefile("rb").readline() == b"250 2.0.0 OK\r\n"
+        tls.close()
+
+    def test_starttls_handshake_failure(self):
+        sock = socket.create_connection((self.host, self.port))
+        reader = sock.makefile("rb")
+        reader.readline()
+        sock.sendall(b"STARTTLS\r\n")
+        assert reader.readline() == b"220 2.0.0 Ready to start TLS\r\n"
+        sock.sendall(b"this is not a tls handshake\r\n")
+        sock.settimeout(5)
+        assert reader.read() == b""
+        sock.close()
+        for _ in range(50):
+            if "tls.starttls_failures" in self.stats.counters:
+                break
+            time.sleep(0.01)
+        assert self.stats.counters["tls.starttls_failures"] == 1
+        assert "tls.starttls" not in self.stats.counters
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.skipif(uvloop is None, reason="uvloop is not installed")
+class TestStartTlsUvloop(TestStartTls):
+    def new_loop(self):
+        return uvloop.new_event_loop()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_starttls_unavailable_without_start_tls():
+    Config(None).load()
+    smtp = Smtp([], tls_context=mock.MagicMock())
+    smtp.transport = mock.MagicMock()
+    smtp.transport.get_extra_info.return_value = None
+    assert smtp.starttls_available is True
+    smtp.loop = mock.MagicMock(spec=[])
+    assert smtp.starttls_available is False
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestCapture(unittest.TestCase):
+    def setUp(self):
+        cfile = create_config(("timeout=5", "max_message_size=1024"))
+        Config(cfile).load()
+        self.stats = Stats()
+        self.capture = mock.MagicMock()
+        controller = Controller(stats=self.stats, capture=self.capture)
+        controller.start()
+        self.host, self.port = controller.sock.getsockname()
+        self.addCleanup(controller.stop)
+
+    def test_capture(self):
+        with SMTP(self.host, self.port) as client:
+            client.mail("<sender@example.com> SIZE=100")
+            client.rcpt("<one@example.com>")
+            client.rcpt("two@example.com")
+            code, resp = client.data(b"Subject: test\r\n\r\n.dotted\r\nend")
+            assert code == 250
+            msg_id = resp.decode("utf-8").split(" ")[-1]
+        self.capture.write.assert_called_once()
+        metadata, payload = self.capture.write.call_args[0]
+        assert payload == b"Subject: test\r\n\r\n.dotted\r\nend\r\n"
+        assert metadata["mail_from"] == "sender@example.com"
+        assert metadata["rcpt_to"] == ["one@example.com", "two@example.com"]
+        assert metadata["message_id"] == msg_id
+        assert metadata["code"] == 250
+        assert metadata["peer"][0] == "127.0.0.1"
+        assert isinstance(metadata["timestamp"], float)
+        assert metadata["size"] == len(payload)
+        assert metadata["truncated"] is False
+        assert self.stats.counters["capture.sampled"] == 1
+        assert self.stats.counters["capture.records"] == 1
+        assert self.stats.counters["capture.bytes"] == len(payload)
+
+    def test_capture_dropped(self):
+        self.capture.write.return_value = False
+        with SMTP(self.host, self.port) as client:
+            client.mail("sender@example.com")
+            client.rcpt("rcpt@example.com")
+            assert client.data(b"Subject: test\r\n\r\ntest")[0] == 250
+        assert self.stats.counters["capture.dropped"] == 1
+        assert "capture.records" not in self.stats.counters
+        assert "capture.bytes" not in self.stats.counters
+
+    def test_capture_new_transaction(self):
+        with SMTP(self.host, self.port) as client:
+            client.mail("one@example.com")
+            client.rcpt("one@example.com")
+            client.data(b"one")
+            client.rset()
+            client.rcpt("lost@example.com")
+            client.rset()
+            client.mail("two@example.com")
+            client.rcpt("two@example.com")
+            client.data(b"two")
+        first, second = self.capture.write.call_args_list
+        assert first[0][0]["rcpt_to"] == ["one@example.com"]
+        assert second[0][0]["mail_from"] == "two@example.com"
+        assert second[0][0]["rcpt_to"] == ["two@example.com"]
+
+    def test_capture_message_id_per_message(self):
+        queued = []
+        with SMTP(self.host, self.port) as client:
+            for _ in range(2):
+                client.mail("sender@example.com")
+                client.rcpt("rcpt@example.com")
+                code, resp = client.data(b"Subject: test\r\n\r\ntest")
+                queued.append(resp.decode("utf-8").split(" ")[-1])
+        first, second = self.capture.write.call_args_list
+        assert [first[0][0]["message_id"], second[0][0]["message_id"]] == (
+            queued
+        )
+        assert queued[0] != queued[1]
+
+    def test_capture_too_large(self):
+        with SMTP(self.host, self.port) as client:
+            code, resp = client.data(b"x" * 2048)
+            assert code == 552
+        assert self.capture.write.called is False
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestBdat(unittest.TestCase):
+    def setUp(self):
+        cfile = create_config(("timeout=5", "max_message_size=1024"))
+        Config(cfile).load()
+        self.stats = Stats()
+        self.capture = mock.MagicMock()
+        controller = Controller(stats=self.stats, capture=self.capture)
+        controller.start()
+        self.host, self.port = controller.sock.getsockname()
+        self.addCleanup(controller.stop)
+
+    def bdat(self, client, data, last=False):
+        command = "BDAT {0}{1}\r\n".format(len(data), " LAST" if last else "")
+        client.send(command.encode("utf-8") + data)
+        return client.getreply()
+
+    def test_bdat(self):
+        message = b"Subject: test\r\n\r\n.\r\n\x00binary\r\n"
+        with SMTP(self.host, self.port) as client:
+            client.docmd("MAIL FROM:<sender@example.com> BODY=BINARYMIME")
+            client.rcpt("rcpt@example.com")
+            code, resp = self.bdat(client, message[:10])
+            assert code == 250
+            assert resp == b"2.0.0 10 octets received"
+            code, resp = self.bdat(client, message[10:], last=True)
+            assert code == 250
+            assert resp.startswith(b"2.0.0 OK: queued as")
+            assert client.noop()[0] == 250
+        metadata, payload = self.capture.write.call_args[0]
+        assert payload == message
+        assert metadata["mail_from"] == "sender@example.com"
+        assert self.stats.counters["capture.bytes"] == len(message)
+
+    def test_bdat_empty_last(self):
+        with SMTP(self.host, self.port) as client:
+            client.mail("sender@example.com")
+            assert self.bdat(client, b"test")[0] == 250
+            assert self.bdat(client, b"", last=True)[0] == 250
+        assert self.capture.write.call_args[0][1] == b"test"
+
+    def test_bdat_too_large(self):
+        with SMTP(self.host, self.port) as client:
+            client.mail("sender@example.com")
+            assert self.bdat(client, b"x" * 1000)[0] == 250
+            code, resp = self.bdat(client, b"x" * 100)
+            assert code == 552
+            assert resp == b"Message size exceeds fixed maximum message size"
+            assert self.bdat(client, b"x", last=True)[0] == 552
+            client.mail("sender@example.com")
+            assert self.bdat(client, b"x" * 10, last=True)[0] == 250
+        assert self.capture.write.call_count == 1
+        assert self.capture.write.call_args[0][1] == b"x" * 10
+
+    def test_bdat_not_sampled(self):
+        with SMTP(self.host, self.port) as client:
+            assert self.bdat(client, b"x" * 10, last=True)[0] == 250
+        assert self.capture.write.called is False
+
+    def test_bdat_syntax(self):
+        with SMTP(self.host, self.port) as client:
+            for command in ("BDAT", "BDAT x", "BDAT 1 NOW", "BDAT 1 LAST x"):
+                code, resp = client.docmd(command)
+                assert code == 501
+                assert resp == b"5.5.4 Syntax: BDAT <size> [LAST]"
+
+    def test_bdat_non_ascii_size(self):
+        with SMTP(self.host, self.port) as client:
+            for size in ("\u00b2", "\u0661\u0662"):
+                client.send("BDAT {0}\r\n".format(size).encode("utf-8"))
+                assert client.getreply() == (
+                    501,
+                    b"5.5.4 Syntax: BDAT <size> [LAST]",
+                )
+            assert client.noop()[0] == 250
+
+    def test_data_refused(self):
+        with SMTP(self.host, self.port) as client:
+            client.docmd("MAIL FROM:<sender@example.com> BODY=BINARYMIME")
+            assert client.docmd("DATA") == (
+                503,
+                b"5.5.1 Bad sequence of commands",
+            )
+            client.mail("sender@example.com")
+            self.bdat(client, b"test")
+            assert client.docmd("DATA")[0] == 503
+            client.rset()
+            assert client.docmd("DATA")[0] == 354
+            client.send(b".\r\n")
+            assert client.getreply()[0] == 250
+
+    def test_bdat_dynamic_switch(self):
+        with SMTP(self.host, self.port) as client:
+            client.mail("sender@example.com")
+            self.bdat(client, b"Subject: test\r\nX-Blackhole-Mo")
+            self.bdat(client, b"de: bou")
+            code, __ = self.bdat(client, b"nce\r\n\r\nbody", last=True)
+            assert code in [450, 451, 452, 458, 521, 550, 551, 552, 553, 571]
+
+    def test_help_bdat(self):
+        with SMTP(self.host, self.port) as client:
+            assert client.help("BDAT") == b"Syntax: BDAT <size> [LAST]"
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestCapturePolicy(unittest.TestCase):
+    def start(self, policy):
+        Config(create_config(("timeout=5",))).load()
+        self.stats = Stats()
+        self.capture = mock.MagicMock()
+        controller = Controller(
+            stats=self.stats, capture=self.capture, capture_policy=policy
+        )
+        controller.start()
+        self.addCleanup(controller.stop)
+        return controller.sock.getsockname()
+
+    def test_headers_and_max_bytes(self):
+        host, port = self.start(CapturePolicy("headers", 1.0, 20))
+        with SMTP(host, port) as client:
+            client.mail("one@example.com")
+            client.rcpt("one@example.com")
+            client.data(b"Subject: test\r\n\r\nbody")
+            client.mail("two@example.com")
+            client.rcpt("two@example.com")
+            client.data(b"Subject: a much longer subject\r\n\r\nbody")
+        first, second = self.capture.write.call_args_list
+        assert first[0][1] == b"Subject: test\r\n\r\n"
+        assert first[0][0]["truncated"] is True
+        assert first[0][0]["size"] == 23
+        assert second[0][1] == b"Subject: a much long"
+        assert self.stats.counters["capture.truncated"] == 2
+        assert self.stats.counters["capture.bytes"] == 37
+
+    def test_not_sampled(self):
+        host, port = self.start(CapturePolicy("full", 0.0))
+        with SMTP(host, port) as client:
+            for __ in range(3):
+                client.mail("one@example.com")
+                client.rcpt("one@example.com")
+                client.data(b"test")
+        assert self.capture.write.called is False
+        assert self.stats.counters["capture.skipped"] == 3
+        assert "capture.sampled" not in self.stats.counters
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+class TestLmtp(unittest.TestCase):
+    def start(self, flags="", *options):
+        sock = _socket("127.0.0.1", 0, socket.AF_INET)
+        port = sock.getsockname()[1]
+        cfile = create_config(
+            ("listen=:{0} proto=lmtp {1}".format(port, flags),) + options
+        )
+        Config(cfile).load()
+        self.capture = mock.MagicMock()
+        controller = Controller(sock, capture=self.capture)
+        controller.start()
+        self.addCleanup(controller.stop)
+        client = SMTP("127.0.0.1", port)
+        self.addCleanup(client.close)
+        return client
+
+    def transaction(self, client, *rcpts):
+        client.docmd("LHLO", "example.com")
+        client.docmd("MAIL FROM:<sender@example.com>")
+        for rcpt in rcpts:
+            assert client.docmd("RCPT TO:<{0}>".format(rcpt))[0] == 250
+
+    def test_greeting(self):
+        client = self.start()
+        code, resp = client.docmd("LHLO", "example.com")
+        assert code == 250
+        assert b"CHUNKING" in resp
+        assert client.docmd("HELO", "example.com")[0] == 502
+        assert client.docmd("EHLO", "example.com")[0] == 502
+
+    def test_response_per_recipient(self):
+        client = self.start()
+        self.transaction(client, "one@example.com", "two@example.com")
+        assert client.docmd("DATA")[0] == 354
+        client.send(b"Subject: test\r\n\r\ntest\r\n.\r\n")
+        assert client.getreply()[0] == 250
+        assert client.getreply()[0] == 250
+        assert client.noop()[0] == 250
+        metadata = self.capture.write.call_args[0][0]
+        assert metadata["rcpt_to"] == ["one@example.com", "two@example.com"]
+        assert metadata["rcpt_codes"] == [250, 250]
+
+    def test_response_per_recipient_from_mode(self):
+        client = self.start("mode=random")
+        self.transaction(client, "one@example.com", "two@example.com")
+        client.docmd("DATA")
+        with mock.patch(
+            "blackhole.smtp.random.choice", side_effect=[250, 550]
+        ):
+            client.send(b"test\r\n.\r\n")
+            assert client.getreply()[0] == 250
+            assert client.getreply()[0] == 550
+        assert self.capture.write.call_args[0][0]["rcpt_codes"] == [250, 550]
+
+    def test_bdat_response_per_recipient(self):
+        client = self.start("mode=bounce")
+        self.transaction(client, "one@example.com", "two@example.com")
+        client.send(b"BDAT 4 LAST\r\ntest")
+        assert client.getreply()[0] in Smtp._bounce_responses
+        assert client.getreply()[0] in Smtp._bounce_responses
+        assert client.noop()[0] == 250
+
+    def test_too_large(self):
+        client = self.start("", "max_message_size=8")
+        self.transaction(client, "one@example.com", "two@example.com")
+        client.docmd("DATA")
+        client.send(b"a much longer message\r\n.\r\n")
+        assert client.getreply()[0] == 552
+        assert client.getreply()[0] == 552
+        assert client.noop()[0] == 250
+
+    def test_no_recipients(self):
+        client = self.start()
+        self.transaction(client)
+        assert client.docmd("DATA")[0] == 503
+        client.send(b"BDAT 4 LAST\r\ntest")
+        assert client.getreply()[0] == 503
+        assert client.noop()[0] == 250
+        assert self.capture.write.called is False
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_lhlo_on_smtp_listener():
+    cfile = create_config(("listen=:25",))
+    Config(cfile).load()
+    controller = Controller()
+    controller.start()
+    host, port = controller.sock.getsockname()
+    try:
+        with SMTP(host, port) as client:
+            assert client.docmd("LHLO", "example.com")[0] == 502
+            assert client.ehlo()[0] == 250
+    finally:
+        controller.stop()
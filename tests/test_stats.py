@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import random
+
+from unittest import mock
+
+import pytest
+
+from blackhole.smtp import Smtp
+from blackhole.stats import Histogram, Stats
+
+
+from ._utils import (  # noqa: F401; isort:skip
+    Args,
+    cleandir,
+    create_config,
+    create_file,
+    reset,
+)
+
+
+def test_histogram_indexes_are_contiguous():
+    histogram = Histogram()
+    previous = 0
+    for value in range(1, 1 << 16):
+        index = histogram._index(value)
+        assert index in (previous, previous + 1)
+        assert histogram._highest_equivalent(index) >= value
+        previous = index
+
+
+def test_histogram_fixed_size():
+    histogram = Histogram()
+    size = len(histogram.counts)
+    for value in (0, 1, 1000, 10**9, 10**15, -5):
+        histogram.record(value)
+    assert len(histogram.counts) == size == 1024
+    assert histogram.count == 6
+    assert histogram.max == (1 << 36) - 1
+
+
+def test_histogram_empty():
+    histogram = Histogram()
+    assert histogram.summary() == {
+        "count": 0,
+        "p50": 0,
+        "p99": 0,
+        "p999": 0,
+        "max": 0,
+    }
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    values = [random.randint(1, 1000000) for _ in range(10000)]
+    for value in values:
+        histogram.record(value)
+    values.sort()
+    for percentile in (50, 99, 99.9):
+        exact = values[int(len(values) * percentile / 100) - 1]
+        assert abs(histogram.percentile(percentile) - exact) <= exact * 0.04
+    assert histogram.percentile(100) == max(values)
+
+
+def test_histogram_exact_small_values():
+    histogram = Histogram()
+    for value in range(1, 11):
+        histogram.record(value)
+    assert histogram.percentile(50) == 5
+    assert histogram.percentile(100) == 10
+
+
+def test_histogram_merge():
+    first, second = Histogram(), Histogram()
+    for value in range(100):
+        first.record(value)
+        second.record(value + 100)
+    first.merge(second)
+    assert first.count == 200
+    assert first.max == 199
+    assert first.percentile(50) == 99
+
+
+def test_histogram_to_and_from_dict():
+    histogram = Histogram()
+    for value in (5, 5, 500, 50000):
+        histogram.record(value)
+    data = histogram.to_dict()
+    assert len(data["counts"]) == 3
+    copy = Histogram.from_dict(data)
+    assert copy.count == 4
+    assert copy.max == 50000
+    assert copy.counts == histogram.counts
+
+
+def test_stats_record_and_incr():
+    stats = Stats()
+    stats.record("do_MAIL", 0.001)
+    stats.record("do_MAIL", 0.002)
+    stats.incr("connections")
+    stats.incr("connections", 2)
+    summary = stats.summary()
+    assert summary["counters"] == {"connections": 3}
+    assert summary["histograms"]["do_MAIL"]["count"] == 2
+    assert summary["histograms"]["do_MAIL"]["max"] == 2000
+
+
+def test_stats_dumps_loads_merge():
+    first, second = Stats(), Stats()
+    first.record("do_DATA", 0.5)
+    first.incr("connections")
+    second.record("do_DATA", 1.5)
+    second.record("do_RCPT", 0.1)
+    second.incr("connections")
+    merged = Stats()
+    merged.merge(Stats.loads(first.dumps()))
+    merged.merge(Stats.loads(second.dumps()))
+    summary = merged.summary()
+    assert summary["counters"] == {"connections": 2}
+    assert summary["histograms"]["do_DATA"]["count"] == 2
+    assert summary["histograms"]["do_RCPT"]["count"] == 1
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+@pytest.mark.asyncio
+async def test_smtp_records_handler_latency(event_loop):
+    stats = Stats()
+    smtp = Smtp([], loop=event_loop, stats=stats)
+    smtp.connection_closed = False
+    lines = [b"HELO blackhole.io\r\n", b"NOOP\r\n", b"NOOP\r\n", None]
+
+    async def wait():
+        return lines.pop(0)
+
+    async def noop(*args):
+        pass
+
+    with mock.patch.object(smtp, "wait", wait), mock.patch.object(
+        smtp, "push", noop
+    ), mock.patch.object(smtp, "close", noop):
+        await smtp._handle_client()
+    histograms = stats.summary()["histograms"]
+    assert histograms["do_HELO"]["count"] == 1
+    assert histograms["do_NOOP"]["count"] == 2
@@ -24,6 +24,8 @@
 
 
 import asyncio
+import os
+import signal
 import unittest
 
 from unittest import mock
@@ -278,6 +280,10 @@ def test_spawn_ipv6_tls_dhparams():
         supervisor = Supervisor(loop=loop)
     assert len(supervisor.socks) == 2
     assert supervisor.socks[1]["ssl"] is not None
+    assert supervisor.socks[0]["ssl"] is None
+    assert supervisor.socks[0]["starttls"] is not None
+    assert supervisor.socks[1]["starttls"] is None
+    assert len(supervisor.tls_contexts()) == 2
     supervisor.close_socks()
     loop.run_until_complete(loop.shutdown_asyncgens())
     loop.close()
@@ -310,6 +316,22 @@ def test_spawn_ipv4_and_ipv6():
     loop.close()
 
 
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_spawn_port_range_shares_contexts():
+    cfile = create_config(("listen=:9000-9002",))
+    Config(cfile).load()
+    loop = asyncio.new_event_loop()
+    with mock.patch("socket.socket.bind"), mock.patch(
+        "blackhole.supervisor.contexts", return_value=(None, None)
+    ) as mock_contexts:
+        supervisor = Supervisor(loop=loop)
+    assert mock_contexts.call_count == 1
+    assert len(supervisor.socks) == 3
+    supervisor.close_socks()
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
 @pytest.mark.usefixtures("reset", "cleandir")
 def test_spawn_ipv4_fail():
     cfile = create_config(("listen=:9999",))
@@ -426,3 +448,395 @@ def test_stop_runtime_error():
     assert exc.value.code == 0
     loop.run_until_complete(loop.shutdown_asyncgens())
     loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_report_stats():
+    cfile = create_config(("listen=:9999, :::9999", "workers=2"))
+    Config(cfile).load()
+    loop = asyncio.new_event_loop()
+    with mock.patch("socket.socket.bind"), mock.patch(
+        "blackhole.worker.Worker.start"
+    ):
+        supervisor = Supervisor(loop=loop)
+        supervisor.start_workers()
+    for worker in supervisor.workers:
+        worker.stats.record("do_MAIL", 0.001)
+        worker.stats.incr("connections")
+    with mock.patch("blackhole.supervisor.logger.info") as mock_info:
+        supervisor.report_stats()
+    calls = [c[0] for c in mock_info.call_args_list]
+    assert ("stats: %s %s", "connections", 2) in calls
+    assert calls[1][1:3] == ("do_MAIL", 2)
+    supervisor.close_socks()
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_profile_workers():
+    cfile = create_config(("listen=:9999, :::9999", "workers=2"))
+    Config(cfile).load()
+    loop = asyncio.new_event_loop()
+    with mock.patch("socket.socket.bind"), mock.patch(
+        "blackhole.worker.Worker.start"
+    ):
+        supervisor = Supervisor(loop=loop)
+        supervisor.start_workers()
+    supervisor.workers[0].pid = 100
+    supervisor.workers[1].pid = 101
+    with mock.patch(
+        "os.kill", side_effect=[None, ProcessLookupError]
+    ) as mock_kill:
+        supervisor.profile_workers()
+    assert mock_kill.call_args_list == [
+        mock.call(100, signal.SIGUSR2),
+        mock.call(101, signal.SIGUSR2),
+    ]
+    supervisor.close_socks()
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_start_workers_cpu_affinity():
+    cfile = create_config(
+        ("listen=:9999, :::9999", "workers=2", "cpu_affinity=true")
+    )
+    Config(cfile).load()
+    loop = asyncio.new_event_loop()
+    with mock.patch("socket.socket.bind"), mock.patch(
+        "blackhole.worker.Worker.start"
+    ), mock.patch(
+        "blackhole.config.available_cpus", return_value=[0, 1, 2]
+    ), mock.patch(
+        "blackhole.supervisor.available_cpus", return_value=[0, 1, 2]
+    ), mock.patch(
+        "os.sched_setaffinity", create=True
+    ) as mock_affinity:
+        supervisor = Supervisor(loop=loop)
+        supervisor.start_workers()
+    mock_affinity.assert_called_once_with(0, {0})
+    assert [worker.cpu for worker in supervisor.workers] == [1, 2]
+    assert [worker.cpus for worker in supervisor.workers] == [[0, 1, 2]] * 2
+    supervisor.close_socks()
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_start_workers_reuse_port():
+    cfile = create_config(
+        ("listen=127.0.0.1:0, 127.0.0.1:0", "workers=2", "reuse_port=true")
+    )
+    Config(cfile).load()
+    loop = asyncio.new_event_loop()
+    with mock.patch("blackhole.worker.Worker.start"):
+        supervisor = Supervisor(loop=loop)
+        supervisor.start_workers()
+    assert len(supervisor.socks) == 4
+    first, second = supervisor.workers
+    assert len(first.socks) == 2
+    assert len(second.socks) == 2
+    assert not set(id(s) for s in first.socks) & set(
+        id(s) for s in second.socks
+    )
+    supervisor.close_socks()
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_start_workers_unix_reuse_port():
+    path = os.path.join(os.getcwd(), "smtp.sock")
+    cfile = create_config(
+        ("listen=unix:{0}".format(path), "workers=2", "reuse_port=true")
+    )
+    Config(cfile).load()
+    loop = asyncio.new_event_loop()
+    with mock.patch("blackhole.worker.Worker.start"):
+        supervisor = Supervisor(loop=loop)
+        supervisor.start_workers()
+    assert len(supervisor.socks) == 1
+    first, second = supervisor.workers
+    assert first.socks == second.socks
+    assert os.path.exists(path)
+    supervisor.close_socks()
+    assert not os.path.exists(path)
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+CERTS = os.path.join(os.path.dirname(__file__), "certs")
+
+
+def _pooled_config(*options):
+    return create_config(
+        (
+            "listen=127.0.0.1:0",
+            "tls_listen=127.0.0.1:0, 127.0.0.1:0",
+            "tls_cert={0}".format(os.path.join(CERTS, "blackhole.crt")),
+            "tls_key={0}".format(os.path.join(CERTS, "blackhole.key")),
+            "workers=1",
+            "tls_workers=2",
+        )
+        + options
+    )
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_start_workers_tls_pool():
+    conf = Config(_pooled_config()).load()
+    conf.args = Args((("less_secure", False),))
+    loop = asyncio.new_event_loop()
+    with mock.patch("blackhole.worker.Worker.start"):
+        supervisor = Supervisor(loop=loop)
+        supervisor.start_workers()
+    assert supervisor.pools == {
+        "listen": range(0, 1),
+        "tls_listen": range(1, 3),
+    }
+    assert len(supervisor.socks) == 3
+    plain, first, second = supervisor.workers
+    assert [w.idx for w in supervisor.workers] == ["1", "2", "3"]
+    assert len(plain.socks) == 1
+    assert plain.socks[0]["ssl"] is None
+    assert plain.socks[0]["starttls"] is not None
+    assert len(first.socks) == 2
+    assert all(s["ssl"] is not None for s in first.socks)
+    assert [id(s) for s in first.socks] == [id(s) for s in second.socks]
+    supervisor.close_socks()
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_start_workers_tls_pool_reuse_port():
+    conf = Config(_pooled_config("reuse_port=true")).load()
+    conf.args = Args((("less_secure", False),))
+    loop = asyncio.new_event_loop()
+    with mock.patch("blackhole.worker.Worker.start"):
+        supervisor = Supervisor(loop=loop)
+        supervisor.start_workers()
+    assert len(supervisor.socks) == 5
+    plain, first, second = supervisor.workers
+    assert len(plain.socks) == 1
+    assert len(first.socks) == 2
+    assert len(second.socks) == 2
+    assert not set(id(s) for s in first.socks) & set(
+        id(s) for s in second.socks
+    )
+    supervisor.close_socks()
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_tls_workers_without_tls():
+    cfile = create_config(("listen=127.0.0.1:0", "tls_workers=2"))
+    Config(cfile).load()
+    loop = asyncio.new_event_loop()
+    with mock.patch("blackhole.worker.Worker.start"):
+        supervisor = Supervisor(loop=loop)
+        supervisor.start_workers()
+    assert supervisor.pools == {}
+    assert supervisor.worker_socks is None
+    assert len(supervisor.workers) == 3
+    supervisor.close_socks()
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_report_stats_pools():
+    conf = Config(_pooled_config()).load()
+    conf.args = Args((("less_secure", False),))
+    loop = asyncio.new_event_loop()
+    with mock.patch("blackhole.worker.Worker.start"):
+        supervisor = Supervisor(loop=loop)
+        supervisor.start_workers()
+    plain, first, second = supervisor.workers
+    plain.stats.incr("connections")
+    first.stats.incr("connections", 2)
+    second.stats.incr("connections", 3)
+    with mock.patch("blackhole.supervisor.logger.info") as mock_info:
+        supervisor.report_stats()
+    calls = [c[0] for c in mock_info.call_args_list]
+    assert ("stats: %s %s", "connections", 6) in calls
+    assert ("stats: %s %s", "pool.listen.connections", 1) in calls
+    assert ("stats: %s %s", "pool.tls_listen.connections", 5) in calls
+    supervisor.close_socks()
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_rotate_ticket_keys():
+    cfile = create_config(("listen=:9999", "workers=2"))
+    Config(cfile).load()
+    loop = asyncio.new_event_loop()
+    with mock.patch("socket.socket.bind"), mock.patch(
+        "blackhole.worker.Worker.start"
+    ):
+        supervisor = Supervisor(loop=loop)
+        supervisor.start_workers()
+    ctx = mock.MagicMock()
+    supervisor.socks.append({"sock": mock.MagicMock(), "ssl": ctx})
+    assert supervisor.tls_contexts() == [ctx]
+    for worker in supervisor.workers:
+        worker.send_ticket_keys = mock.MagicMock()
+    with mock.patch(
+        "blackhole.supervisor.set_ticket_keys", return_value=True
+    ) as mock_set, mock.patch.object(loop, "call_later") as mock_later:
+        supervisor.rotate_ticket_keys()
+    keys = mock_set.call_args[0][1]
+    for worker in supervisor.workers:
+        worker.send_ticket_keys.assert_called_once_with(keys)
+    mock_later.assert_called_once_with(3600, supervisor.rotate_ticket_keys)
+    supervisor.socks.pop()
+    supervisor.close_socks()
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_rotate_ticket_keys_unsupported():
+    cfile = create_config(("listen=:9999", "workers=1"))
+    Config(cfile).load()
+    loop = asyncio.new_event_loop()
+    with mock.patch("socket.socket.bind"), mock.patch(
+        "blackhole.worker.Worker.start"
+    ):
+        supervisor = Supervisor(loop=loop)
+        supervisor.start_workers()
+    supervisor.socks.append({"sock": mock.MagicMock(), "ssl": object()})
+    supervisor.workers[0].send_ticket_keys = mock.MagicMock()
+    with mock.patch.object(loop, "call_later") as mock_later, mock.patch(
+        "blackhole.supervisor.logger.warning"
+    ) as mock_warning:
+        supervisor.rotate_ticket_keys()
+    assert mock_warning.called is True
+    assert supervisor.workers[0].send_ticket_keys.called is False
+    assert mock_later.called is False
+    supervisor.socks.pop()
+    supervisor.close_socks()
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_report_stats_tls_resumption_rate():
+    cfile = create_config(("listen=:9999", "workers=1"))
+    Config(cfile).load()
+    loop = asyncio.new_event_loop()
+    with mock.patch("socket.socket.bind"), mock.patch(
+        "blackhole.worker.Worker.start"
+    ):
+        supervisor = Supervisor(loop=loop)
+        supervisor.start_workers()
+    supervisor.workers[0].stats.incr("tls.handshakes", 4)
+    supervisor.workers[0].stats.incr("tls.resumed", 3)
+    with mock.patch("blackhole.supervisor.logger.info") as mock_info:
+        supervisor.report_stats()
+    calls = [c[0] for c in mock_info.call_args_list]
+    assert ("stats: %s %.2f", "tls.resumption_rate", 0.75) in calls
+    supervisor.close_socks()
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+
+
+def _tls_supervisor(loop, *options):
+    cfile = create_config(("listen=:9999", "workers=2") + options)
+    Config(cfile).load()
+    with mock.patch("socket.socket.bind"), mock.patch(
+        "blackhole.worker.Worker.start"
+    ):
+        supervisor = Supervisor(loop=loop)
+        supervisor.start_workers()
+    for worker in supervisor.workers:
+        worker.send_tls_reload = mock.MagicMock()
+    return supervisor
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_tls_file_mtimes():
+    cert = create_file("cert.pem")
+    loop = asyncio.new_event_loop()
+    supervisor = _tls_supervisor(loop)
+    supervisor.config.tls_cert = cert
+    supervisor.config.tls_key = "/fake/key.pem"
+    mtimes = supervisor.tls_file_mtimes()
+    assert mtimes == (os.stat(cert).st_mtime_ns, None, None)
+    supervisor.close_socks()
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_check_tls_files():
+    loop = asyncio.new_event_loop()
+    supervisor = _tls_supervisor(loop)
+    supervisor.tls_mtimes = (1, 2, None)
+    with mock.patch.object(
+        supervisor, "tls_file_mtimes", return_value=(1, 2, None)
+    ), mock.patch.object(supervisor, "reload_tls") as mock_reload:
+        with mock.patch.object(loop, "call_later") as mock_later:
+            supervisor.check_tls_files()
+    assert mock_reload.called is False
+    mock_later.assert_called_once_with(60, supervisor.check_tls_files)
+    with mock.patch.object(
+        supervisor, "tls_file_mtimes", return_value=(3, 2, None)
+    ), mock.patch.object(supervisor, "reload_tls") as mock_reload:
+        with mock.patch.object(loop, "call_later"):
+            supervisor.check_tls_files()
+    assert mock_reload.called is True
+    assert supervisor.tls_mtimes == (3, 2, None)
+    supervisor.close_socks()
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_request_tls_reload():
+    loop = asyncio.new_event_loop()
+    supervisor = _tls_supervisor(loop)
+    with mock.patch.object(loop, "call_soon_threadsafe") as mock_soon:
+        supervisor.request_tls_reload()
+    mock_soon.assert_called_once_with(supervisor.reload_tls)
+    supervisor.close_socks()
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_reload_tls():
+    loop = asyncio.new_event_loop()
+    supervisor = _tls_supervisor(loop)
+    supervisor.config.tls_cert = "/a.crt"
+    supervisor.config.tls_key = "/a.key"
+    supervisor.config.tls_dhparams = "/a.pem"
+    assert supervisor.reload_tls() is False
+    ctx = mock.MagicMock()
+    supervisor.socks.append({"sock": mock.MagicMock(), "ssl": ctx})
+    with mock.patch("blackhole.supervisor.load_certificates") as mock_load:
+        assert supervisor.reload_tls() is True
+    mock_load.assert_called_once_with(ctx, "/a.crt", "/a.key", "/a.pem")
+    for worker in supervisor.workers:
+        assert worker.send_tls_reload.called is True
+    supervisor.socks.pop()
+    supervisor.close_socks()
+    loop.close()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_reload_tls_invalid():
+    loop = asyncio.new_event_loop()
+    supervisor = _tls_supervisor(loop)
+    supervisor.socks.append({"sock": mock.MagicMock(), "ssl": object()})
+    with mock.patch(
+        "blackhole.supervisor.load_certificates", side_effect=OSError
+    ), mock.patch("blackhole.supervisor.logger.error") as mock_error:
+        assert supervisor.reload_tls() is False
+    assert mock_error.called is True
+    for worker in supervisor.workers:
+        assert worker.send_tls_reload.called is False
+    supervisor.socks.pop()
+    supervisor.close_socks()
+    loop.close()
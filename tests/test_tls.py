@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+# (The MIT License)
+#
+# Copyright (c) 2013-2020 Kura
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the 'Software'), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED 'AS IS', WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import ssl
+
+from unittest import mock
+
+import pytest
+
+from blackhole import tls
+from blackhole.tls import (
+    TICKET_KEY_LENGTH,
+    generate_ticket_keys,
+    get_ticket_keys,
+    load_certificates,
+    set_ticket_keys,
+)
+
+
+from ._utils import (  # noqa: F401; isort:skip
+    Args,
+    cleandir,
+    create_config,
+    create_file,
+    reset,
+)
+
+
+CERTS = os.path.join(os.path.dirname(__file__), "certs")
+CERT = os.path.join(CERTS, "blackhole.crt")
+KEY = os.path.join(CERTS, "blackhole.key")
+ROTATED_CERT = os.path.join(CERTS, "rotated.crt")
+ROTATED_KEY = os.path.join(CERTS, "rotated.key")
+
+
+def _server_context():
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(CERT, KEY)
+    return ctx
+
+
+def _handshake(server_ctx, client_ctx, session=None):
+    """Complete a handshake in memory and return both SSL objects."""
+    s_in, s_out = ssl.MemoryBIO(), ssl.MemoryBIO()
+    c_in, c_out = ssl.MemoryBIO(), ssl.MemoryBIO()
+    server = server_ctx.wrap_bio(s_in, s_out, server_side=True)
+    client = client_ctx.wrap_bio(c_in, c_out, session=session)
+    done = {server: False, client: False}
+    for _ in range(10):
+        for obj in (client, server):
+            if done[obj]:
+                continue
+            try:
+                obj.do_handshake()
+                done[obj] = True
+            except ssl.SSLWantReadError:
+                pass
+        s_in.write(c_out.read())
+        c_in.write(s_out.read())
+        if all(done.values()):
+            break
+    return server, client
+
+
+def _client_context():
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    ctx.options |= getattr(ssl, "OP_NO_TLSv1_3", 0)
+    return ctx
+
+
+def test_generate_ticket_keys():
+    keys = generate_ticket_keys()
+    assert len(keys) == TICKET_KEY_LENGTH
+    assert keys != generate_ticket_keys()
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_set_and_get_ticket_keys():
+    ctx = _server_context()
+    keys = generate_ticket_keys()
+    assert set_ticket_keys(ctx, keys) is True
+    assert get_ticket_keys(ctx) == keys
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_set_ticket_keys_invalid():
+    ctx = _server_context()
+    assert set_ticket_keys(ctx, b"short") is False
+    assert set_ticket_keys(mock.MagicMock(), generate_ticket_keys()) is False
+    assert get_ticket_keys(mock.MagicMock()) is None
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_ctrl_unavailable():
+    ctx = _server_context()
+    with mock.patch("blackhole.tls._ctrl", return_value=None):
+        assert set_ticket_keys(ctx, generate_ticket_keys()) is False
+        assert get_ticket_keys(ctx) is None
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_ctrl_lookup_fails():
+    with mock.patch.object(tls, "_ssl_ctx_ctrl", None), mock.patch(
+        "ctypes.CDLL", side_effect=OSError
+    ):
+        assert tls._ctrl() is None
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_resumption_across_contexts():
+    keys = generate_ticket_keys()
+    first, second = _server_context(), _server_context()
+    set_ticket_keys(first, keys)
+    set_ticket_keys(second, keys)
+    client_ctx = _client_context()
+    _, client = _handshake(first, client_ctx)
+    session = client.session
+    server, client = _handshake(second, client_ctx, session=session)
+    assert client.session_reused is True
+    assert server.session_reused is True
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_no_resumption_with_different_keys():
+    first, second = _server_context(), _server_context()
+    set_ticket_keys(first, generate_ticket_keys())
+    set_ticket_keys(second, generate_ticket_keys())
+    client_ctx = _client_context()
+    _, client = _handshake(first, client_ctx)
+    server, client = _handshake(second, client_ctx, session=client.session)
+    assert server.session_reused is False
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_rotation_discards_previous_keys():
+    ctx = _server_context()
+    set_ticket_keys(ctx, generate_ticket_keys())
+    client_ctx = _client_context()
+    _, client = _handshake(ctx, client_ctx)
+    session = client.session
+    set_ticket_keys(ctx, generate_ticket_keys())
+    server, client = _handshake(ctx, client_ctx, session=session)
+    assert server.session_reused is False
+    assert client.version() is not None
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_ctrl_only_on_cpython():
+    with mock.patch.object(tls, "_ssl_ctx_ctrl", None), mock.patch(
+        "platform.python_implementation", return_value="PyPy"
+    ), mock.patch("ctypes.CDLL") as mock_cdll:
+        assert tls._ctrl() is None
+        keys = generate_ticket_keys()
+        assert set_ticket_keys(_server_context(), keys) is False
+    assert mock_cdll.called is False
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_load_certificates():
+    ctx = _server_context()
+    client_ctx = _client_context()
+    _, established = _handshake(ctx, client_ctx)
+    old = established.getpeercert(binary_form=True)
+    load_certificates(ctx, ROTATED_CERT, ROTATED_KEY)
+    _, client = _handshake(ctx, client_ctx)
+    assert client.getpeercert(binary_form=True) != old
+    assert established.getpeercert(binary_form=True) == old
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_load_certificates_mismatched_key():
+    ctx = _server_context()
+    client_ctx = _client_context()
+    _, client = _handshake(ctx, client_ctx)
+    old = client.getpeercert(binary_form=True)
+    with pytest.raises(ssl.SSLError):
+        load_certificates(ctx, ROTATED_CERT, KEY)
+    _, client = _handshake(ctx, client_ctx)
+    assert client.getpeercert(binary_form=True) == old
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_load_certificates_missing_file():
+    ctx = mock.MagicMock()
+    with pytest.raises(OSError):
+        load_certificates(ctx, "/fake/cert.pem", "/fake/key.pem")
+    assert ctx.load_cert_chain.called is False
@@ -23,12 +23,22 @@
 # SOFTWARE.
 
 
+import os
+
 from io import StringIO
 from unittest import mock
 
 import pytest
 
-from blackhole.utils import get_version, mailname, message_id
+from blackhole.utils import (
+    available_cpus,
+    cgroup_cpu_limit,
+    get_version,
+    mailname,
+    message_id,
+    usable_cpus,
+    use_uvloop,
+)
 
 
 from ._utils import (  # noqa: F401; isort:skip
@@ -162,3 +172,107 @@ def test_get_version_version_not_found():
     ) as err:
         get_version()
     assert str(err.value) == "No __version__ assignment found"
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_available_cpus():
+    with mock.patch(
+        "os.sched_getaffinity", return_value={3, 1, 2}, create=True
+    ):
+        assert available_cpus() == [1, 2, 3]
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_available_cpus_no_affinity():
+    with mock.patch("blackhole.utils.os") as mock_os:
+        del mock_os.sched_getaffinity
+        mock_os.cpu_count.return_value = 2
+        assert available_cpus() == [0, 1]
+
+
+def _cgroup_tree(files):
+    for path, data in files.items():
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        create_file(path, data)
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_cgroup_v2_cpu_limit():
+    _cgroup_tree(
+        {
+            "proc": "0::/blackhole.slice\n",
+            "cg/blackhole.slice/cpu.max": "150000 100000\n",
+        }
+    )
+    assert cgroup_cpu_limit("cg", "proc") == 1.5
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_cgroup_v2_no_limit():
+    _cgroup_tree({"proc": "0::/\n", "cg/cpu.max": "max 100000\n"})
+    assert cgroup_cpu_limit("cg", "proc") is None
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_cgroup_v1_cpu_limit():
+    _cgroup_tree(
+        {
+            "proc": "2:cpu,cpuacct:/docker/abc\n1:memory:/docker/abc\n",
+            "cg/cpu,cpuacct/docker/abc/cpu.cfs_quota_us": "400000\n",
+            "cg/cpu,cpuacct/docker/abc/cpu.cfs_period_us": "100000\n",
+        }
+    )
+    assert cgroup_cpu_limit("cg", "proc") == 4
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_cgroup_v1_no_limit():
+    _cgroup_tree(
+        {
+            "proc": "1:cpu:/\n",
+            "cg/cpu/cpu.cfs_quota_us": "-1\n",
+            "cg/cpu/cpu.cfs_period_us": "100000\n",
+        }
+    )
+    assert cgroup_cpu_limit("cg", "proc") is None
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_cgroup_missing():
+    assert cgroup_cpu_limit("cg", "proc") is None
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_usable_cpus():
+    with mock.patch(
+        "blackhole.utils.available_cpus", return_value=list(range(32))
+    ), mock.patch("blackhole.utils.cgroup_cpu_limit", return_value=8.5):
+        assert usable_cpus() == 8
+    with mock.patch(
+        "blackhole.utils.available_cpus", return_value=[0, 1]
+    ), mock.patch("blackhole.utils.cgroup_cpu_limit", return_value=None):
+        assert usable_cpus() == 2
+    with mock.patch(
+        "blackhole.utils.available_cpus", return_value=[0, 1]
+    ), mock.patch("blackhole.utils.cgroup_cpu_limit", return_value=0.5):
+        assert usable_cpus() == 1
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_use_uvloop_not_installed():
+    with mock.patch.dict("sys.modules", {"uvloop": None}), mock.patch(
+        "asyncio.set_event_loop_policy"
+    ) as mock_policy:
+        assert use_uvloop() is False
+    assert mock_policy.called is False
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_use_uvloop():
+    uvloop = mock.MagicMock()
+    with mock.patch.dict("sys.modules", {"uvloop": uvloop}), mock.patch(
+        "asyncio.set_event_loop_policy"
+    ) as mock_policy:
+        assert use_uvloop() is True
+    mock_policy.assert_called_once_with(uvloop.EventLoopPolicy.return_value)
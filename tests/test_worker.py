@@ -132,3 +132,59 @@ def test_child_start_setuid_fails_permissions():
     ) as exc:
         Worker([], [])
     assert exc.value.code == 64
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_setup_child_cpu_affinity():
+    with mock.patch("os.pipe", return_value=("", "")), mock.patch(
+        "os.fork", return_value=False
+    ), mock.patch("blackhole.worker.setgid"), mock.patch(
+        "blackhole.worker.setuid"
+    ), mock.patch(
+        "os.sched_setaffinity", create=True
+    ) as mock_affinity, mock.patch(
+        "blackhole.worker.Child"
+    ) as mock_child:
+        Worker("1", [], loop=mock.MagicMock(), cpu=3, cpus=[0, 3])
+    mock_affinity.assert_called_once_with(0, {3})
+    assert mock_child.call_args[1]["cpus"] == [0, 3]
+    assert mock_child.return_value.start.called is True
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_setup_child_no_cpu_affinity():
+    with mock.patch("os.pipe", return_value=("", "")), mock.patch(
+        "os.fork", return_value=False
+    ), mock.patch("blackhole.worker.setgid"), mock.patch(
+        "blackhole.worker.setuid"
+    ), mock.patch(
+        "os.sched_setaffinity", create=True
+    ) as mock_affinity, mock.patch(
+        "blackhole.worker.Child"
+    ):
+        Worker("1", [], loop=mock.MagicMock())
+    assert mock_affinity.called is False
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_send_ticket_keys():
+    with mock.patch("blackhole.worker.Worker.start"):
+        worker = Worker("1", [], loop=mock.MagicMock())
+    worker.send_ticket_keys(b"keys")
+    worker.wtransport = mock.MagicMock()
+    worker.wtransport.is_closing.return_value = False
+    worker.send_ticket_keys(b"keys")
+    worker.wtransport.write.assert_called_once_with(
+        protocols.TICKET_KEYS + b"\x00\x00\x00\x04keys"
+    )
+
+
+@pytest.mark.usefixtures("reset", "cleandir")
+def test_send_tls_reload():
+    with mock.patch("blackhole.worker.Worker.start"):
+        worker = Worker("1", [], loop=mock.MagicMock())
+    worker.send_tls_reload()
+    worker.wtransport = mock.MagicMock()
+    worker.wtransport.is_closing.return_value = False
+    worker.send_tls_reload()
+    worker.wtransport.write.assert_called_once_with(protocols.TLS_RELOAD)